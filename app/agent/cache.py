@@ -0,0 +1,278 @@
+"""Two-tier persistent key/value cache.
+
+:class:`PersistentCache` keeps JSON-serialisable values in a SQLite table on
+disk with a small in-memory LRU in front of it. Each cache lives in its own
+*namespace* (one table row prefix) of a shared SQLite file, has a default
+TTL, can be size-bounded, and counts hits and misses. Expired rows of the
+namespace are purged on write, at most once a minute, so keys that are
+never read again do not pile up in the file.
+
+Values handed out by the memory tier are shared between callers and must be
+treated as read-only.
+
+Entries remember when they were written, so callers that want
+stale-while-revalidate semantics can read :meth:`PersistentCache.get_entry`
+and decide on freshness themselves.
+
+SQLite calls block, so async code uses the ``a``-prefixed methods: a live
+memory-tier hit is returned inline, and every disk read or write runs in a
+worker thread instead of on the event loop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between two purges of a namespace's expired rows
+_PURGE_INTERVAL = 60.0
+
+
+@dataclass(frozen=True, slots=True)
+class CacheEntry:
+    """A cached value together with its timestamps (epoch seconds)."""
+
+    value: Any
+    created_at: float
+    expires_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+
+class PersistentCache:
+    """SQLite-backed TTL cache with an in-memory LRU tier."""
+
+    def __init__(
+        self,
+        namespace: str,
+        *,
+        path: str,
+        ttl: float,
+        memory_size: int = 256,
+        max_entries: int | None = None,
+    ) -> None:
+        self.namespace = namespace
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self._next_purge = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(
+            path, timeout=10, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache (namespace, accessed_at)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_expiry"
+            " ON cache (namespace, expires_at)"
+        )
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash arbitrary key material into a fixed-size cache key."""
+        material = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    # ── Reads ────────────────────────────────────────────────────────────
+
+    def get_entry(self, key: str) -> CacheEntry | None:
+        """Return the live entry for *key* (with timestamps), or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory_hit_locked(key, now)
+            if entry is not None:
+                return entry
+
+            row = self._conn.execute(
+                "SELECT value, created_at, expires_at FROM cache "
+                "WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None or row[2] <= now:
+                if row is not None:
+                    self._delete_locked(key)
+                self.misses += 1
+                return None
+
+            entry = CacheEntry(json.loads(row[0]), row[1], row[2])
+            self._conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            self._remember_locked(key, entry)
+            self.hits += 1
+            return entry
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value for *key*, or None on a miss."""
+        entry = self.get_entry(key)
+        return entry.value if entry is not None else None
+
+    async def aget_entry(self, key: str) -> CacheEntry | None:
+        """:meth:`get_entry` for async callers; disk lookups run in a thread."""
+        # Never wait for the lock on the loop: a thread may hold it for I/O
+        if self._lock.acquire(blocking=False):
+            try:
+                entry = self._memory_hit_locked(key, time.time())
+            finally:
+                self._lock.release()
+            if entry is not None:
+                return entry
+        return await asyncio.to_thread(self.get_entry, key)
+
+    async def aget(self, key: str) -> Any | None:
+        """:meth:`get` for async callers; disk lookups run in a thread."""
+        entry = await self.aget_entry(key)
+        return entry.value if entry is not None else None
+
+    # ── Writes ───────────────────────────────────────────────────────────
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Store *value* under *key* for *ttl* seconds (default: cache TTL)."""
+        now = time.time()
+        entry = CacheEntry(value, now, now + (self.ttl if ttl is None else ttl))
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache "
+                "(namespace, key, value, created_at, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, payload, entry.created_at, entry.expires_at, now),
+            )
+            self._remember_locked(key, entry)
+            if now >= self._next_purge:
+                self._purge_expired_locked(now)
+            if self.max_entries is not None:
+                self._evict_locked()
+
+    async def aset(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """:meth:`set` for async callers; the write runs in a thread."""
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._delete_locked(key)
+
+    def clear(self) -> None:
+        """Drop every entry in this namespace."""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ?", (self.namespace,)
+            )
+
+    # ── Introspection ────────────────────────────────────────────────────
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ? AND expires_at > ?",
+                (self.namespace, time.time()),
+            ).fetchone()
+        return count
+
+    def stats(self) -> dict[str, Any]:
+        """Return hit / miss counters and the current number of entries."""
+        lookups = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ── Internals (caller holds self._lock) ──────────────────────────────
+
+    def _memory_hit_locked(self, key: str, now: float) -> CacheEntry | None:
+        entry = self._memory.get(key)
+        if entry is None or entry.expires_at <= now:
+            return None
+        self._memory.move_to_end(key)
+        self.hits += 1
+        self.memory_hits += 1
+        return entry
+
+    def _remember_locked(self, key: str, entry: CacheEntry) -> None:
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _delete_locked(self, key: str) -> None:
+        self._memory.pop(key, None)
+        self._conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+
+    def _purge_expired_locked(self, now: float) -> None:
+        """Drop the namespace's expired rows from disk and from memory."""
+        purged = self._conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at <= ?",
+            (self.namespace, now),
+        ).rowcount
+        for key in [k for k, e in self._memory.items() if e.expires_at <= now]:
+            del self._memory[key]
+        self._next_purge = now + _PURGE_INTERVAL
+        if purged:
+            logger.debug(
+                "Cache purge | namespace=%s expired=%d", self.namespace, purged
+            )
+
+    def _evict_locked(self) -> None:
+        """Drop the least recently used rows beyond max_entries."""
+        evicted = self._conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ?"
+            " ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)"
+            " RETURNING key",
+            (self.namespace, self.namespace, self.max_entries),
+        ).fetchall()
+        for (key,) in evicted:
+            self._memory.pop(key, None)
+        if evicted:
+            logger.debug(
+                "Cache eviction | namespace=%s evicted=%d", self.namespace, len(evicted)
+            )
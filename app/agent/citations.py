@@ -0,0 +1,87 @@
+"""Citation source analytics.
+
+Perplexity cites sources as raw URLs. :func:`registrable_domain` reduces a
+URL to the domain its owner registered (``https://docs.aws.amazon.com/x`` ->
+``amazon.com``, ``https://www.bbc.co.uk/`` -> ``bbc.co.uk``) using the public
+suffix list snapshot bundled with ``tldextract`` — no network access. Parsing
+is memoised per URL and per host, since the same sources come back in run
+after run.
+
+:func:`source_domains` gives the cited domains of one answer and
+:func:`analyse` aggregates a run's citations and counts the answers citing
+the brand's own domain. The answer corpus stores the same normalised
+domains, so citations across stored runs are aggregated in SQL.
+"""
+
+from __future__ import annotations
+
+import functools
+import re
+from collections import Counter
+from typing import Any, Iterable
+
+import tldextract
+
+from app.agent.state import PerplexityResult
+
+# Optional scheme and userinfo, then the host up to a port, path, query or fragment
+_URL_HOST_RE = re.compile(
+    r"(?:[A-Za-z][A-Za-z0-9+.\-]*:(?=//))?(?://)?(?:[^@/?#\s]*@)?([^/?#:\s]*)"
+)
+_HOST_RE = re.compile(r"^[\w-]+(?:\.[\w-]+)+$")
+
+# Bundled suffix list only: never fetch or cache a fresh copy at runtime
+_extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+
+
+@functools.lru_cache(maxsize=65536)
+def _host_domain(host: str) -> str:
+    parts = _extract.extract_str(host)
+    if parts.domain and parts.suffix:
+        return f"{parts.domain}.{parts.suffix}"
+    return host.removeprefix("www.")  # IP address or unknown suffix
+
+
+@functools.lru_cache(maxsize=262144)
+def registrable_domain(url: str) -> str:
+    """The registrable domain of *url* (or bare host), or "" if it has none."""
+    # One regex instead of urlsplit(), which dominates the cost on a cold cache
+    match = _URL_HOST_RE.match(url.strip())
+    host = match.group(1).lower().rstrip(".") if match else ""
+    return _host_domain(host) if _HOST_RE.match(host) else ""
+
+
+def source_domains(citations: Iterable[str]) -> list[str]:
+    """The distinct registrable domains of *citations*, in citation order."""
+    return list(dict.fromkeys(d for d in map(registrable_domain, citations) if d))
+
+
+def analyse(
+    results: list[PerplexityResult], own_domain: str, *, top: int
+) -> dict[str, Any]:
+    """Citation metrics over the successful answers of one run.
+
+    Returns the *top* most cited domains with their citation and answer
+    counts, and how many answers cited the brand's own domain.
+    """
+    own = registrable_domain(own_domain)
+    citations: Counter[str] = Counter()
+    answers: Counter[str] = Counter()
+    for r in results:
+        if r.failed:
+            continue
+        domains = [d for d in map(registrable_domain, r.citations) if d]
+        citations.update(domains)
+        answers.update(set(domains))
+    return {
+        "top_domains": [
+            {
+                "domain": domain,
+                "citations": count,
+                "prompts": answers[domain],
+                "is_own": domain == own,
+            }
+            for domain, count in citations.most_common(top)
+        ],
+        "own_domain_cited_count": answers[own] if own else 0,
+    }
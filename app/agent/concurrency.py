@@ -0,0 +1,287 @@
+"""Adaptive concurrency control for outbound API calls.
+
+:class:`AdaptiveLimiter` is an AIMD (additive-increase / multiplicative-
+decrease) limiter shared process-wide by every caller of a provider:
+
+* each successful call that was made while the limiter was saturated grows
+  the limit — by one slot per success during the initial slow start, then by
+  roughly one slot per full window (``1 / limit``);
+* a call that fails with an overload signal (429, 5xx, timeout) multiplies
+  the limit by ``backoff_ratio``, at most once per window so a burst of
+  failures from the same window is only counted once;
+* a call that succeeds but is much slower than the running latency average
+  holds the limit where it is.
+
+Callers wait in FIFO order for a free slot, so the current limit and queue
+depth are observable through :meth:`AdaptiveLimiter.snapshot`.
+
+:class:`LatencyTracker` keeps a rolling window of call latencies so callers
+can ask for a percentile, e.g. to decide when to hedge a slow request.
+
+:class:`SingleFlight` coalesces concurrent calls that share a key into one
+in-flight call whose result every caller awaits.
+
+:func:`close_stale` (and, from async code, :func:`close_quietly`) close a
+pooled client that was opened on an event loop the process has since left.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Rolling window of recent latencies with percentile lookup."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float | None:
+        """Return the *q* quantile (0–1), or None until enough samples exist."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one shared call.
+
+    The first caller for a key (the *leader*) starts the call; callers that
+    arrive while it is in flight await the same task. The shared task is
+    shielded, so a caller that is cancelled (e.g. a losing hedge or a timed
+    out request) does not cancel the call for everyone else.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, asyncio.Task[Any]] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        result, _ = await self.join(key, fn)
+        return result
+
+    async def join(
+        self, key: str, fn: Callable[[], Awaitable[T]]
+    ) -> tuple[T, bool]:
+        """Like :meth:`do`, also returning whether this caller joined a call
+        another caller started (and so did not pay for it)."""
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.leaders += 1
+            joined = False
+        else:
+            self.coalesced += 1
+            joined = True
+        return await asyncio.shield(task), joined
+
+    def _forget(self, key: str, task: asyncio.Task[Any]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved: followers may all have gone away
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter for one outbound provider."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        backoff_ratio: float = 0.5,
+        latency_tolerance: float = 2.0,
+        is_overload: Callable[[BaseException], bool] = lambda exc: False,
+    ) -> None:
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.is_overload = is_overload
+
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._slow_start = True
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._latency_avg: float | None = None
+        self._last_decrease = 0.0
+        self._successes = 0
+        self._overloads = 0
+
+    # ── Introspection ────────────────────────────────────────────────────
+
+    @property
+    def limit(self) -> int:
+        """Current number of calls allowed in flight."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of callers waiting for a slot."""
+        return sum(1 for fut in self._waiters if not fut.done())
+
+    def snapshot(self) -> dict[str, float | int | str | None]:
+        """Return a JSON-friendly view of the limiter state."""
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "latency_avg_s": (
+                round(self._latency_avg, 3) if self._latency_avg is not None else None
+            ),
+            "successes": self._successes,
+            "overloads": self._overloads,
+        }
+
+    # ── Slot management ──────────────────────────────────────────────────
+
+    async def acquire(self) -> None:
+        """Wait until a slot is free and take it."""
+        if not self._waiters and self._in_flight < self.limit:
+            self._in_flight += 1
+            return
+
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just as we were cancelled.
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(fut)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self) -> None:
+        """Give a slot back and wake as many waiters as the limit allows."""
+        self._in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self._in_flight += 1
+                fut.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a slot for the duration of one call and learn from its outcome."""
+        await self.acquire()
+        started = time.monotonic()
+        saturated = self._in_flight >= self.limit
+        try:
+            yield
+        except BaseException as exc:
+            if self.is_overload(exc):
+                self._on_overload(started)
+            raise
+        else:
+            self._on_success(time.monotonic() - started, saturated)
+        finally:
+            self.release()
+
+    # ── AIMD ─────────────────────────────────────────────────────────────
+
+    def _on_success(self, latency: float, saturated: bool) -> None:
+        self._successes += 1
+        avg = self._latency_avg
+        self._latency_avg = latency if avg is None else 0.9 * avg + 0.1 * latency
+        if avg is not None and latency > avg * self.latency_tolerance:
+            return  # markedly slower than usual: hold the limit
+        if not saturated:
+            return  # the limit was not the bottleneck, so there is nothing to learn
+        step = 1.0 if self._slow_start else 1.0 / self._limit
+        self._limit = min(float(self.max_limit), self._limit + step)
+
+    def _on_overload(self, started: float) -> None:
+        self._overloads += 1
+        if started < self._last_decrease:
+            return  # already backed off for this window
+        self._slow_start = False
+        self._last_decrease = time.monotonic()
+        self._limit = max(float(self.min_limit), self._limit * self.backoff_ratio)
+        logger.warning(
+            "Concurrency limit decreased | limiter=%s limit=%d", self.name, self.limit
+        )
+
+
+# ── Loop-bound clients ──────────────────────────────────────────────────────
+
+_closing: set[asyncio.Task[None]] = set()  # keep scheduled closes referenced
+
+
+async def close_quietly(aclose: Callable[[], Awaitable[Any]], what: str) -> None:
+    """Await *aclose*, logging instead of raising if the close fails."""
+    try:
+        await aclose()
+    except Exception as exc:  # noqa: BLE001 — the old loop may be gone
+        logger.debug("Stale client close failed | client=%s error=%r", what, exc)
+
+
+def close_stale(
+    aclose: Callable[[], Awaitable[Any]],
+    loop: asyncio.AbstractEventLoop | None,
+    what: str,
+) -> None:
+    """Close a client that was opened on *loop*, now that it is replaced.
+
+    If *loop* still runs (in another thread) the close is scheduled there;
+    otherwise it runs on the current loop, or on a throwaway one outside
+    async code. Errors are logged and ignored: a closed loop's connections
+    can only be dropped.
+    """
+    logger.info("Closing client from a previous event loop | client=%s", what)
+    if loop is not None and loop.is_running() and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(close_quietly(aclose, what), loop)
+        return
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        asyncio.run(close_quietly(aclose, what))
+        return
+    task = current.create_task(close_quietly(aclose, what))
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
@@ -0,0 +1,308 @@
+"""Token-budgeted context assembly for the brand extraction prompt.
+
+Firecrawl markdown and homepage text are split into passages, counted with
+the model's tokenizer, deduplicated, ranked by relevance to the brand and
+packed into ``BRAND_CONTEXT_TOKEN_BUDGET`` tokens:
+
+1. **Split** every document into passages of about
+   ``BRAND_CONTEXT_CHUNK_TOKENS`` tokens along paragraph boundaries.
+2. **Dedupe** passages whose word-shingle Jaccard similarity with an already
+   kept passage reaches ``BRAND_CONTEXT_DEDUP_THRESHOLD`` (the same
+   boilerplate, nav text or quoted description repeated across results).
+3. **Rank** by a term-frequency score: brand terms (from the domain) weigh
+   most, generic product vocabulary less; homepage passages and passages
+   from the brand's own site get a boost, later passages of a document a
+   small decay.
+4. **Pack** greedily by score until the budget is spent, then restore the
+   original document order so the prompt still reads coherently.
+
+Tokens are counted with tiktoken. If the encoding cannot be loaded (tiktoken
+downloads its BPE files on first use), a four-characters-per-token estimate
+is used instead. :func:`warm_encoder` loads it ahead of the first request;
+the Docker image bundles the BPE file in ``TIKTOKEN_CACHE_DIR``.
+
+Building is CPU-bound, so async callers run :func:`build_brand_context` in a
+worker thread.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import math
+import re
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n|(?=\n#{1,6} )")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Vocabulary that marks a passage as describing a product rather than, say,
+# cookie banners or navigation.
+PRODUCT_TERMS = frozenset({
+    "product", "platform", "features", "feature", "pricing", "customers",
+    "users", "teams", "helps", "solution", "software", "tool", "service",
+    "review", "reviews", "alternative", "alternatives", "competitor",
+    "competitors", "compare", "vs", "integrations", "founded", "company",
+})
+_SHINGLE_SIZE = 3
+
+
+@dataclass(frozen=True, slots=True)
+class Passage:
+    """One rankable slice of a source document."""
+
+    source: int  # index into the document list; the homepage comes last
+    position: int  # order within its document
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+@dataclass(frozen=True, slots=True)
+class BuiltContext:
+    """The packed prompt sections and what it cost to build them."""
+
+    search_text: str
+    homepage_text: str
+    tokens: int
+    passages_in: int
+    passages_kept: int
+    duplicates: int
+
+
+# ── Tokenizer ────────────────────────────────────────────────────────────────
+
+@functools.lru_cache(maxsize=8)
+def _get_encoder(model: str) -> Callable[[str], int] | None:
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("tiktoken unavailable, estimating tokens | error=%s", exc)
+        return None
+    return lambda text: len(encoding.encode_ordinary(text))
+
+
+def warm_encoder(model: str | None = None) -> bool:
+    """Load the tokenizer for *model* now; False if only the estimate is left."""
+    return _get_encoder(model or settings.LLM_MODEL) is not None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Return the token count of *text* for *model* (default ``LLM_MODEL``)."""
+    encode = _get_encoder(model or settings.LLM_MODEL)
+    if encode is None:
+        return math.ceil(len(text) / 4)
+    return encode(text)
+
+
+# ── Splitting ────────────────────────────────────────────────────────────────
+
+def split_passages(text: str, max_tokens: int) -> list[str]:
+    """Split *text* into passages of at most about *max_tokens* tokens.
+
+    Paragraphs are merged while they fit; a paragraph that alone exceeds the
+    limit is split on sentence boundaries.
+    """
+    # (piece, tokens): each paragraph or sentence is counted once
+    pieces: list[tuple[str, int]] = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if tokens <= max_tokens:
+            pieces.append((paragraph, tokens))
+        else:
+            pieces.extend(
+                (s, count_tokens(s)) for s in _SENTENCE_RE.split(paragraph) if s
+            )
+
+    passages: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+    for piece, tokens in pieces:
+        if current and current_tokens + tokens > max_tokens:
+            passages.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+# ── Deduplication ────────────────────────────────────────────────────────────
+
+def _shingles(words: list[str]) -> frozenset[tuple[str, ...]]:
+    if len(words) < _SHINGLE_SIZE:
+        return frozenset({tuple(words)})
+    return frozenset(
+        tuple(words[i : i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)
+    )
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def dedupe(passages: list[Passage], threshold: float) -> tuple[list[Passage], int]:
+    """Drop passages that are near-duplicates of an earlier one.
+
+    *passages* should be ordered best first so the copy that survives is the
+    highest-ranked one. Returns the kept passages and the number dropped.
+    """
+    kept: list[Passage] = []
+    kept_shingles: list[frozenset] = []
+    seen_exact: set[str] = set()
+    dropped = 0
+    for passage in passages:
+        words = _WORD_RE.findall(passage.text.lower())
+        exact = " ".join(words)
+        if exact in seen_exact:
+            dropped += 1
+            continue
+        shingles = _shingles(words)
+        if any(_jaccard(shingles, other) >= threshold for other in kept_shingles):
+            dropped += 1
+            continue
+        seen_exact.add(exact)
+        kept_shingles.append(shingles)
+        kept.append(passage)
+    return kept, dropped
+
+
+# ── Ranking ──────────────────────────────────────────────────────────────────
+
+def brand_terms(domain: str, brand_name: str | None = None) -> frozenset[str]:
+    """Words that identify the brand: the domain labels and the brand name."""
+    labels = [label for label in domain.lower().split(".") if label != "www"]
+    # "www.acme-cloud.co.uk" -> {"acme", "cloud", "acmecloud"}
+    name = max(labels[:-1] or labels, key=len)
+    terms = set(_WORD_RE.findall(name)) | {re.sub(r"[^a-z0-9]", "", name)}
+    if brand_name:
+        words = _WORD_RE.findall(brand_name.lower())
+        terms.update(words)
+        terms.add("".join(words))
+    return frozenset(t for t in terms if len(t) > 1)
+
+
+def score_passage(
+    text: str,
+    terms: frozenset[str],
+    *,
+    position: int,
+    is_homepage: bool,
+    own_site: bool,
+) -> float:
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return 0.0
+    brand_hits = sum(1 for w in words if w in terms)
+    product_hits = sum(1 for w in words if w in PRODUCT_TERMS)
+    score = (3.0 * brand_hits + product_hits) / math.sqrt(len(words))
+    if is_homepage or own_site:
+        score += 1.0
+    return score / (1.0 + 0.1 * position)
+
+
+# ── Packing ──────────────────────────────────────────────────────────────────
+
+def _is_own_site(url: str, domain: str) -> bool:
+    host = re.sub(r"^[a-z]+://", "", url.lower()).split("/", 1)[0]
+    domain = domain.lower().removeprefix("www.")
+    return host == domain or host.endswith("." + domain)
+
+
+def build_brand_context(
+    domain: str,
+    search_results: list[dict[str, Any]],
+    homepage_text: str,
+    *,
+    brand_name: str | None = None,
+    budget: int | None = None,
+) -> BuiltContext:
+    """Pack search results and homepage text into a token budget."""
+    budget = settings.BRAND_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    chunk_tokens = settings.BRAND_CONTEXT_CHUNK_TOKENS
+    terms = brand_terms(domain, brand_name)
+    homepage_index = len(search_results)
+
+    documents = [r.get("content", "") or "" for r in search_results] + [homepage_text]
+    passages: list[Passage] = []
+    for source, text in enumerate(documents):
+        is_homepage = source == homepage_index
+        own_site = not is_homepage and _is_own_site(
+            search_results[source].get("url", ""), domain
+        )
+        for position, chunk in enumerate(split_passages(text, chunk_tokens)):
+            passages.append(Passage(
+                source=source,
+                position=position,
+                text=chunk,
+                tokens=count_tokens(chunk),
+                score=score_passage(
+                    chunk,
+                    terms,
+                    position=position,
+                    is_homepage=is_homepage,
+                    own_site=own_site,
+                ),
+            ))
+
+    ranked = sorted(passages, key=lambda p: p.score, reverse=True)
+    unique, duplicates = dedupe(ranked, settings.BRAND_CONTEXT_DEDUP_THRESHOLD)
+
+    # Every result keeps its title line, so reserve room for those first.
+    headers = [
+        f"**{r.get('title', '')}** ({r.get('url', '')})" for r in search_results
+    ]
+    used = sum(count_tokens(h) for h in headers)
+    selected: list[Passage] = []
+    for passage in unique:
+        if used + passage.tokens > budget:
+            continue
+        selected.append(passage)
+        used += passage.tokens
+
+    by_source: dict[int, list[Passage]] = {}
+    for passage in sorted(selected, key=lambda p: (p.source, p.position)):
+        by_source.setdefault(passage.source, []).append(passage)
+
+    def _join(source: int) -> str:
+        return "\n".join(p.text for p in by_source.get(source, []))
+
+    search_text = "\n\n".join(
+        f"{header}\n{_join(source)}".rstrip() for source, header in enumerate(headers)
+    )
+    built = BuiltContext(
+        search_text=search_text,
+        homepage_text=_join(homepage_index),
+        tokens=used,
+        passages_in=len(passages),
+        passages_kept=len(selected),
+        duplicates=duplicates,
+    )
+    logger.info(
+        "Brand context built | domain=%s tokens=%d budget=%d passages=%d/%d "
+        "duplicates=%d",
+        domain,
+        built.tokens,
+        budget,
+        built.passages_kept,
+        built.passages_in,
+        built.duplicates,
+    )
+    return built
@@ -0,0 +1,316 @@
+"""Local corpus of Perplexity answers, searchable by brand.
+
+Every successful answer a run paid for is kept in a SQLite file
+(``CORPUS_DB_PATH``) tagged with the market category of the brand that was
+evaluated, with an FTS5 full-text index over the completion text. Any brand
+or alias can then be scored against the stored answers of a category without
+calling Perplexity (``POST /api/v1/corpus/score``), which gives an instant
+"historical exposure" estimate.
+
+Scoring is two-stage: the FTS index narrows a category down to the answers
+containing the brand's words, and a :class:`~app.agent.matcher.BrandMatcher`
+then applies the same matching rules as a live run (word boundaries, case of
+short names, spelling variants) to those candidates only.
+
+Each answer's citations are also stored reduced to registrable domains
+(``answer_sources``), so the most cited sources across runs are one SQL
+aggregate (``GET /api/v1/corpus/citations``).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable
+
+from app.agent.citations import registrable_domain
+from app.agent.matcher import BrandMatcher, domain_terms, term_words
+from app.agent.state import PerplexityResult
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# What the unicode61 tokenizer keeps as one token
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalise_category(category: str) -> str:
+    """Case- and whitespace-insensitive category key ("B2B  SaaS" -> "b2b saas")."""
+    return " ".join(category.lower().split())
+
+
+def _fts_query(terms: Iterable[str]) -> str:
+    """FTS5 query matching any spelling of *terms*.
+
+    Each term is matched as a phrase of its words ("hub spot", which also
+    covers "hub-spot") and, for multi-word terms, as the joined word
+    ("hubspot"); the matcher decides which candidates really count.
+    """
+    phrases: dict[str, None] = {}
+    for term in terms:
+        words = [
+            token.lower()
+            for word in term_words(term)
+            for token in _TOKEN_RE.findall(word)
+        ]
+        if not words:
+            continue
+        phrases['"' + " ".join(words) + '"'] = None
+        if len(words) > 1:
+            phrases['"' + "".join(words) + '"'] = None
+    return " OR ".join(phrases)
+
+
+class AnswerCorpus:
+    """SQLite store of answers with an FTS5 index over the completion text."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(
+            path, timeout=10, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY,"
+            " digest TEXT NOT NULL UNIQUE,"
+            " category TEXT NOT NULL,"
+            " domain TEXT NOT NULL,"
+            " prompt TEXT NOT NULL,"
+            " completion TEXT NOT NULL,"
+            " citations TEXT NOT NULL,"
+            " created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_answers_category ON answers (category);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS answers_fts USING fts5("
+            " completion, content='answers', content_rowid='id',"
+            " tokenize='unicode61 remove_diacritics 2');"
+            "CREATE TRIGGER IF NOT EXISTS answers_ai AFTER INSERT ON answers BEGIN"
+            " INSERT INTO answers_fts (rowid, completion)"
+            " VALUES (new.id, new.completion); END;"
+            # One row per cited URL, reduced to its registrable domain
+            "CREATE TABLE IF NOT EXISTS answer_sources ("
+            " answer_id INTEGER NOT NULL,"
+            " domain TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_sources_answer ON answer_sources (answer_id);"
+            "CREATE INDEX IF NOT EXISTS idx_sources_domain ON answer_sources (domain);"
+            "CREATE TRIGGER IF NOT EXISTS answers_ad AFTER DELETE ON answers BEGIN"
+            " INSERT INTO answers_fts (answers_fts, rowid, completion)"
+            " VALUES ('delete', old.id, old.completion);"
+            " DELETE FROM answer_sources WHERE answer_id = old.id; END;"
+        )
+
+    # ── Writes ───────────────────────────────────────────────────────────
+
+    def add(
+        self, category: str, domain: str, results: Iterable[PerplexityResult]
+    ) -> int:
+        """Store the successful answers in *results*; return how many were new.
+
+        An answer already in the corpus (same prompt and completion) is kept
+        once, whichever brand's run brought it in.
+        """
+        now = time.time()
+        rows = [
+            (
+                (
+                    hashlib.sha256(f"{r.prompt}\0{r.completion}".encode()).hexdigest(),
+                    normalise_category(category),
+                    domain,
+                    r.prompt,
+                    r.completion,
+                    json.dumps(list(r.citations)),
+                    now,
+                ),
+                [d for d in map(registrable_domain, r.citations) if d],
+            )
+            for r in results
+            if not r.failed and r.completion
+        ]
+        if not rows:
+            return 0
+        added = 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row, sources in rows:
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO answers (digest, category, domain,"
+                        " prompt, completion, citations, created_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        row,
+                    )
+                    if not cursor.rowcount:
+                        continue
+                    added += 1
+                    self._conn.executemany(
+                        "INSERT INTO answer_sources (answer_id, domain) VALUES (?, ?)",
+                        [(cursor.lastrowid, source) for source in sources],
+                    )
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return added
+
+    # ── Reads ────────────────────────────────────────────────────────────
+
+    def categories(self) -> list[dict[str, Any]]:
+        """Every category with its number of stored answers, largest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT category, COUNT(*) FROM answers GROUP BY category"
+                " ORDER BY COUNT(*) DESC, category"
+            ).fetchall()
+        return [{"category": c, "answers": n} for c, n in rows]
+
+    def cited_domains(
+        self, category: str | None = None, own_domain: str = "", *, limit: int = 20
+    ) -> dict[str, Any]:
+        """Most cited source domains across stored answers (of *category*).
+
+        Counted in SQL over the domains normalised at write time, so no URL
+        is parsed again however large the history.
+        """
+        key = normalise_category(category) if category else None
+        where = "WHERE a.category = ?" if key else ""
+        params: list[Any] = [key] if key else []
+        own = registrable_domain(own_domain) if own_domain else ""
+        with self._lock:
+            (answers,) = self._conn.execute(
+                f"SELECT COUNT(*) FROM answers AS a {where}", params
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT s.domain, COUNT(*), COUNT(DISTINCT s.answer_id)"
+                " FROM answer_sources AS s JOIN answers AS a ON a.id = s.answer_id"
+                f" {where} GROUP BY s.domain ORDER BY COUNT(*) DESC, s.domain"
+                " LIMIT ?",
+                [*params, limit],
+            ).fetchall()
+            (own_cited,) = self._conn.execute(
+                "SELECT COUNT(DISTINCT s.answer_id)"
+                " FROM answer_sources AS s JOIN answers AS a ON a.id = s.answer_id"
+                f" {where} {'AND' if where else 'WHERE'} s.domain = ?",
+                [*params, own],
+            ).fetchone()
+        return {
+            "category": key,
+            "answers": answers,
+            "domains": [
+                {"domain": d, "citations": c, "prompts": n, "is_own": d == own}
+                for d, c, n in rows
+            ],
+            "own_domain_cited_count": own_cited if own else 0,
+        }
+
+    def score(
+        self,
+        category: str,
+        brand_name: str,
+        aliases: Iterable[str] = (),
+        domain: str = "",
+        *,
+        max_examples: int = 5,
+    ) -> dict[str, Any]:
+        """Exposure of a brand across the stored answers of *category*."""
+        aliases = [a for a in aliases if a.strip()]
+        matcher = BrandMatcher.for_brand(brand_name, domain, aliases)
+        terms = [brand_name, *aliases]
+        if domain:
+            host, label = domain_terms(domain)
+            terms.extend(t for t in (host, label) if t)
+        query = _fts_query(terms)
+        key = normalise_category(category)
+
+        with self._lock:
+            (total,) = self._conn.execute(
+                "SELECT COUNT(*) FROM answers WHERE category = ?", (key,)
+            ).fetchone()
+            candidates = (
+                self._conn.execute(
+                    "SELECT a.prompt, a.completion, a.citations, a.domain"
+                    " FROM answers_fts JOIN answers AS a ON a.id = answers_fts.rowid"
+                    " WHERE answers_fts MATCH ? AND a.category = ?"
+                    " ORDER BY a.created_at DESC",
+                    (query, key),
+                ).fetchall()
+                if query and total
+                else []
+            )
+
+        mentioned = 0
+        examples: list[dict[str, Any]] = []
+        for prompt, completion, citations, source_domain in candidates:
+            own = [m for m in matcher.find(completion) if m.entity == matcher.brand]
+            if not own:
+                continue  # FTS hit the words, but not as a mention
+            mentioned += 1
+            if len(examples) < max_examples:
+                examples.append(
+                    {
+                        "prompt": prompt,
+                        "mention_context": matcher.context(completion, own),
+                        "sources": json.loads(citations),
+                        "evaluated_domain": source_domain,
+                    }
+                )
+
+        return {
+            "category": key,
+            "brand_name": brand_name,
+            "answers": total,
+            "candidates": len(candidates),
+            "mentioned": mentioned,
+            "exposure_rate": round(mentioned / total * 100, 1) if total else 0.0,
+            "examples": examples,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_corpus: AnswerCorpus | None = None
+_corpus_lock = threading.Lock()
+
+
+def get_corpus() -> AnswerCorpus:
+    """Return the process-wide corpus, opening it on first use."""
+    global _corpus
+    if _corpus is None:
+        with _corpus_lock:
+            if _corpus is None:
+                _corpus = AnswerCorpus(settings.CORPUS_DB_PATH)
+    return _corpus
+
+
+def record(
+    category: str, domain: str, results: Iterable[PerplexityResult]
+) -> int:
+    """Add a run's answers to the corpus, if enabled. Never raises.
+
+    This is blocking SQLite I/O: call it from a worker thread in async code.
+    """
+    if not settings.CORPUS_ENABLED:
+        return 0
+    try:
+        added = get_corpus().add(category or "unknown", domain, results)
+    except (sqlite3.Error, OSError) as exc:
+        logger.warning("Answer corpus write failed | domain=%s error=%s", domain, exc)
+        return 0
+    logger.info(
+        "Answer corpus updated | category=%s domain=%s added=%d",
+        normalise_category(category or "unknown"),
+        domain,
+        added,
+    )
+    return added
@@ -4,19 +4,42 @@ Builds a sequential StateGraph with conditional error handling:
 
     START → brand_researcher → prompt_generator → perplexity_runner → report_generator → END
 
+With ``PROMPT_STREAMING`` enabled, the middle two nodes are replaced by the
+fused ``prompt_pipeline`` node, which dispatches each prompt to Perplexity
+as soon as the LLM has finished streaming it:
+
+    START → brand_researcher → prompt_pipeline → report_generator → END
+
+With ``FUSED_PROMPT_GENERATION`` enabled, ``brand_researcher`` writes the
+prompts in the same LLM call as the brand context; when it did, the prompt
+stage is skipped:
+
+    START → brand_researcher → perplexity_runner → report_generator → END
+
+A repeat run of a domain starts with the prompts of its latest stored run
+(``PROMPT_REUSE``, unless ``force_refresh``), and likewise skips the prompt
+stage, so its results can be compared prompt by prompt.
+
 If any node sets ``state["error"]``, the graph short-circuits to END.
+
+Comparative runs (``competitor_domains``) take the same path: the competitors
+are researched alongside the brand and every answer is scored for all of
+them, so one prompt set and one Perplexity query per prompt serve every
+brand.
 """
 
 from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Any, Literal
+from typing import Any, Literal, Sequence
 
 from langgraph.graph import END, StateGraph
 
+from app.agent import run_store
 from app.agent.nodes.brand_researcher import brand_researcher
 from app.agent.nodes.perplexity_runner import perplexity_runner
+from app.agent.nodes.prompt_pipeline import prompt_pipeline
 from app.agent.nodes.prompt_generator import prompt_generator
 from app.agent.nodes.report_generator import report_generator
 from app.agent.state import AgentState
@@ -34,6 +57,19 @@ def _check_error(state: AgentState) -> Literal["continue", "end"]:
     return "continue"
 
 
+def _route_after_research(
+    state: AgentState,
+) -> Literal["prompt_generator", "prompt_pipeline", "perplexity_runner", "end"]:
+    """Pick the prompt stage, or skip it if the researcher wrote the prompts."""
+    if state.get("error"):
+        return "end"
+    if state.get("generated_prompts"):
+        return "perplexity_runner"
+    if settings.PROMPT_STREAMING:
+        return "prompt_pipeline"
+    return "prompt_generator"
+
+
 # ── Graph construction ──────────────────────────────────────────────────────
 
 def build_graph() -> Any:
@@ -44,6 +80,7 @@ def build_graph() -> Any:
     graph.add_node("brand_researcher", brand_researcher)
     graph.add_node("prompt_generator", prompt_generator)
     graph.add_node("perplexity_runner", perplexity_runner)
+    graph.add_node("prompt_pipeline", prompt_pipeline)
     graph.add_node("report_generator", report_generator)
 
     # Entry point
@@ -52,8 +89,13 @@ def build_graph() -> Any:
     # Conditional edges: after each node, check for errors
     graph.add_conditional_edges(
         "brand_researcher",
-        _check_error,
-        {"continue": "prompt_generator", "end": END},
+        _route_after_research,
+        {
+            "prompt_generator": "prompt_generator",
+            "prompt_pipeline": "prompt_pipeline",
+            "perplexity_runner": "perplexity_runner",
+            "end": END,
+        },
     )
     graph.add_conditional_edges(
         "prompt_generator",
@@ -65,6 +107,11 @@ def build_graph() -> Any:
         _check_error,
         {"continue": "report_generator", "end": END},
     )
+    graph.add_conditional_edges(
+        "prompt_pipeline",
+        _check_error,
+        {"continue": "report_generator", "end": END},
+    )
     graph.add_edge("report_generator", END)
 
     return graph.compile()
@@ -76,27 +123,52 @@ compiled_graph = build_graph()
 
 # ── Public interface ────────────────────────────────────────────────────────
 
-async def run_graph(domain: str, prompts_count: int = 5) -> dict[str, Any]:
+async def run_graph(
+    domain: str,
+    prompts_count: int = 5,
+    force_refresh: bool = False,
+    competitor_domains: Sequence[str] = (),
+) -> dict[str, Any]:
     """Run the full evaluation workflow for *domain*.
 
-    The graph nodes are synchronous, so we run the compiled graph
-    in a thread to keep the FastAPI event loop free.
+    With *competitor_domains* the run is comparative: the final state also
+    carries a report per competitor under ``comparison_reports``; competitors
+    whose research failed are listed under ``comparison_failed`` instead.
+
+    Every node is a coroutine, so the compiled graph is driven with
+    ``ainvoke`` directly on the FastAPI event loop — no worker thread is
+    held for the duration of the run.
     """
+    prompts = (
+        []
+        if force_refresh
+        else await asyncio.to_thread(run_store.stored_prompts, domain, prompts_count)
+    )
     initial_state: AgentState = {
         "domain": domain,
         "prompts_count": prompts_count,
+        "force_refresh": force_refresh,
         "brand_name": "",
         "brand_context": {},
-        "generated_prompts": [],
+        "generated_prompts": prompts,
         "perplexity_results": [],
         "report": {},
         "error": None,
+        "competitor_domains": list(competitor_domains),
+        "comparison": [],
+        "comparison_reports": [],
+        "comparison_failed": [],
     }
 
-    logger.info("Starting graph for domain=%s", domain)
+    logger.info(
+        "Starting graph for domain=%s competitors=%d reused_prompts=%d",
+        domain,
+        len(competitor_domains),
+        len(prompts),
+    )
 
     result = await asyncio.wait_for(
-        asyncio.to_thread(compiled_graph.invoke, initial_state),
+        compiled_graph.ainvoke(initial_state),
         timeout=settings.WORKFLOW_TIMEOUT,
     )
 
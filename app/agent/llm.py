@@ -0,0 +1,229 @@
+"""Shared LLM factory for the graph nodes.
+
+:func:`get_llm` returns one cached ``ChatOpenAI`` per node. Each node can run
+on its own model (``BRAND_LLM_MODEL``, ``PROMPT_LLM_MODEL``,
+``SUMMARY_LLM_MODEL``; empty means ``LLM_MODEL``), and every instance shares
+the same pooled httpx clients, so connections to OpenAI are kept alive across
+nodes and requests instead of being set up per call.
+
+With ``LLM_CACHE_ENABLED``, temperature-0 nodes also get the exact-match
+response cache from :mod:`app.agent.llm_cache`.
+
+A callback on each instance records per-node call counts, cache hits, latency
+and token usage, exposed through :func:`llm_stats`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+from uuid import UUID
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_openai import ChatOpenAI
+
+from app.agent.concurrency import LatencyTracker, close_quietly, close_stale
+from app.agent.llm_cache import llm_cache
+from app.agent.ratelimit import openai_rate_limiter
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class LLMSpec:
+    """How a node calls the LLM."""
+
+    model_setting: str
+    temperature: float
+    max_tokens: int
+
+
+NODE_SPECS: dict[str, LLMSpec] = {
+    "brand_researcher": LLMSpec("BRAND_LLM_MODEL", temperature=0, max_tokens=2048),
+    "prompt_generator": LLMSpec("PROMPT_LLM_MODEL", temperature=0.7, max_tokens=2048),
+    "report_generator": LLMSpec("SUMMARY_LLM_MODEL", temperature=0, max_tokens=512),
+}
+
+
+def model_for(node: str) -> str:
+    """Return the model configured for *node*."""
+    return getattr(settings, NODE_SPECS[node].model_setting) or settings.LLM_MODEL
+
+
+# ── Per-node stats ──────────────────────────────────────────────────────────
+
+class NodeStats:
+    """Call, latency and token counters for one node."""
+
+    def __init__(self, node: str) -> None:
+        self.node = node
+        self.calls = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latency = LatencyTracker(window=200, min_samples=1)
+
+    def snapshot(self) -> dict[str, Any]:
+        p50 = self.latency.quantile(0.5)
+        p95 = self.latency.quantile(0.95)
+        return {
+            "node": self.node,
+            "model": model_for(self.node),
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "errors": self.errors,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "latency_p50_s": round(p50, 3) if p50 is not None else None,
+            "latency_p95_s": round(p95, 3) if p95 is not None else None,
+        }
+
+
+def _is_cache_hit(response: LLMResult) -> bool:
+    return any(
+        getattr(generation, "message", None) is not None
+        and generation.message.response_metadata.get("cache_hit", False)
+        for generations in response.generations
+        for generation in generations
+    )
+
+
+def _token_usage(response: LLMResult) -> tuple[int, int]:
+    """Pull (input, output) tokens from a chat result, streamed or not."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class _StatsCallback(BaseCallbackHandler):
+    """Feeds :class:`NodeStats` from LangChain's LLM run events."""
+
+    run_inline = True  # plain bookkeeping, no need for a worker thread
+
+    def __init__(self, stats: NodeStats) -> None:
+        self.stats = stats
+        self._started: dict[UUID, float] = {}
+
+    def on_chat_model_start(
+        self, serialized: Any, messages: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._started[run_id] = time.monotonic()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        self.stats.calls += 1
+        if _is_cache_hit(response):
+            self.stats.cache_hits += 1
+        elif started is not None:
+            self.stats.latency.record(time.monotonic() - started)
+        input_tokens, output_tokens = _token_usage(response)
+        self.stats.input_tokens += input_tokens
+        self.stats.output_tokens += output_tokens
+
+    def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._started.pop(run_id, None)
+        self.stats.calls += 1
+        self.stats.errors += 1
+
+
+_stats: dict[str, NodeStats] = {node: NodeStats(node) for node in NODE_SPECS}
+
+
+def llm_stats() -> list[dict[str, Any]]:
+    """Per-node LLM call stats, JSON-friendly."""
+    return [stats.snapshot() for stats in _stats.values()]
+
+
+# ── Factory ─────────────────────────────────────────────────────────────────
+
+# The async httpx client is bound to the loop that opened it, so the cached
+# instances are remembered together with that loop and rebuilt on a new one
+# (closing the old client).
+_llms: dict[tuple[str, str, bool], ChatOpenAI] = {}
+_llm_loop: asyncio.AbstractEventLoop | None = None
+_http_client: httpx.Client | None = None
+_http_async_client: httpx.AsyncClient | None = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    )
+
+
+def _current_loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_llm(node: str) -> ChatOpenAI:
+    """Return the shared ``ChatOpenAI`` for *node* (see :data:`NODE_SPECS`)."""
+    global _llm_loop, _http_client, _http_async_client
+    loop = _current_loop()
+    if loop is not _llm_loop:
+        if _http_async_client is not None:
+            close_stale(_http_async_client.aclose, _llm_loop, "openai")
+        _llms.clear()
+        _http_async_client = None
+        _llm_loop = loop
+    model = model_for(node)
+    spec = NODE_SPECS[node]
+    cached = settings.LLM_CACHE_ENABLED and spec.temperature == 0
+    llm = _llms.get((node, model, cached))
+    if llm is None:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=_limits())
+        if _http_async_client is None:
+            _http_async_client = httpx.AsyncClient(limits=_limits())
+        logger.info(
+            "Creating shared LLM client | node=%s model=%s cached=%s",
+            node,
+            model,
+            cached,
+        )
+        llm = ChatOpenAI(
+            model=model,
+            api_key=settings.OPENAI_API_KEY,
+            temperature=spec.temperature,
+            max_tokens=spec.max_tokens,
+            rate_limiter=openai_rate_limiter(),
+            http_client=_http_client,
+            http_async_client=_http_async_client,
+            stream_usage=True,
+            cache=llm_cache if cached else None,
+            callbacks=[_StatsCallback(_stats[node])],
+        )
+        _llms[node, model, cached] = llm
+    return llm
+
+
+async def close_llm_clients() -> None:
+    """Close the pooled HTTP clients and drop the cached instances."""
+    global _llm_loop, _http_client, _http_async_client
+    if _http_async_client is not None:
+        if _llm_loop is _current_loop():
+            await _http_async_client.aclose()
+        else:
+            await close_quietly(_http_async_client.aclose, "openai")
+    if _http_client is not None:
+        _http_client.close()
+    _llms.clear()
+    _llm_loop = None
+    _http_client = None
+    _http_async_client = None
@@ -0,0 +1,134 @@
+"""Exact-match cache for deterministic LLM calls.
+
+:data:`llm_cache` is a LangChain ``BaseCache`` backed by the shared
+:class:`~app.agent.cache.PersistentCache` (namespace ``"llm"``). LangChain
+keys each lookup on the serialised messages plus the model's "llm string"
+(model name, temperature, max tokens, tools / response format, ...); both are
+hashed into the cache key, so any change to the input or to the parameters
+is a miss.
+
+The LLM factory attaches it to temperature-0 nodes when
+``LLM_CACHE_ENABLED`` is set. A hit returns the stored message unchanged
+except for its token usage, which is zeroed, and
+``response_metadata["cache_hit"]``, which is set, so usage accounting does
+not count the call twice.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from typing import Any, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+from pydantic import BaseModel
+
+from app.agent.cache import PersistentCache
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_store: PersistentCache | None = None
+_store_lock = threading.Lock()
+
+
+def _get_store() -> PersistentCache:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PersistentCache(
+                    "llm",
+                    path=settings.CACHE_DB_PATH,
+                    ttl=settings.LLM_CACHE_TTL,
+                    memory_size=64,
+                    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                )
+    return _store
+
+
+def _serialise(generation: Generation) -> dict[str, Any]:
+    if not isinstance(generation, ChatGeneration):
+        return {"text": generation.text, "generation_info": generation.generation_info}
+    message = generation.message
+    additional_kwargs = dict(message.additional_kwargs)
+    # Structured output stores the parsed pydantic object here; the parser
+    # accepts a plain dict just as well.
+    if isinstance(additional_kwargs.get("parsed"), BaseModel):
+        additional_kwargs["parsed"] = additional_kwargs["parsed"].model_dump(mode="json")
+    return {
+        "content": message.content,
+        "additional_kwargs": additional_kwargs,
+        "response_metadata": message.response_metadata,
+        "tool_calls": getattr(message, "tool_calls", []),
+        "generation_info": generation.generation_info,
+    }
+
+
+def _restore(data: dict[str, Any]) -> Generation:
+    if "content" not in data:
+        return Generation(text=data["text"], generation_info=data["generation_info"])
+    message = AIMessage(
+        content=data["content"],
+        additional_kwargs=data["additional_kwargs"],
+        response_metadata={**data["response_metadata"], "cache_hit": True},
+        tool_calls=data["tool_calls"],
+        usage_metadata={"input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+    )
+    return ChatGeneration(message=message, generation_info=data["generation_info"])
+
+
+class PersistentLLMCache(BaseCache):
+    """LangChain cache adapter over the persistent ``"llm"`` namespace."""
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return PersistentCache.make_key(llm_string, prompt)
+
+    def lookup(self, prompt: str, llm_string: str) -> Sequence[Generation] | None:
+        value = _get_store().get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        return [_restore(item) for item in value]
+
+    def update(
+        self, prompt: str, llm_string: str, return_val: Sequence[Generation]
+    ) -> None:
+        try:
+            value = [_serialise(generation) for generation in return_val]
+            _get_store().set(self._key(prompt, llm_string), value)
+        except (TypeError, ValueError) as exc:
+            logger.warning("LLM response not cacheable | error=%s", exc)
+
+    def clear(self, **kwargs: Any) -> None:
+        _get_store().clear()
+
+    # Memory-tier hits are served inline, SQLite reads and writes in a thread
+    async def alookup(self, prompt: str, llm_string: str) -> Sequence[Generation] | None:
+        value = await _get_store().aget(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        return [_restore(item) for item in value]
+
+    async def aupdate(
+        self, prompt: str, llm_string: str, return_val: Sequence[Generation]
+    ) -> None:
+        try:
+            value = [_serialise(generation) for generation in return_val]
+            await _get_store().aset(self._key(prompt, llm_string), value)
+        except (TypeError, ValueError) as exc:
+            logger.warning("LLM response not cacheable | error=%s", exc)
+
+    async def aclear(self, **kwargs: Any) -> None:
+        await asyncio.to_thread(self.clear)
+
+
+llm_cache = PersistentLLMCache()
+
+
+def cache_stats() -> dict[str, Any] | None:
+    """Hit / miss counters of the LLM cache, or None if it is unused."""
+    return _store.stats() if _store is not None else None
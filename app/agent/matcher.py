@@ -0,0 +1,257 @@
+"""Precompiled brand mention matcher.
+
+:class:`BrandMatcher` folds every way a brand can be written — the brand
+name, LLM-extracted aliases, the domain (``acme.io``) and its main label
+(``acme``), plus spelling variants — into **one** compiled regular
+expression, so a completion is scanned once and every mention comes back
+with its offsets.
+
+Variants: multi-word and CamelCase names match with or without a space,
+hyphen or dot between their parts (``Hub Spot``, ``hub-spot``, ``HubSpot``)
+and possessives match on the name itself. Every term is anchored on word
+boundaries, so ``Box`` does not match ``Inbox``; terms shorter than
+:data:`MIN_CASELESS_LENGTH` must also match case exactly, so a brand called
+``Hey`` is not found in "hey there".
+
+Competitors are folded into the same expression, so share of voice comes
+out of the same single scan: every :class:`Mention` carries the entity it
+belongs to, looked up from the matched spelling.
+
+Mention context is sliced around the match offsets — only the sentences
+that contain a match are located — instead of splitting the whole text.
+Matchers are cached per (brand, domain, aliases, competitors), so scoring
+thousands of stored completions for one brand compiles the pattern once.
+"""
+
+from __future__ import annotations
+
+import functools
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Mapping, Sequence
+
+# Shorter terms are matched case-sensitively to avoid common-word hits
+MIN_CASELESS_LENGTH = 4
+
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+_PART_SPLIT_RE = re.compile(r"[\s\-_.]+")
+_SEPARATOR = r"[\s\-_.]?"
+_SENTENCE_END_RE = re.compile(r"[.!?](?=\s)|\n")
+# rfind() needles for the same boundaries, used when scanning backwards
+_SENTENCE_BREAKS = (". ", "! ", "? ", ".\t", "!\t", "?\t", "\n")
+
+
+@dataclass(frozen=True, slots=True)
+class Mention:
+    """One mention of an entity (the brand or a competitor) in a text."""
+
+    start: int
+    end: int
+    text: str
+    entity: str = ""  # name of the entity the matched term belongs to
+
+
+def term_words(term: str) -> list[str]:
+    """The parts of *term*: split on separators and CamelCase humps."""
+    words: list[str] = []
+    for part in _PART_SPLIT_RE.split(term.strip()):
+        words.extend(w for w in _CAMEL_RE.split(part) if w)
+    return words
+
+
+def _term_pattern(term: str) -> str:
+    """Regex for *term* allowing an optional separator between its parts."""
+    return _SEPARATOR.join(re.escape(w) for w in term_words(term))
+
+
+def _normalise(spelling: str) -> str:
+    """Lowercase *spelling* and drop the separators a variant may contain."""
+    return _PART_SPLIT_RE.sub("", spelling.lower())
+
+
+class BrandMatcher:
+    """Find every mention of a brand — and optionally its competitors — with
+    a single compiled regex.
+
+    Every match reports which entity it belongs to: :attr:`brand` for the
+    brand's own terms, the competitor's name otherwise.
+    """
+
+    def __init__(
+        self,
+        terms: Iterable[str],
+        literals: Iterable[str] = (),
+        competitors: Mapping[str, Iterable[str]] | None = None,
+    ) -> None:
+        """*terms* get spelling variants; *literals* (e.g. a domain) match as
+        is. *competitors* maps each competitor's name to its terms."""
+        terms = [t.strip() for t in terms if t and t.strip()]
+        self.brand = terms[0] if terms else ""
+        patterns: dict[str, tuple[str, str]] = {}  # term -> (entity, pattern)
+        for term in terms:
+            patterns.setdefault(term, (self.brand, _term_pattern(term)))
+        for literal in literals:
+            if literal and literal.strip():
+                patterns.setdefault(
+                    literal.strip(), (self.brand, re.escape(literal.strip()))
+                )
+        for name, competitor_terms in (competitors or {}).items():
+            for term in competitor_terms:
+                if term and term.strip():
+                    patterns.setdefault(term.strip(), (name, _term_pattern(term)))
+        # Longest first, so "Acme Cloud" wins over "Acme" at the same offset
+        ordered = [
+            t for t in sorted(patterns, key=len, reverse=True) if patterns[t][1]
+        ]
+        self.terms = tuple(ordered)
+        self.entities = tuple(dict.fromkeys(patterns[t][0] for t in patterns))
+
+        # The scan runs case-sensitively over ``text.lower()`` with a leading
+        # literal and no look-behind, which lets the regex engine skip ahead
+        # on the terms' first characters (an IGNORECASE scan is several times
+        # slower). The left word boundary and the exact case of short terms
+        # are checked on the candidate matches instead. Capturing groups would
+        # disable the skip-ahead too, so a match's entity is looked up by its
+        # spelling (with separators removed if it is a variant).
+        alternatives: list[str] = []
+        self._entity_of: dict[str, str] = {}  # normalised spelling -> entity
+        self._exact: dict[str, re.Pattern[str]] = {}  # short terms' case check
+        for term in ordered:
+            entity, pattern = patterns[term]
+            key = _normalise(term)
+            self._entity_of.setdefault(key, entity)  # the brand's terms win
+            self._entity_of.setdefault(term.lower(), entity)  # fast path
+            if len(term) < MIN_CASELESS_LENGTH:
+                self._exact.setdefault(key, re.compile(pattern))
+            alternatives.append(pattern.lower())
+        alternatives = list(dict.fromkeys(alternatives))
+        body = "(?:" + "|".join(alternatives) + r")(?!\w)"
+        self._regex = re.compile(body) if alternatives else None
+        # For the rare text whose lowercase form has a different length
+        self._caseless = re.compile(body, re.IGNORECASE) if alternatives else None
+
+    @classmethod
+    def for_brand(
+        cls,
+        brand_name: str,
+        domain: str = "",
+        aliases: Iterable[str] = (),
+        competitors: Iterable[str | Sequence[str]] = (),
+    ) -> BrandMatcher:
+        """Return the (cached) matcher for a brand, its domain, aliases and
+        competitors.
+
+        Each competitor is a name, or a ``(name, *terms)`` sequence such as
+        :func:`competitor_terms` builds.
+        """
+        return _cached_matcher(
+            brand_name,
+            domain,
+            tuple(sorted(set(aliases))),
+            tuple(
+                dict.fromkeys(
+                    (c,) if isinstance(c, str) else tuple(c) for c in competitors
+                )
+            ),
+        )
+
+    def _candidates(self, text: str) -> Iterator[Mention]:
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            matches = self._regex.finditer(lowered)
+        else:
+            # Offsets into text.lower() would not line up with text
+            lowered = text
+            matches = self._caseless.finditer(text)
+        for match in matches:
+            start, end = match.span()
+            if start and (text[start - 1].isalnum() or text[start - 1] == "_"):
+                continue  # starts inside a word, e.g. "box" in "inbox"
+            entity = self._entity_of.get(lowered[start:end])
+            if entity is None or self._exact:
+                key = _normalise(text[start:end])
+                entity = self._entity_of.get(key, self.brand)
+                exact = self._exact.get(key)
+                if exact is not None and exact.fullmatch(text, start, end) is None:
+                    continue
+            yield Mention(start, end, text[start:end], entity)
+
+    def find(self, text: str) -> list[Mention]:
+        """Return every mention in *text*, in order, without overlaps."""
+        if self._regex is None or not text:
+            return []
+        return list(self._candidates(text))
+
+    def search(self, text: str) -> bool:
+        """True if *text* mentions the brand (stops at the first match)."""
+        if self._regex is None or not text:
+            return False
+        return any(m.entity == self.brand for m in self._candidates(text))
+
+    @staticmethod
+    def context(text: str, mentions: list[Mention]) -> str:
+        """Return the sentence(s) of *text* around *mentions*, in order.
+
+        Sentence boundaries are only looked for between the previous sentence
+        and the next mention, so the text is scanned at most once; a sentence
+        with several mentions is returned once.
+        """
+        spans: list[tuple[int, int]] = []
+        cursor = 0
+        for mention in mentions:
+            if mention.start < cursor:
+                continue  # inside the sentence we already have
+            start = cursor
+            for brk in _SENTENCE_BREAKS:
+                found = text.rfind(brk, cursor, mention.start)
+                if found != -1:
+                    start = max(start, found + 1)
+            end_match = _SENTENCE_END_RE.search(text, mention.end)
+            cursor = end_match.end() if end_match else len(text)
+            spans.append((start, cursor))
+        return " ".join(text[s:e].strip() for s, e in spans)
+
+
+def domain_terms(domain: str) -> tuple[str, str | None]:
+    """The host of *domain* and its main label, if long enough to be a term."""
+    # "www.acme-cloud.io" -> host "acme-cloud.io", label "acme-cloud"
+    host = domain.lower().strip().removeprefix("www.")
+    labels = host.split(".")
+    label = max(labels[:-1] or labels, key=len)
+    # A short lowercase label ("box") would match the common word
+    return host, label if len(label) >= MIN_CASELESS_LENGTH else None
+
+
+def competitor_terms(
+    name: str, domain: str = "", aliases: Iterable[str] = ()
+) -> tuple[str, ...]:
+    """``(name, *terms)`` for a competitor known by more than its name."""
+    terms = [name, *aliases]
+    if domain:
+        host, label = domain_terms(domain)
+        terms.extend(t for t in (label, host) if t)
+    return tuple(dict.fromkeys(terms))
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_matcher(
+    brand_name: str,
+    domain: str,
+    aliases: tuple[str, ...],
+    competitors: tuple[tuple[str, ...], ...],
+) -> BrandMatcher:
+    terms = [brand_name, *aliases]
+    literals: list[str] = []
+    if domain:
+        host, label = domain_terms(domain)
+        literals.append(host)
+        if label:
+            terms.append(label)
+    # A competitor spelled like the brand (or listed twice) is dropped
+    seen = {brand_name.strip().casefold()}
+    rivals: dict[str, tuple[str, ...]] = {}
+    for name, *extra in competitors:
+        if name and name.strip() and name.strip().casefold() not in seen:
+            seen.add(name.strip().casefold())
+            rivals[name.strip()] = (name, *extra)
+    return BrandMatcher(terms, literals, rivals)
@@ -2,19 +2,42 @@
 
 Researches a brand from its domain using Firecrawl search + homepage scraping,
 then extracts structured brand context via the LLM.
+
+With ``FIRECRAWL_LITE_MODE`` the search asks for titles and descriptions
+only; if the LLM then reports a confidence below ``FIRECRAWL_MIN_CONFIDENCE``
+the search is repeated with full page content and the extraction rerun.
+
+With ``FUSED_PROMPT_GENERATION`` the same structured-output call also writes
+the evaluation prompts, so the graph can skip the separate prompt generator
+and its LLM round trip. Only freshly researched context carries prompts; on a
+brand cache hit the prompt generator runs as usual.
+
+The extracted context is cached per domain and LLM model. Within
+``BRAND_CACHE_TTL`` the cached context is used as is; after that it is still
+served immediately while a background refresh replaces it. Setting
+``force_refresh`` in the state bypasses the cache.
+
+In comparative mode (``competitor_domains`` in the state) the competitors are
+researched concurrently with the brand, through the same cache, and recorded
+under ``comparison``. A competitor whose research fails is left out of the
+comparison and listed under ``comparison_failed``; only a failure for the
+brand itself fails the node.
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
 from typing import Any
 
-import httpx
-from bs4 import BeautifulSoup
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 
+from app.agent.cache import PersistentCache
+from app.agent.context_builder import build_brand_context
+from app.agent.llm import get_llm, model_for
+from app.agent.nodes.prompt_generator import PROMPT_RULES
 from app.agent.state import AgentState
+from app.agent.tools.homepage import fetch_homepage_text
 from app.agent.tools.web_search import search_brand
 from app.config import settings
 
@@ -45,81 +68,307 @@ class BrandInfo(BaseModel):
     value_proposition: str = Field(
         description="The main value proposition"
     )
+    aliases: list[str] = Field(
+        default_factory=list,
+        description=(
+            "Other names the brand is referred to by: product names, "
+            "abbreviations, former names (may be empty)"
+        ),
+    )
+    confidence: float = Field(
+        default=1.0,
+        description=(
+            "How confident you are (0 to 1) that the fields above are accurate "
+            "given the data provided"
+        ),
+    )
+
+
+class BrandResearch(BrandInfo):
+    """Brand information plus the evaluation prompts, in one LLM response."""
+
+    prompts: list[str] = Field(
+        description="Realistic search prompts following the PROMPT RULES"
+    )
+
+
+# Research fields that are not part of the brand context handed downstream
+_NOT_CONTEXT = frozenset({"prompts", "confidence"})
+
+
+def _brand_context(research: dict[str, Any]) -> dict[str, Any]:
+    """The brand context in *research*, without prompts or internal fields.
+
+    Also cleans contexts cached before ``confidence`` was dropped at source.
+    """
+    return {k: v for k, v in research.items() if k not in _NOT_CONTEXT}
 
 
 # ── Helper: scrape homepage ─────────────────────────────────────────────────
 async def _scrape_homepage(domain: str) -> str:
-    """Fetch the homepage HTML and return visible text (best-effort)."""
-    url = f"https://{domain}"
+    """Fetch the homepage and return visible text (best-effort)."""
     try:
-        async with httpx.AsyncClient(
-            timeout=15, follow_redirects=True, 
-        ) as client:
-            logger.info("Scraping homepage | url=%s", url)
-            resp = await client.get(url)
-            resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        # Remove script / style tags
-        for tag in soup(["script", "style", "noscript"]):
-            tag.decompose()
-        text = soup.get_text(separator=" ", strip=True)
-        # Truncate to avoid blowing up the LLM context
-        return text[:6000]
+        return await fetch_homepage_text(domain)
     except Exception as exc:  # noqa: BLE001
         logger.warning("Failed to scrape homepage for %s: %s", domain, exc)
         return ""
 
 
-# ── Node function ───────────────────────────────────────────────────────────
-def brand_researcher(state: AgentState) -> dict[str, Any]:
-    """Research the brand and store structured context in state."""
-    domain = state["domain"]
-    logger.info("[brand_researcher] START | domain=%s", domain)
+# ── Helper: concurrent research ─────────────────────────────────────────────
+def _search_query(domain: str) -> str:
+    return f'"{domain}" product features reviews'
 
-    try:
-        # 1. Web search
-        search_results = search_brand(
-            f'"{ domain}" product features reviews', max_results=10
+
+async def _gather_research(domain: str, *, full: bool = True) -> tuple[list[dict], str]:
+    """Run the Firecrawl search and the homepage scrape concurrently.
+
+    Both sources share a single ``RESEARCH_DEADLINE``; whichever has not
+    finished by then is cancelled and contributes nothing, so the LLM
+    extraction starts with whatever came back in time. *full* selects the
+    Firecrawl search mode (see ``web_search``).
+    """
+    max_results = 10 if full else settings.FIRECRAWL_LITE_MAX_RESULTS
+    search_task = asyncio.create_task(
+        search_brand(_search_query(domain), max_results=max_results, full=full)
+    )
+    scrape_task = asyncio.create_task(_scrape_homepage(domain))
+
+    done, pending = await asyncio.wait(
+        {search_task, scrape_task}, timeout=settings.RESEARCH_DEADLINE
+    )
+    for task in pending:
+        task.cancel()
+        logger.warning(
+            "Research source timed out after %ss | domain=%s source=%s",
+            settings.RESEARCH_DEADLINE,
+            domain,
+            "search" if task is search_task else "homepage",
+        )
+
+    search_results: list[dict] = []
+    if search_task in done:
+        if search_task.exception() is not None:
+            logger.warning(
+                "Firecrawl search failed for %s: %s", domain, search_task.exception()
+            )
+        else:
+            search_results = search_task.result()
+
+    # _scrape_homepage never raises; it returns "" on failure
+    homepage_text = scrape_task.result() if scrape_task in done else ""
+    return search_results, homepage_text
+
+
+# ── Helper: research + extraction ───────────────────────────────────────────
+async def _extract(
+    domain: str,
+    search_results: list[dict],
+    homepage_text: str,
+    prompts_count: int | None = None,
+) -> BrandInfo:
+    """Run the LLM structured extraction over the gathered research.
+
+    With *prompts_count* the response also carries that many evaluation
+    prompts (:class:`BrandResearch`).
+    """
+    # Tokenizing and ranking the passages is CPU-bound: keep it off the loop
+    context = await asyncio.to_thread(
+        build_brand_context, domain, search_results, homepage_text
+    )
+    schema = BrandInfo if prompts_count is None else BrandResearch
+    structured_llm = get_llm("brand_researcher").with_structured_output(schema)
+
+    extraction_prompt = (
+        "You are a brand analyst. Based on the data below, extract structured "
+        "information about the brand/product associated with the domain "
+        f"**{domain}**.\n\n"
+        "--- WEB SEARCH RESULTS ---\n"
+        f"{context.search_text}\n\n"
+        "--- HOMEPAGE TEXT ---\n"
+        f"{context.homepage_text}\n\n"
+        "Return all requested fields. If a field cannot be determined, "
+        "make a reasonable inference or state 'Unknown'."
+    )
+    if prompts_count is not None:
+        extraction_prompt += (
+            f"\n\nAlso write exactly {prompts_count} prompts that someone might "
+            "type into an AI assistant like Perplexity where this brand should "
+            "ideally appear.\n\n--- PROMPT RULES ---\n" + PROMPT_RULES
         )
-        search_text = "\n\n".join(
-            f"**{r.get('title', '')}** ({r.get('url', '')})\n{r.get('content', '')}"
-            for r in search_results
+
+    return await structured_llm.ainvoke(extraction_prompt)  # type: ignore[return-value]
+
+
+async def _research_brand(
+    domain: str, prompts_count: int | None = None
+) -> dict[str, Any]:
+    """Research *domain* and return the LLM-extracted brand context.
+
+    With *prompts_count* the context also has a ``prompts`` list.
+    """
+    lite = settings.FIRECRAWL_LITE_MODE
+
+    # 1. Web search + homepage scrape, concurrently
+    search_results, homepage_text = await _gather_research(domain, full=not lite)
+
+    # 2. LLM structured extraction
+    brand_info = await _extract(domain, search_results, homepage_text, prompts_count)
+
+    # 3. Lite search was not enough: fetch full page content and retry
+    if lite and brand_info.confidence < settings.FIRECRAWL_MIN_CONFIDENCE:
+        logger.info(
+            "[brand_researcher] low confidence, running full search | "
+            "domain=%s confidence=%.2f",
+            domain,
+            brand_info.confidence,
         )
+        try:
+            search_results = await asyncio.wait_for(
+                search_brand(_search_query(domain), max_results=10, full=True),
+                timeout=settings.RESEARCH_DEADLINE,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Full Firecrawl search failed for %s: %s", domain, exc)
+        else:
+            brand_info = await _extract(
+                domain, search_results, homepage_text, prompts_count
+            )
 
-        # 2. Scrape homepage
-        homepage_text = _scrape_homepage(domain)
+    # confidence only steers the lite fallback; it is not brand context
+    return brand_info.model_dump(exclude={"confidence"})
 
-        # 3. LLM structured extraction
-        llm = ChatOpenAI(
-            model=settings.LLM_MODEL,
-            api_key=settings.OPENAI_API_KEY,
-            temperature=0,
-            max_tokens=2048,
+
+# ── Brand context cache (stale-while-revalidate) ────────────────────────────
+_brand_cache: PersistentCache | None = None
+_refreshing: dict[str, asyncio.Task[None]] = {}
+
+
+def _get_brand_cache() -> PersistentCache:
+    global _brand_cache
+    if _brand_cache is None:
+        # Rows outlive their freshness TTL by the stale window so they can
+        # still be served while a refresh runs.
+        _brand_cache = PersistentCache(
+            "brand_context",
+            path=settings.CACHE_DB_PATH,
+            ttl=settings.BRAND_CACHE_TTL + settings.BRAND_CACHE_STALE_TTL,
+            memory_size=128,
         )
-        structured_llm = llm.with_structured_output(BrandInfo)
-
-        extraction_prompt = (
-            "You are a brand analyst. Based on the data below, extract structured "
-            "information about the brand/product associated with the domain "
-            f"**{domain}**.\n\n"
-            "--- WEB SEARCH RESULTS ---\n"
-            f"{search_text}\n\n"
-            "--- HOMEPAGE TEXT ---\n"
-            f"{homepage_text}\n\n"
-            "Return all requested fields. If a field cannot be determined, "
-            "make a reasonable inference or state 'Unknown'."
+    return _brand_cache
+
+
+def _brand_cache_key(domain: str) -> str:
+    return PersistentCache.make_key(domain, model_for("brand_researcher"))
+
+
+async def _refresh_brand(domain: str, key: str) -> None:
+    """Re-research *domain* in the background and overwrite its cache entry."""
+    try:
+        await _get_brand_cache().aset(key, await _research_brand(domain))
+        logger.info("[brand_researcher] background refresh done | domain=%s", domain)
+    except Exception:  # noqa: BLE001
+        logger.exception(
+            "[brand_researcher] background refresh failed | domain=%s", domain
         )
+    finally:
+        _refreshing.pop(key, None)
 
-        brand_info: BrandInfo = structured_llm.invoke(extraction_prompt)  # type: ignore[assignment]
 
-        brand_context = brand_info.model_dump()
+async def _cached_research(
+    domain: str, force_refresh: bool, prompts_count: int | None = None
+) -> dict[str, Any]:
+    """Return brand context from the cache when possible, researching otherwise.
+
+    Fresh entries are returned as is. Stale entries (older than
+    ``BRAND_CACHE_TTL`` but within the stale window) are returned immediately
+    while a single background refresh per key updates the cache.
+
+    *prompts_count* is passed on to a fresh research; the prompts it returns
+    are handed back but never cached.
+    """
+    if not settings.BRAND_CACHE_ENABLED:
+        return await _research_brand(domain, prompts_count)
+
+    cache = _get_brand_cache()
+    key = _brand_cache_key(domain)
+    entry = None if force_refresh else await cache.aget_entry(key)
+
+    if entry is None:
+        research = await _research_brand(domain, prompts_count)
+        await cache.aset(key, _brand_context(research))
+        return research
+
+    if entry.age > settings.BRAND_CACHE_TTL and key not in _refreshing:
+        logger.info("[brand_researcher] serving stale context | domain=%s", domain)
+        _refreshing[key] = asyncio.create_task(_refresh_brand(domain, key))
+    else:
+        logger.info("[brand_researcher] cache hit | domain=%s", domain)
+    return entry.value
+
+
+# ── Node function ───────────────────────────────────────────────────────────
+async def brand_researcher(state: AgentState) -> dict[str, Any]:
+    """Research the brand and store structured context in state."""
+    domain = state["domain"]
+    logger.info("[brand_researcher] START | domain=%s", domain)
+
+    count = state.get("prompts_count", settings.PROMPTS_COUNT)
+    # Reused prompts (see graph.run_graph) need no new ones
+    fused = settings.FUSED_PROMPT_GENERATION and not state.get("generated_prompts")
+
+    force_refresh = state.get("force_refresh", False)
+    rival_domains = state.get("competitor_domains") or []
+
+    try:
+        research, *rivals = await asyncio.gather(
+            _cached_research(
+                domain,
+                force_refresh=force_refresh,
+                prompts_count=count if fused else None,
+            ),
+            *(_cached_research(d, force_refresh=force_refresh) for d in rival_domains),
+            return_exceptions=True,
+        )
+        if isinstance(research, BaseException):
+            raise research
+        researched: list[tuple[str, dict[str, Any]]] = []
+        failed: list[dict[str, str]] = []
+        for d, rival in zip(rival_domains, rivals):
+            if isinstance(rival, BaseException):
+                logger.warning(
+                    "[brand_researcher] competitor dropped | domain=%s error=%s",
+                    d,
+                    rival,
+                )
+                failed.append(
+                    {"domain": d, "error": str(rival) or type(rival).__name__}
+                )
+            else:
+                researched.append((d, _brand_context(rival)))
+        brand_context = _brand_context(research)
+        prompts = [p for p in research.get("prompts") or [] if p.strip()][:count]
         logger.info(
-            "[brand_researcher] DONE | brand_name=%s", brand_context["brand_name"]
+            "[brand_researcher] DONE | brand_name=%s fused_prompts=%d",
+            brand_context["brand_name"],
+            len(prompts),
         )
-        return {
+        update: dict[str, Any] = {
             "brand_name": brand_context["brand_name"],
             "brand_context": brand_context,
         }
+        if prompts:
+            update["generated_prompts"] = prompts
+        if rival_domains:
+            update["comparison"] = [
+                {
+                    "domain": d,
+                    "brand_name": context["brand_name"],
+                    "brand_context": context,
+                }
+                for d, context in [(domain, brand_context), *researched]
+            ]
+            update["comparison_failed"] = failed
+        return update
 
     except Exception as exc:  # noqa: BLE001
         logger.exception("[brand_researcher] ERROR | domain=%s", domain)
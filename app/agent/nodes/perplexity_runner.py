@@ -1,41 +1,110 @@
 """Node 3 — Perplexity Runner.
 
-Runs all generated prompts against Perplexity in parallel using
-concurrent.futures and builds a list of PerplexityResult objects.
+Runs all generated prompts against Perplexity concurrently on the event loop
+and builds a list of PerplexityResult objects. How many queries are actually
+in flight is decided by the adaptive limiter in ``app.agent.tools.perplexity``.
+
+Brand mentions are detected with a :class:`~app.agent.matcher.BrandMatcher`
+built once per run from the brand name, its aliases, the domain and the
+researched competitors (or, in comparative mode, the compared brands); the
+same scan counts competitor mentions for the share-of-voice metrics.
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
-import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import replace
 from typing import Any
 
+from app.agent.matcher import BrandMatcher, Mention, competitor_terms
+from app.agent.raw_store import put_raw
 from app.agent.state import AgentState, PerplexityResult
 from app.agent.tools.perplexity import query_perplexity
-from app.config import settings
 
 logger = logging.getLogger(__name__)
 
 
-def _extract_mention_context(text: str, brand_name: str) -> str:
-    """Return the sentence(s) in *text* that mention *brand_name*."""
-    sentences = re.split(r"(?<=[.!?])\s+", text)
-    matches = [
-        s.strip()
-        for s in sentences
-        if brand_name.lower() in s.lower()
+def brand_matcher(state: AgentState) -> BrandMatcher:
+    """Return the matcher for the brand being evaluated in *state*.
+
+    In comparative mode the competitors are the other compared brands, with
+    their domains and aliases; otherwise the researched competitor names.
+    """
+    brand_context = state.get("brand_context") or {}
+    competitors: list[Any] = [
+        competitor_terms(
+            brand["brand_name"],
+            brand["domain"],
+            brand["brand_context"].get("aliases") or (),
+        )
+        for brand in state.get("comparison") or []
+        if brand["domain"] != state["domain"]
+    ] or list(brand_context.get("competitors") or ())
+    return BrandMatcher.for_brand(
+        state["brand_name"],
+        state["domain"],
+        brand_context.get("aliases") or (),
+        competitors,
+    )
+
+
+def _entity_mentions(mentions: list[Mention]) -> tuple[tuple[str, int], ...]:
+    """(entity, mention count) pairs in order of each entity's first mention."""
+    counts: dict[str, int] = {}
+    for mention in mentions:
+        counts[mention.entity] = counts.get(mention.entity, 0) + 1
+    return tuple(counts.items())
+
+
+def _score(completion: str, matcher: BrandMatcher) -> dict[str, Any]:
+    """Brand and competitor detection: one pass over *completion*, context
+    sliced around the brand's matches."""
+    mentions = matcher.find(completion)
+    own = [m for m in mentions if m.entity == matcher.brand]
+    return {
+        "brand_mentioned": bool(own),
+        "brand_mention_context": matcher.context(completion, own) if own else "",
+        "entity_mentions": _entity_mentions(mentions),
+    }
+
+
+def rescore(
+    results: list[PerplexityResult], matcher: BrandMatcher
+) -> list[PerplexityResult]:
+    """Score the same completions for another brand; no API calls."""
+    return [
+        r if r.failed else replace(r, **_score(r.completion, matcher))
+        for r in results
     ]
-    return " ".join(matches) if matches else ""
 
 
-def _run_single_prompt(
+def _usage_counters(raw: dict[str, Any]) -> dict[str, Any]:
+    """Pull billed token / cost counters out of a normalised Perplexity payload.
+
+    A cached or coalesced response was paid for by an earlier call, so it
+    reports zero usage.
+    """
+    if raw.get("served_from"):
+        return {"served_from": raw["served_from"]}
+    usage = raw.get("usage") or {}
+    cost = usage.get("cost") or {}
+    return {
+        "input_tokens": usage.get("input_tokens") or usage.get("prompt_tokens") or 0,
+        "output_tokens": (
+            usage.get("output_tokens") or usage.get("completion_tokens") or 0
+        ),
+        "cost_usd": cost.get("total_cost") or 0.0,
+    }
+
+
+async def _run_single_prompt(
     prompt: str,
-    brand_name: str,
+    matcher: BrandMatcher,
 ) -> PerplexityResult:
     """Query Perplexity for a single prompt and return a PerplexityResult."""
     try:
-        raw = query_perplexity(prompt)
+        raw = await query_perplexity(prompt)
 
         # Extract completion text
         completion = ""
@@ -46,23 +115,15 @@ def _run_single_prompt(
                 completion = choice.get("message", {}).get("content", "")
 
         # Extract citations
-        citations: list[str] = raw.get("citations", [])
-
-        # Brand detection (case-insensitive)
-        brand_mentioned = brand_name.lower() in completion.lower()
-        mention_context = (
-            _extract_mention_context(completion, brand_name)
-            if brand_mentioned
-            else ""
-        )
+        citations = tuple(raw.get("citations", []))
 
         return PerplexityResult(
             prompt=prompt,
-            raw_response=raw,
             completion=completion,
             citations=citations,
-            brand_mentioned=brand_mentioned,
-            brand_mention_context=mention_context,
+            **_score(completion, matcher),
+            raw_ref=await put_raw(raw),
+            **_usage_counters(raw),
         )
 
     except Exception as exc:  # noqa: BLE001
@@ -73,18 +134,30 @@ def _run_single_prompt(
         )
         return PerplexityResult(
             prompt=prompt,
-            raw_response={"error": str(exc)},
             completion="",
-            citations=[],
+            citations=(),
             brand_mentioned=False,
             brand_mention_context="",
+            failed=True,
+            error=str(exc) or type(exc).__name__,
         )
 
 
-def perplexity_runner(state: AgentState) -> dict[str, Any]:
-    """Run all prompts against Perplexity in parallel."""
+def _all_failed_error(results: list[PerplexityResult]) -> str | None:
+    """Return an error message if every query failed, else None.
+
+    A run in which nothing came back has no exposure rate to report; 0% would
+    misrepresent an outage as a brand that is never mentioned.
+    """
+    if results and all(r.failed for r in results):
+        return f"All {len(results)} Perplexity queries failed: {results[0].error}"
+    return None
+
+
+async def perplexity_runner(state: AgentState) -> dict[str, Any]:
+    """Run all prompts against Perplexity concurrently."""
     prompts = state["generated_prompts"]
-    brand_name = state["brand_name"]
+    matcher = brand_matcher(state)
     domain = state["domain"]
     logger.info(
         "[perplexity_runner] START | domain=%s prompts=%d",
@@ -93,21 +166,23 @@ def perplexity_runner(state: AgentState) -> dict[str, Any]:
     )
 
     try:
-        results: list[PerplexityResult] = []
-        max_workers = min(settings.PERPLEXITY_MAX_WORKERS, len(prompts))
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(_run_single_prompt, prompt, brand_name): prompt
-                for prompt in prompts
-            }
-            for future in as_completed(futures):
-                results.append(future.result())
+        results: list[PerplexityResult] = list(
+            await asyncio.gather(
+                *(_run_single_prompt(prompt, matcher) for prompt in prompts)
+            )
+        )
+
+        error = _all_failed_error(results)
+        if error:
+            return {"error": error}
 
         mentioned = sum(1 for r in results if r.brand_mentioned)
+        failed = sum(1 for r in results if r.failed)
         logger.info(
-            "[perplexity_runner] DONE | mentioned=%d/%d",
+            "[perplexity_runner] DONE | mentioned=%d/%d failed=%d",
             mentioned,
-            len(results),
+            len(results) - failed,
+            failed,
         )
         return {"perplexity_results": results}
 
@@ -8,19 +8,15 @@ from __future__ import annotations
 
 import json
 import logging
-from typing import Any
-
-from langchain_openai import ChatOpenAI
+from typing import Any, AsyncIterator
 
+from app.agent.llm import get_llm
 from app.agent.state import AgentState
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-GENERATION_SYSTEM = (
-    "You are an expert at writing realistic search queries that real people "
-    "type into AI assistants like Perplexity. You will be given context about "
-    "a brand and must generate exactly {count} prompts.\n\n"
+PROMPT_RULES = (
     "RULES:\n"
     "- Prompts must NOT mention the brand by name.\n"
     "- They should be generic queries in the brand's domain/market.\n"
@@ -31,12 +27,121 @@ GENERATION_SYSTEM = (
     "  • Alternative queries (\"What are alternatives to [competitor]?\")\n"
     "  • Discovery queries (\"What are the top X tools in [market category]?\")\n"
     "- Prompts should be at the difficulty/specificity level an informed user "
-    "in this domain would ask.\n\n"
-    "Return ONLY a JSON array of exactly {count} strings. No explanation."
+    "in this domain would ask.\n"
+)
+
+GENERATION_SYSTEM = (
+    "You are an expert at writing realistic search queries that real people "
+    "type into AI assistants like Perplexity. You will be given context about "
+    "a brand and must generate exactly {count} prompts.\n\n"
+    + PROMPT_RULES
+    + "\nReturn ONLY a JSON array of exactly {count} strings. No explanation."
 )
 
 
-def prompt_generator(state: AgentState) -> dict[str, Any]:
+class PromptStreamParser:
+    """Incremental parser for a JSON array of strings arriving in chunks.
+
+    ``feed`` accepts any slice of the LLM output and returns the strings
+    whose closing quote was seen in that slice, so each prompt can be acted
+    upon as soon as the model has finished writing it. Anything before the
+    opening ``[`` (e.g. a markdown fence) and anything after the closing
+    ``]`` is ignored.
+    """
+
+    def __init__(self) -> None:
+        self._started = False
+        self._finished = False
+        self._in_string = False
+        self._escaped = False
+        self._depth = 0
+        self._buf: list[str] = []
+
+    @property
+    def finished(self) -> bool:
+        """True once the top-level array has been closed."""
+        return self._finished
+
+    def feed(self, chunk: str) -> list[str]:
+        """Consume *chunk* and return every string element completed by it."""
+        completed: list[str] = []
+        for ch in chunk:
+            if self._finished:
+                break
+            if not self._started:
+                if ch == "[":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._buf.append(ch)
+                    self._escaped = False
+                elif ch == "\\":
+                    self._buf.append(ch)
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        completed.append(json.loads('"' + "".join(self._buf) + '"'))
+                    self._buf = []
+                else:
+                    self._buf.append(ch)
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finished = True
+        return completed
+
+
+def _build_messages(brand_context: dict, count: int) -> list[dict[str, str]]:
+    """Return the chat messages asking the LLM for *count* prompts."""
+    user_msg = (
+        "Here is the brand context:\n\n"
+        f"{json.dumps(brand_context, indent=2)}\n\n"
+        f"Generate exactly {count} prompts following the rules in the system message."
+    )
+    return [
+        {"role": "system", "content": GENERATION_SYSTEM.format(count=count)},
+        {"role": "user", "content": user_msg},
+    ]
+
+
+def _content_text(content: Any) -> str:
+    """Flatten LangChain message content (str or content blocks) to text."""
+    if isinstance(content, list):
+        # LangChain may return content blocks
+        return "".join(
+            block.get("text", "") if isinstance(block, dict) else str(block)
+            for block in content
+        )
+    return str(content)
+
+
+async def stream_prompts(brand_context: dict, count: int) -> AsyncIterator[str]:
+    """Stream prompts from the LLM, yielding each one as soon as it closes.
+
+    At most *count* prompts are yielded; the LLM stream is abandoned once
+    that many have been produced or the JSON array is closed.
+    """
+    parser = PromptStreamParser()
+    emitted = 0
+    async for chunk in get_llm("prompt_generator").astream(_build_messages(brand_context, count)):
+        for prompt in parser.feed(_content_text(chunk.content)):
+            yield prompt
+            emitted += 1
+            if emitted >= count:
+                return
+        if parser.finished:
+            return
+
+
+async def prompt_generator(state: AgentState) -> dict[str, Any]:
     """Generate Perplexity-style prompts from the brand context."""
     brand_context = state["brand_context"]
     domain = state["domain"]
@@ -44,37 +149,13 @@ def prompt_generator(state: AgentState) -> dict[str, Any]:
     logger.info("[prompt_generator] START | domain=%s | count=%d", domain, count)
 
     try:
-        llm = ChatOpenAI(
-            model=settings.LLM_MODEL,
-            api_key=settings.OPENAI_API_KEY,
-            temperature=0.7,
-            max_tokens=2048,
-        )
-
-        user_msg = (
-            "Here is the brand context:\n\n"
-            f"{json.dumps(brand_context, indent=2)}\n\n"
-            f"Generate exactly {count} prompts following the rules in the system message."
-        )
-
-        response = llm.invoke(
-            [
-                {"role": "system", "content": GENERATION_SYSTEM.format(count=count)},
-                {"role": "user", "content": user_msg},
-            ]
-        )
+        response = await get_llm("prompt_generator").ainvoke(_build_messages(brand_context, count))
 
         # Parse the JSON array from the response
-        raw = response.content
-        if isinstance(raw, list):
-            # LangChain may return content blocks
-            raw = "".join(
-                block["text"] if isinstance(block, dict) else str(block)
-                for block in raw
-            )
+        raw = _content_text(response.content)
 
         # Extract JSON array from potential markdown fences
-        text = str(raw).strip()
+        text = raw.strip()
         if text.startswith("```"):
             text = text.split("\n", 1)[1]  # remove opening fence line
             text = text.rsplit("```", 1)[0]  # remove closing fence
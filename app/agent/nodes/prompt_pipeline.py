@@ -0,0 +1,70 @@
+"""Node 2+3 — Streaming Prompt Pipeline.
+
+Fuses prompt generation and Perplexity querying: the LLM output is parsed
+incrementally and every prompt is dispatched to Perplexity the moment its
+JSON string closes, so generation latency overlaps with the first queries.
+Used instead of ``prompt_generator`` → ``perplexity_runner`` when
+``PROMPT_STREAMING`` is enabled.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+
+from app.agent.nodes.perplexity_runner import (
+    _all_failed_error,
+    _run_single_prompt,
+    brand_matcher,
+)
+from app.agent.nodes.prompt_generator import stream_prompts
+from app.agent.state import AgentState, PerplexityResult
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def prompt_pipeline(state: AgentState) -> dict[str, Any]:
+    """Generate prompts and query Perplexity for each one as it streams in."""
+    brand_context = state["brand_context"]
+    matcher = brand_matcher(state)
+    domain = state["domain"]
+    count = state.get("prompts_count", settings.PROMPTS_COUNT)
+    logger.info("[prompt_pipeline] START | domain=%s | count=%d", domain, count)
+
+    prompts: list[str] = []
+    tasks: list[asyncio.Task[PerplexityResult]] = []
+    try:
+        async for prompt in stream_prompts(brand_context, count):
+            logger.info(
+                "[prompt_pipeline] dispatch #%d | prompt=%s",
+                len(prompts) + 1,
+                prompt[:60],
+            )
+            prompts.append(prompt)
+            tasks.append(asyncio.create_task(_run_single_prompt(prompt, matcher)))
+
+        if not prompts:
+            raise ValueError("LLM did not return a valid list of prompts")
+
+        results: list[PerplexityResult] = list(await asyncio.gather(*tasks))
+        error = _all_failed_error(results)
+        if error:
+            return {"error": error}
+
+        mentioned = sum(1 for r in results if r.brand_mentioned)
+        failed = sum(1 for r in results if r.failed)
+        logger.info(
+            "[prompt_pipeline] DONE | mentioned=%d/%d failed=%d",
+            mentioned,
+            len(results) - failed,
+            failed,
+        )
+        return {"generated_prompts": prompts, "perplexity_results": results}
+
+    except Exception as exc:  # noqa: BLE001
+        for task in tasks:
+            task.cancel()
+        logger.exception("[prompt_pipeline] ERROR | domain=%s", domain)
+        return {"error": f"Prompt pipeline failed: {exc}"}
@@ -1,106 +1,336 @@
 """Node 4 — Report Generator.
 
 Aggregates Perplexity results into a structured ExposureReport.
+
+The narrative summary depends on ``SUMMARY_MODE``:
+
+* ``inline`` — written by the LLM before the report is returned;
+* ``deferred`` — the report is returned at once with ``summary_status``
+  ``pending`` and the LLM summary is produced in the background (see
+  ``app.agent.summaries``), to be fetched by ``report_id``;
+* ``template`` — a local, template-based summary; no LLM call.
+
+Once the reports are built, every successful answer is added to the local
+answer corpus (``app.agent.corpus``) under the brand's market category, and
+every report to the run store (``app.agent.run_store``) for trend queries,
+competitor reports flagged as comparison runs. Both writes run in worker
+threads, off the event loop.
+
+Citations are reduced to registrable domains (``app.agent.citations``):
+each example lists its source domains and whether the brand's own domain
+is among them, and the report ranks the most cited domains.
+
+Share of voice compares the brand with the researched competitors using the
+per-entity mention counts the Perplexity runner recorded in its single scan
+of each completion; no extra API calls are made.
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import uuid
 from datetime import datetime, timezone
 from typing import Any
 
-from langchain_openai import ChatOpenAI
-
-from app.agent.state import AgentState
+from app.agent import citations, corpus, run_store, summaries
+from app.agent.llm import get_llm
+from app.agent.nodes.perplexity_runner import brand_matcher, rescore
+from app.agent.state import AgentState, PerplexityResult
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
 
-def report_generator(state: AgentState) -> dict[str, Any]:
-    """Compute metrics and build the final exposure report."""
+SUMMARY_SYSTEM = (
+    "You are a marketing analyst. Write a concise 2–3 sentence "
+    "narrative summarising the brand's exposure on Perplexity AI. "
+    "Be factual and actionable."
+)
+
+
+def _summary_input(facts: dict[str, Any]) -> str:
+    return (
+        f"Brand: {facts['brand_name']}\n"
+        f"Domain: {facts['domain']}\n"
+        f"Exposure rate: {facts['exposure_rate']:.1f}% "
+        f"({facts['mentioned']}/{facts['evaluated']} prompts"
+        + (f", {facts['failed']} failed to run" if facts["failed"] else "")
+        + ")\n\n"
+        "The brand appeared in the following prompts:\n"
+        + "\n".join(f"- {p}" for p in facts["appeared"])
+        + "\n\nThe brand did NOT appear in:\n"
+        + "\n".join(f"- {p}" for p in facts["not_appeared"])
+        + (
+            "\n\nShare of voice (answers mentioning each):\n"
+            + "\n".join(
+                f"- {e['entity']}: {e['prompts_mentioned']} answers, "
+                f"{e['share_of_voice']:.1f}% of mentions"
+                for e in facts["share_of_voice"]
+            )
+            if len(facts["share_of_voice"]) > 1
+            else ""
+        )
+    )
+
+
+async def generate_summary(facts: dict[str, Any]) -> str:
+    """Ask the LLM for the 2–3 sentence narrative summary."""
+    response = await get_llm("report_generator").ainvoke(
+        [
+            {"role": "system", "content": SUMMARY_SYSTEM},
+            {"role": "user", "content": _summary_input(facts)},
+        ]
+    )
+    return str(response.content).strip()
+
+
+def template_summary(facts: dict[str, Any]) -> str:
+    """A deterministic summary built from the metrics alone."""
+    brand = facts["brand_name"] or facts["domain"]
+    parts = [
+        f"{brand} appeared in {facts['mentioned']} of {facts['evaluated']} "
+        f"Perplexity answers ({facts['exposure_rate']:.1f}% exposure)."
+    ]
+    if facts["not_appeared"]:
+        parts.append(
+            f"It was missing from {len(facts['not_appeared'])} prompts, "
+            f"for example \"{facts['not_appeared'][0]}\"."
+        )
+    elif facts["evaluated"]:
+        parts.append("It was mentioned in every answer evaluated.")
+    rivals = [e for e in facts["share_of_voice"] if not e["is_brand"]]
+    if rivals:
+        top = max(rivals, key=lambda e: (e["prompts_mentioned"], e["mentions"]))
+        if top["prompts_mentioned"]:
+            parts.append(
+                f"The most visible competitor was {top['entity']}, named in "
+                f"{top['prompts_mentioned']} answers."
+            )
+    if facts["failed"]:
+        parts.append(f"{facts['failed']} prompts failed to run and were not counted.")
+    return " ".join(parts)
+
+
+def share_of_voice(
+    results: list[PerplexityResult], entities: tuple[str, ...], brand: str
+) -> tuple[list[dict[str, Any]], dict[str, dict[str, int]]]:
+    """Per-entity visibility and the co-mention matrix over successful answers.
+
+    For each entity: total mentions, answers naming it, its share of all
+    entity mentions, how often it was named first and its average rank by
+    first mention. ``co_mentions[a][b]`` is the number of answers naming both
+    *a* and *b* (the diagonal is the entity's own answer count).
+    """
+    mentions = dict.fromkeys(entities, 0)
+    first = dict.fromkeys(entities, 0)
+    rank_sum = dict.fromkeys(entities, 0)
+    co_mentions = {a: dict.fromkeys(entities, 0) for a in entities}
+
+    for r in results:
+        if r.failed:
+            continue
+        named = [(e, count) for e, count in r.entity_mentions if e in mentions]
+        for rank, (entity, count) in enumerate(named, start=1):
+            mentions[entity] += count
+            rank_sum[entity] += rank
+            if rank == 1:
+                first[entity] += 1
+            for other, _ in named:
+                co_mentions[entity][other] += 1
+
+    total = sum(mentions.values())
+    rows = [
+        {
+            "entity": entity,
+            "is_brand": entity == brand,
+            "mentions": mentions[entity],
+            "prompts_mentioned": co_mentions[entity][entity],
+            "share_of_voice": (
+                round(mentions[entity] / total * 100, 1) if total else 0.0
+            ),
+            "first_mentions": first[entity],
+            "avg_first_mention_rank": (
+                round(rank_sum[entity] / co_mentions[entity][entity], 2)
+                if co_mentions[entity][entity]
+                else None
+            ),
+        }
+        for entity in entities
+    ]
+    return rows, co_mentions
+
+
+async def _build_report(state: AgentState, *, billed: bool = True) -> dict[str, Any]:
+    """Compute metrics and build the exposure report for the brand in *state*.
+
+    With *billed* false the report's ``usage`` is left at zero: competitor
+    reports rescore answers whose cost is already on the brand's report.
+    """
     domain = state["domain"]
     brand_name = state["brand_name"]
     results = state["perplexity_results"]
+
+    total = len(results)
+    failed_count = sum(1 for r in results if r.failed)
+    evaluated = total - failed_count
+    mentioned_count = sum(1 for r in results if r.brand_mentioned)
+    not_mentioned_count = evaluated - mentioned_count
+    # Failed queries are neither hits nor misses, so they are left out of the rate
+    exposure_rate = (mentioned_count / evaluated * 100) if evaluated > 0 else 0.0
+
+    # Build appeared / not-appeared / failed sections
+    appeared_examples: list[dict[str, Any]] = []
+    not_appeared_examples: list[dict[str, Any]] = []
+    failed_examples: list[dict[str, Any]] = []
+
+    own_domain = citations.registrable_domain(domain)
+    for r in results:
+        if r.failed:
+            failed_examples.append({"prompt": r.prompt, "error": r.error})
+            continue
+        domains = citations.source_domains(r.citations)
+        sources = {
+            "sources": list(r.citations),
+            "source_domains": domains,
+            "own_domain_cited": own_domain in domains,
+        }
+        if r.brand_mentioned:
+            appeared_examples.append(
+                {
+                    "prompt": r.prompt,
+                    "mention_context": r.brand_mention_context,
+                    **sources,
+                }
+            )
+        else:
+            not_appeared_examples.append(
+                {
+                    "prompt": r.prompt,
+                    **sources,
+                    "completion_summary": r.completion[:300] if r.completion else "",
+                }
+            )
+    cited = citations.analyse(results, domain, top=settings.CITATION_TOP_DOMAINS)
+
+    matcher = brand_matcher(state)
+    voice, co_mentions = share_of_voice(results, matcher.entities, matcher.brand)
+
+    # Narrative summary (inline, deferred or template; see module docstring)
+    facts = {
+        "domain": domain,
+        "brand_name": brand_name,
+        "exposure_rate": exposure_rate,
+        "mentioned": mentioned_count,
+        "evaluated": evaluated,
+        "failed": failed_count,
+        "appeared": [e["prompt"] for e in appeared_examples],
+        "not_appeared": [e["prompt"] for e in not_appeared_examples],
+        "share_of_voice": voice,
+    }
+    mode = settings.SUMMARY_MODE
+    report_id = uuid.uuid4().hex
+    if mode == "deferred":
+        await summaries.schedule(
+            report_id,
+            lambda: generate_summary(facts),
+            fallback=template_summary(facts),
+        )
+        summary_text, summary_status = "", summaries.PENDING
+    elif mode == "template":
+        summary_text, summary_status = template_summary(facts), summaries.READY
+    else:
+        summary_text, summary_status = await generate_summary(facts), summaries.READY
+
+    report = {
+        "report_id": report_id,
+        "domain": domain,
+        "brand_name": brand_name,
+        "exposure_rate": round(exposure_rate, 1),
+        "total_prompts": total,
+        "brand_mentioned_count": mentioned_count,
+        "brand_not_mentioned_count": not_mentioned_count,
+        "failed_prompts_count": failed_count,
+        "appeared_examples": appeared_examples,
+        "not_appeared_examples": not_appeared_examples,
+        "failed_examples": failed_examples,
+        "share_of_voice": voice,
+        "co_mentions": co_mentions,
+        "citation_domains": cited["top_domains"],
+        "own_domain_cited_count": cited["own_domain_cited_count"],
+        "usage": (
+            {
+                "input_tokens": sum(r.input_tokens for r in results),
+                "output_tokens": sum(r.output_tokens for r in results),
+                "cost_usd": round(sum(r.cost_usd for r in results), 6),
+                "unbilled_prompts": sum(1 for r in results if r.served_from),
+            }
+            if billed
+            else {}
+        ),
+        "summary": summary_text,
+        "summary_status": summary_status,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    return report
+
+
+async def report_generator(state: AgentState) -> dict[str, Any]:
+    """Compute metrics and build the final exposure report.
+
+    In comparative mode a report is also built for every other compared brand,
+    from the same completions rescored with that brand's matcher. Those
+    reports carry no usage; the shared spend is on the brand's report.
+    """
+    domain = state["domain"]
     logger.info("[report_generator] START | domain=%s", domain)
 
     try:
-        total = len(results)
-        mentioned_count = sum(1 for r in results if r.brand_mentioned)
-        not_mentioned_count = total - mentioned_count
-        exposure_rate = (mentioned_count / total * 100) if total > 0 else 0.0
-
-        # Build appeared / not-appeared sections
-        appeared_examples: list[dict[str, Any]] = []
-        not_appeared_examples: list[dict[str, Any]] = []
-
-        for r in results:
-            if r.brand_mentioned:
-                appeared_examples.append(
-                    {
-                        "prompt": r.prompt,
-                        "mention_context": r.brand_mention_context,
-                        "sources": r.citations,
-                    }
+        report = await _build_report(state)
+        update: dict[str, Any] = {"report": report}
+
+        rivals = [b for b in state.get("comparison") or [] if b["domain"] != domain]
+        if rivals:
+            rival_states: list[AgentState] = []
+            for brand in rivals:
+                rival_state: AgentState = {
+                    **state,
+                    "domain": brand["domain"],
+                    "brand_name": brand["brand_name"],
+                    "brand_context": brand["brand_context"],
+                }
+                rival_state["perplexity_results"] = rescore(
+                    state["perplexity_results"], brand_matcher(rival_state)
                 )
-            else:
-                not_appeared_examples.append(
-                    {
-                        "prompt": r.prompt,
-                        "sources": r.citations,
-                        "completion_summary": r.completion[:300] if r.completion else "",
-                    }
+                rival_states.append(rival_state)
+            update["comparison_reports"] = list(
+                await asyncio.gather(
+                    *(_build_report(s, billed=False) for s in rival_states)
                 )
-
-        # LLM-generated narrative summary
-        summary_input = (
-            f"Brand: {brand_name}\n"
-            f"Domain: {domain}\n"
-            f"Exposure rate: {exposure_rate:.1f}% ({mentioned_count}/{total} prompts)\n\n"
-            "The brand appeared in the following prompts:\n"
-            + "\n".join(f"- {e['prompt']}" for e in appeared_examples)
-            + "\n\nThe brand did NOT appear in:\n"
-            + "\n".join(f"- {e['prompt']}" for e in not_appeared_examples)
-        )
-
-        llm = ChatOpenAI(
-            model=settings.LLM_MODEL,
-            api_key=settings.OPENAI_API_KEY,
-            temperature=0,
-            max_tokens=512,
-        )
-        summary_response = llm.invoke(
-            [
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a marketing analyst. Write a concise 2–3 sentence "
-                        "narrative summarising the brand's exposure on Perplexity AI. "
-                        "Be factual and actionable."
-                    ),
-                },
-                {"role": "user", "content": summary_input},
-            ]
+            )
+            for rival_state, rival_report in zip(
+                rival_states, update["comparison_reports"]
+            ):
+                await asyncio.to_thread(
+                    run_store.record,
+                    rival_report,
+                    rival_state["perplexity_results"],
+                    comparison=True,
+                )
+        await asyncio.to_thread(run_store.record, report, state["perplexity_results"])
+        await asyncio.to_thread(
+            corpus.record,
+            (state.get("brand_context") or {}).get("market_category", ""),
+            domain,
+            state["perplexity_results"],
         )
-        summary_text = str(summary_response.content).strip()
-
-        report = {
-            "domain": domain,
-            "brand_name": brand_name,
-            "exposure_rate": round(exposure_rate, 1),
-            "total_prompts": total,
-            "brand_mentioned_count": mentioned_count,
-            "brand_not_mentioned_count": not_mentioned_count,
-            "appeared_examples": appeared_examples,
-            "not_appeared_examples": not_appeared_examples,
-            "summary": summary_text,
-            "generated_at": datetime.now(timezone.utc).isoformat(),
-        }
 
         logger.info(
-            "[report_generator] DONE | exposure_rate=%.1f%%", exposure_rate
+            "[report_generator] DONE | exposure_rate=%.1f%% compared=%d",
+            report["exposure_rate"],
+            len(rivals),
         )
-        return {"report": report}
+        return update
 
     except Exception as exc:  # noqa: BLE001
         logger.exception("[report_generator] ERROR | domain=%s", domain)
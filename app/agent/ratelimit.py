@@ -0,0 +1,201 @@
+"""Token-bucket rate limiting for outbound provider calls.
+
+Every outbound call to Perplexity, OpenAI and Firecrawl takes a token from
+its provider's bucket first. A bucket refills at ``rate`` tokens per second
+up to ``burst``; a caller that finds it empty is not rejected but *reserves*
+the next token and sleeps until it becomes available, so bursts from many
+concurrent ``/evaluate`` requests are smoothed into a steady outbound rate.
+
+Bucket state lives in a backend:
+
+* ``memory`` — per process (the default);
+* ``sqlite`` — a small SQLite file shared by every uvicorn worker on the
+  host, updated inside an ``IMMEDIATE`` transaction so workers never hand
+  out the same token twice.
+
+A provider whose rate is ``0`` is not limited.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Protocol
+
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from app.config import settings
+
+
+class BucketBackend(Protocol):
+    def reserve(self, key: str, rate: float, burst: int) -> float:
+        """Take one token from bucket *key*; return seconds to wait for it."""
+        ...
+
+
+def _take(
+    tokens: float, updated_at: float, now: float, rate: float, burst: int
+) -> float:
+    """Refill a bucket up to *now* and take one token (may go negative)."""
+    return min(float(burst), tokens + (now - updated_at) * rate) - 1.0
+
+
+class MemoryBucketBackend:
+    """Process-local bucket state."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def reserve(self, key: str, rate: float, burst: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated_at = self._buckets.get(key, (float(burst), now))
+            tokens = _take(tokens, updated_at, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+        return max(0.0, -tokens / rate)
+
+
+class SQLiteBucketBackend:
+    """Bucket state shared between processes through a SQLite file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def reserve(self, key: str, rate: float, burst: int) -> float:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Wall-clock time: monotonic clocks are not comparable across processes.
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (float(burst), now)
+            tokens = _take(tokens, updated_at, now, rate, burst)
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, "
+                "updated_at = excluded.updated_at",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return max(0.0, -tokens / rate)
+
+
+class RateLimiter:
+    """Token bucket for one provider."""
+
+    def __init__(
+        self, provider: str, rate: float, burst: int, backend: BucketBackend
+    ) -> None:
+        self.provider = provider
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.backend = backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _reserve(self) -> float:
+        return self.backend.reserve(self.provider, self.rate, self.burst)
+
+    async def acquire(self) -> None:
+        """Wait (without blocking the loop) until this caller's token is due."""
+        if not self.enabled:
+            return
+        if isinstance(self.backend, SQLiteBucketBackend):
+            delay = await asyncio.to_thread(self._reserve)
+        else:
+            delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self) -> None:
+        """Blocking variant of :meth:`acquire` for synchronous call sites."""
+        if not self.enabled:
+            return
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class LangChainRateLimiter(BaseRateLimiter):
+    """Adapter so ``ChatOpenAI(rate_limiter=...)`` draws from a :class:`RateLimiter`."""
+
+    def __init__(self, limiter: RateLimiter) -> None:
+        self.limiter = limiter
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        self.limiter.acquire_sync()
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        await self.limiter.acquire()
+        return True
+
+
+# ── Registry ────────────────────────────────────────────────────────────────
+
+_backend: BucketBackend | None = None
+_limiters: dict[str, RateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_backend() -> BucketBackend:
+    global _backend
+    if _backend is None:
+        if settings.RATE_LIMIT_BACKEND == "sqlite":
+            _backend = SQLiteBucketBackend(settings.RATE_LIMIT_DB_PATH)
+        else:
+            _backend = MemoryBucketBackend()
+    return _backend
+
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    """Return the shared limiter for ``perplexity``, ``openai`` or ``firecrawl``."""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _registry_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                prefix = provider.upper()
+                limiter = RateLimiter(
+                    provider,
+                    rate=getattr(settings, f"{prefix}_RATE_LIMIT_RPS"),
+                    burst=getattr(settings, f"{prefix}_RATE_LIMIT_BURST"),
+                    backend=_get_backend(),
+                )
+                _limiters[provider] = limiter
+    return limiter
+
+
+def openai_rate_limiter() -> BaseRateLimiter | None:
+    """LangChain rate limiter for ``ChatOpenAI``, or None when unlimited."""
+    limiter = get_rate_limiter("openai")
+    return LangChainRateLimiter(limiter) if limiter.enabled else None
@@ -0,0 +1,51 @@
+"""Optional side store for full Perplexity API payloads.
+
+Graph state only carries compact :class:`~app.agent.state.PerplexityResult`
+objects. When ``PERPLEXITY_KEEP_RAW`` is enabled, the normalised payload of
+every query is written here instead and referenced from the result by id, so
+it can be inspected later without being copied through every state
+transition.
+"""
+
+from __future__ import annotations
+
+import threading
+import uuid
+from typing import Any
+
+from app.agent.cache import PersistentCache
+from app.config import settings
+
+_store: PersistentCache | None = None
+_lock = threading.Lock()
+
+
+def _get_store() -> PersistentCache:
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = PersistentCache(
+                    "perplexity_raw",
+                    path=settings.CACHE_DB_PATH,
+                    ttl=settings.PERPLEXITY_RAW_TTL,
+                    memory_size=0,
+                    max_entries=settings.PERPLEXITY_RAW_MAX_ENTRIES,
+                )
+    return _store
+
+
+async def put_raw(raw: dict[str, Any]) -> str | None:
+    """Store *raw* and return its id, or None when the side store is disabled."""
+    if not settings.PERPLEXITY_KEEP_RAW:
+        return None
+    ref = uuid.uuid4().hex
+    await _get_store().aset(ref, raw)
+    return ref
+
+
+def get_raw(ref: str) -> dict[str, Any] | None:
+    """Return the payload stored under *ref*, if it is still retained."""
+    if not settings.PERPLEXITY_KEEP_RAW:
+        return None
+    return _get_store().get(ref)
@@ -0,0 +1,323 @@
+"""Historical store of evaluation runs.
+
+Every report is also written to a SQLite file (``RUN_STORE_DB_PATH``): one
+``runs`` row per report (domain, time, counts, exposure rate, usage) and one
+``run_results`` row per prompt. Runs are indexed by domain and time, prompts
+by domain and normalised prompt text.
+
+Trends and prompt stability are computed by SQLite itself — grouping by
+period, and a ``LAG`` window over each prompt's runs to count how often its
+outcome flipped — so the endpoints return finished series instead of every
+stored report.
+
+The competitor reports of a ``/compare`` run are stored flagged as
+``comparison`` runs: they rescore answers to prompts written for another
+brand, so trends and prompt stability leave them out.
+
+With ``PROMPT_REUSE`` a repeat run of a domain asks the prompts of its
+latest stored run again (:func:`stored_prompts`) instead of having new ones
+written, which is what gives a prompt an identity across runs.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, Literal
+
+from app.agent.state import PerplexityResult
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+Bucket = Literal["run", "day", "week", "month"]
+
+# SQLite expression naming the period a run falls in
+_PERIODS: dict[str, str] = {
+    "run": "id",
+    "day": "strftime('%Y-%m-%d', created_at, 'unixepoch')",
+    "week": "strftime('%Y-W%W', created_at, 'unixepoch')",
+    "month": "strftime('%Y-%m', created_at, 'unixepoch')",
+}
+
+
+def _time_filter(
+    domain: str, since: float | None, until: float | None
+) -> tuple[str, tuple[Any, ...]]:
+    """WHERE clause (and its parameters) for *domain* in [since, until).
+
+    Comparison runs are always excluded.
+    """
+    clauses, params = ["domain = ?", "comparison = 0"], [domain]
+    if since is not None:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("created_at < ?")
+        params.append(until)
+    return " AND ".join(clauses), tuple(params)
+
+
+def prompt_key(prompt: str) -> str:
+    """Case- and whitespace-insensitive identity of a prompt across runs."""
+    return " ".join(prompt.lower().split())
+
+
+class RunStore:
+    """SQLite store of runs and their per-prompt results."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(
+            path, timeout=10, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id TEXT PRIMARY KEY,"
+            " domain TEXT NOT NULL,"
+            " brand_name TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " total_prompts INTEGER NOT NULL,"
+            " evaluated INTEGER NOT NULL,"
+            " mentioned INTEGER NOT NULL,"
+            " failed INTEGER NOT NULL,"
+            " exposure_rate REAL NOT NULL,"
+            " input_tokens INTEGER NOT NULL,"
+            " output_tokens INTEGER NOT NULL,"
+            " cost_usd REAL NOT NULL,"
+            " comparison INTEGER NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS idx_runs_domain_time"
+            " ON runs (domain, created_at);"
+            "CREATE TABLE IF NOT EXISTS run_results ("
+            " run_id TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " domain TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " prompt TEXT NOT NULL,"
+            " prompt_key TEXT NOT NULL,"
+            " brand_mentioned INTEGER NOT NULL,"
+            " failed INTEGER NOT NULL,"
+            " citations INTEGER NOT NULL,"
+            " comparison INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (run_id, position));"
+            "CREATE INDEX IF NOT EXISTS idx_results_prompt"
+            " ON run_results (domain, prompt_key, created_at);"
+        )
+
+    # ── Writes ───────────────────────────────────────────────────────────
+
+    def add(
+        self,
+        report: dict[str, Any],
+        results: Iterable[PerplexityResult],
+        created_at: float | None = None,
+        *,
+        comparison: bool = False,
+    ) -> None:
+        """Store *report* (as built by the report generator) and its results.
+
+        *comparison* marks a competitor report of a comparative run.
+        """
+        created_at = time.time() if created_at is None else created_at
+        usage = report.get("usage") or {}
+        evaluated = report["total_prompts"] - report.get("failed_prompts_count", 0)
+        run = (
+            report["report_id"],
+            report["domain"],
+            report["brand_name"],
+            created_at,
+            report["total_prompts"],
+            evaluated,
+            report["brand_mentioned_count"],
+            report.get("failed_prompts_count", 0),
+            report["exposure_rate"],
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+            usage.get("cost_usd", 0.0),
+            int(comparison),
+        )
+        rows = [
+            (
+                report["report_id"],
+                position,
+                report["domain"],
+                created_at,
+                r.prompt,
+                prompt_key(r.prompt),
+                int(r.brand_mentioned),
+                int(r.failed),
+                len(r.citations),
+                int(comparison),
+            )
+            for position, r in enumerate(results)
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO runs VALUES"
+                    " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    run,
+                )
+                self._conn.execute(
+                    "DELETE FROM run_results WHERE run_id = ?", (report["report_id"],)
+                )
+                self._conn.executemany(
+                    "INSERT INTO run_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # ── Queries ──────────────────────────────────────────────────────────
+
+    def trend(
+        self,
+        domain: str,
+        bucket: Bucket = "day",
+        since: float | None = None,
+        until: float | None = None,
+    ) -> list[dict[str, Any]]:
+        """Exposure over time for *domain*, one point per *bucket*.
+
+        ``exposure_rate`` pools every evaluated prompt of the period;
+        ``avg_run_exposure_rate`` is the mean of the runs' own rates.
+        """
+        where, params = _time_filter(domain, since, until)
+        return self._query(
+            f"SELECT {_PERIODS[bucket]} AS period,"
+            " COUNT(*) AS runs,"
+            " MIN(created_at) AS first_run_at,"
+            " MAX(created_at) AS last_run_at,"
+            " SUM(evaluated) AS evaluated,"
+            " SUM(mentioned) AS mentioned,"
+            " ROUND(SUM(mentioned) * 100.0 / NULLIF(SUM(evaluated), 0), 1)"
+            "  AS exposure_rate,"
+            " ROUND(AVG(exposure_rate), 1) AS avg_run_exposure_rate,"
+            " SUM(input_tokens) AS input_tokens,"
+            " SUM(output_tokens) AS output_tokens,"
+            " ROUND(SUM(cost_usd), 6) AS cost_usd"
+            f" FROM runs WHERE {where}"
+            " GROUP BY period ORDER BY first_run_at, period",
+            params,
+        )
+
+    def prompt_stability(
+        self,
+        domain: str,
+        min_runs: int = 2,
+        since: float | None = None,
+        limit: int = 100,
+    ) -> list[dict[str, Any]]:
+        """How consistently each recurring prompt mentions the brand.
+
+        For every prompt asked in at least *min_runs* successful runs: its
+        mention rate, how many times the outcome flipped between consecutive
+        runs, and ``stability`` = 1 - flips / (runs - 1).
+
+        Prompts are matched by :func:`prompt_key`; they recur because repeat
+        runs reuse the stored prompt set (see :func:`stored_prompts`).
+        """
+        where, params = _time_filter(domain, since, None)
+        return self._query(
+            "WITH ordered AS ("
+            " SELECT prompt_key, prompt, brand_mentioned, created_at,"
+            "  LAG(brand_mentioned) OVER ("
+            "   PARTITION BY prompt_key ORDER BY created_at, rowid) AS previous"
+            f" FROM run_results WHERE {where} AND failed = 0)"
+            " SELECT MIN(prompt) AS prompt,"
+            " COUNT(*) AS runs,"
+            " SUM(brand_mentioned) AS mentioned,"
+            " ROUND(AVG(brand_mentioned) * 100.0, 1) AS mention_rate,"
+            " SUM(previous != brand_mentioned) AS flips,"
+            " ROUND(1.0 - SUM(previous != brand_mentioned) * 1.0 / (COUNT(*) - 1), 3)"
+            "  AS stability,"
+            " MIN(created_at) AS first_seen,"
+            " MAX(created_at) AS last_seen"
+            " FROM ordered GROUP BY prompt_key HAVING COUNT(*) >= MAX(?, 2)"
+            " ORDER BY stability, runs DESC, prompt LIMIT ?",
+            (*params, min_runs, limit),
+        )
+
+    def latest_prompts(self, domain: str, count: int) -> list[str]:
+        """The first *count* prompts of *domain*'s latest run that asked as many.
+
+        Comparison runs are skipped; an empty list means no such run.
+        """
+        rows = self._query(
+            "SELECT prompt FROM run_results WHERE run_id = ("
+            " SELECT id FROM runs"
+            " WHERE domain = ? AND comparison = 0 AND total_prompts >= ?"
+            " ORDER BY created_at DESC LIMIT 1)"
+            " ORDER BY position LIMIT ?",
+            (domain, count, count),
+        )
+        return [row["prompt"] for row in rows]
+
+    def _query(self, sql: str, params: tuple[Any, ...]) -> list[dict[str, Any]]:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: RunStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> RunStore:
+    """Return the process-wide run store, opening it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RunStore(settings.RUN_STORE_DB_PATH)
+    return _store
+
+
+def record(
+    report: dict[str, Any],
+    results: Iterable[PerplexityResult],
+    *,
+    comparison: bool = False,
+) -> None:
+    """Add a finished report to the run store, if enabled. Never raises.
+
+    This is blocking SQLite I/O: call it from a worker thread in async code.
+    """
+    if not settings.RUN_STORE_ENABLED:
+        return
+    try:
+        get_store().add(report, results, comparison=comparison)
+    except (sqlite3.Error, OSError, KeyError) as exc:
+        logger.warning(
+            "Run store write failed | domain=%s error=%s", report.get("domain"), exc
+        )
+
+
+def stored_prompts(domain: str, count: int) -> list[str]:
+    """Prompts to ask again for *domain*, if reuse is enabled. Never raises.
+
+    This is blocking SQLite I/O: call it from a worker thread in async code.
+    """
+    if not (settings.PROMPT_REUSE and settings.RUN_STORE_ENABLED):
+        return []
+    try:
+        return get_store().latest_prompts(domain, count)
+    except (sqlite3.Error, OSError) as exc:
+        logger.warning("Run store read failed | domain=%s error=%s", domain, exc)
+        return []
@@ -2,20 +2,35 @@
 
 from __future__ import annotations
 
+from dataclasses import dataclass
 from typing import Optional, TypedDict
 
-from pydantic import BaseModel
 
+@dataclass(frozen=True, slots=True)
+class PerplexityResult:
+    """Compact result of a single Perplexity API query.
 
-class PerplexityResult(BaseModel):
-    """Result of a single Perplexity API query."""
+    Only what the report needs travels through graph state; the full API
+    payload is kept out of it and, when enabled, parked in the raw response
+    side store under ``raw_ref`` (see ``app.agent.raw_store``).
+    """
 
     prompt: str
-    raw_response: dict  # full API response from Perplexity
     completion: str  # the text answer
-    citations: list[str]  # list of source URLs
+    citations: tuple[str, ...]  # source URLs
     brand_mentioned: bool  # whether the brand appeared
     brand_mention_context: str  # the sentence(s) where brand was mentioned
+    failed: bool = False  # the query errored out — neither a hit nor a miss
+    error: Optional[str] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+    raw_ref: Optional[str] = None  # id of the full payload in the side store
+    # "cache" / "coalesced" when the answer was not billed to this prompt
+    served_from: Optional[str] = None
+    # (entity, mention count) for the brand and each competitor named in the
+    # completion, in order of first mention
+    entity_mentions: tuple[tuple[str, int], ...] = ()
 
 
 class AgentState(TypedDict):
@@ -25,7 +40,13 @@ class AgentState(TypedDict):
     brand_name: str
     brand_context: dict  # researched brand info
     prompts_count: int  # number of prompts to generate
+    force_refresh: bool  # bypass the brand context cache
     generated_prompts: list[str]
     perplexity_results: list[PerplexityResult]
     report: dict  # final computed report
     error: Optional[str]
+    # Comparative mode: other brands scored on the same Perplexity answers
+    competitor_domains: list[str]
+    comparison: list[dict]  # {"domain", "brand_name", "brand_context"} per brand
+    comparison_reports: list[dict]  # one report per competitor domain
+    comparison_failed: list[dict]  # {"domain", "error"} per competitor dropped
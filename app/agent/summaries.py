@@ -0,0 +1,121 @@
+"""Deferred report summaries.
+
+With ``SUMMARY_MODE=deferred`` the report is returned without its narrative
+summary; :func:`schedule` starts the LLM call in the background and records
+its progress under the report id. Records live in the persistent cache
+(namespace ``"summaries"``, ``SUMMARY_TTL``) with no in-memory tier, so any
+worker sharing the cache file reads the current record when it answers
+``GET /api/v1/reports/{report_id}/summary``; the worker that runs the task
+can additionally let a caller wait for it.
+
+On shutdown :func:`drain` gives running summaries ``SUMMARY_DRAIN_TIMEOUT``
+seconds to finish and cancels the rest; a cancelled summary is recorded as
+``failed`` with the template summary, like any other failure.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable
+
+from app.agent.cache import PersistentCache
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+_store: PersistentCache | None = None
+_store_lock = threading.Lock()
+_tasks: dict[str, asyncio.Task[None]] = {}
+
+
+def _get_store() -> PersistentCache:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PersistentCache(
+                    "summaries",
+                    path=settings.CACHE_DB_PATH,
+                    ttl=settings.SUMMARY_TTL,
+                    # A remembered "pending" would hide another worker's update
+                    memory_size=0,
+                )
+    return _store
+
+
+def _record(status: str, summary: str = "", error: str | None = None) -> dict[str, Any]:
+    return {"status": status, "summary": summary, "error": error}
+
+
+async def _run(
+    report_id: str,
+    generate: Callable[[], Awaitable[str]],
+    fallback: str,
+) -> None:
+    store = _get_store()
+    try:
+        await store.aset(report_id, _record(READY, await generate()))
+        logger.info("Deferred summary ready | report_id=%s", report_id)
+    except asyncio.CancelledError:
+        logger.warning("Deferred summary cancelled | report_id=%s", report_id)
+        # Written inline: awaiting a thread here could be cancelled in turn
+        store.set(report_id, _record(FAILED, fallback, "cancelled"))
+        raise
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Deferred summary failed | report_id=%s", report_id)
+        await store.aset(report_id, _record(FAILED, fallback, str(exc)))
+    finally:
+        _tasks.pop(report_id, None)
+
+
+async def schedule(
+    report_id: str, generate: Callable[[], Awaitable[str]], fallback: str
+) -> None:
+    """Start generating the summary for *report_id* in the background.
+
+    If *generate* fails, *fallback* (the template summary) is stored with
+    status ``failed``.
+    """
+    await _get_store().aset(report_id, _record(PENDING))
+    _tasks[report_id] = asyncio.create_task(_run(report_id, generate, fallback))
+
+
+def get(report_id: str) -> dict[str, Any] | None:
+    """Return ``{"status", "summary", "error"}`` for *report_id*, if known."""
+    return _get_store().get(report_id)
+
+
+async def wait(report_id: str, timeout: float) -> dict[str, Any] | None:
+    """Like :func:`get`, but wait up to *timeout* seconds for a pending summary.
+
+    Only a summary running in this process can be waited for; otherwise the
+    current record is returned straight away.
+    """
+    task = _tasks.get(report_id)
+    if task is not None and timeout > 0:
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            pass
+    return await _get_store().aget(report_id)
+
+
+async def drain(timeout: float) -> None:
+    """Wait up to *timeout* seconds for running summaries, then cancel them."""
+    tasks = list(_tasks.values())
+    if not tasks:
+        return
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(
+            "Deferred summaries cancelled on shutdown | count=%d", len(pending)
+        )
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,199 @@
+"""Homepage fetcher – streaming, byte-capped download + fast text extraction.
+
+The response body is streamed and reading stops once ``HOMEPAGE_MAX_BYTES``
+have arrived, so oversized pages never cost more than the cap. Visible text
+is extracted with lxml (libxml2) in a small worker pool, keeping the CPU-bound
+parse off the event loop, and the tree walk stops as soon as
+``HOMEPAGE_MAX_CHARS`` characters of text have been collected. The charset
+of the ``Content-Type`` header is passed on to the parser; without one, a
+body that is valid UTF-8 is read as UTF-8 and anything else is left to the
+page's own ``<meta charset>``.
+
+Downloads go through the shared HTTP client (``app.agent.tools.http_client``)
+and use conditional GET: the ``ETag`` / ``Last-Modified`` validators and the
+extracted text of the last fetch are kept in a small on-disk cache, so
+re-scraping an unchanged homepage costs a ``304 Not Modified``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import codecs
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import httpx
+from lxml import etree, html
+
+from app.agent.cache import PersistentCache
+from app.agent.tools.http_client import get_http_client
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Elements whose content is never visible text
+SKIP_TAGS = frozenset({"script", "style", "noscript", "template", "svg"})
+
+_parse_pool: ThreadPoolExecutor | None = None
+
+_http_cache: PersistentCache | None = None
+_http_cache_lock = threading.Lock()
+
+
+def _get_http_cache() -> PersistentCache:
+    global _http_cache
+    if _http_cache is None:
+        with _http_cache_lock:
+            if _http_cache is None:
+                _http_cache = PersistentCache(
+                    "http",
+                    path=settings.CACHE_DB_PATH,
+                    ttl=settings.HTTP_CACHE_TTL,
+                    memory_size=64,
+                )
+    return _http_cache
+
+
+def _get_parse_pool() -> ThreadPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ThreadPoolExecutor(
+            max_workers=settings.HOMEPAGE_PARSE_WORKERS,
+            thread_name_prefix="homepage-parse",
+        )
+    return _parse_pool
+
+
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+def _is_utf8(data: bytes) -> bool:
+    """Whether *data* is UTF-8, allowing a character cut off by the byte cap."""
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(data, final=False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def extract_visible_text(
+    data: bytes, max_chars: int, encoding: str | None = None
+) -> str:
+    """Return up to *max_chars* of whitespace-normalised visible text.
+
+    *encoding* is the charset from the HTTP headers, if any. Works on
+    truncated documents (libxml2 recovers from the cut) and stops walking
+    the tree once enough text has been gathered.
+    """
+    if not data.strip():
+        return ""
+    if encoding is None and _is_utf8(data):
+        encoding = "utf-8"
+    try:
+        parser = html.HTMLParser(encoding=encoding)
+    except LookupError:  # a charset lxml does not know
+        parser = html.HTMLParser()
+    try:
+        root = html.document_fromstring(data, parser=parser)
+    except (etree.ParserError, ValueError):
+        return ""
+
+    parts: list[str] = []
+    collected = 0
+
+    def _add(text: str | None) -> None:
+        nonlocal collected
+        if text:
+            words = text.split()
+            if words:
+                chunk = " ".join(words)
+                parts.append(chunk)
+                collected += len(chunk) + 1
+
+    walker = etree.iterwalk(root, events=("start", "end"))
+    for event, element in walker:
+        if event == "start":
+            tag = element.tag
+            # Comments / processing instructions have non-string tags
+            if not isinstance(tag, str) or tag.lower() in SKIP_TAGS:
+                walker.skip_subtree()
+            else:
+                _add(element.text)
+        else:
+            _add(element.tail)
+        if collected >= max_chars:
+            break
+
+    return " ".join(parts)[:max_chars]
+
+
+async def _fetch_capped(
+    client: httpx.AsyncClient,
+    url: str,
+    max_bytes: int,
+    headers: dict[str, str] | None = None,
+) -> tuple[httpx.Response, bytes]:
+    """GET *url* and return the response with at most *max_bytes* of body."""
+    chunks: list[bytes] = []
+    received = 0
+    async with client.stream("GET", url, headers=headers) as resp:
+        if resp.status_code == 304:
+            return resp, b""
+        resp.raise_for_status()
+        async for chunk in resp.aiter_bytes():
+            chunks.append(chunk)
+            received += len(chunk)
+            if received >= max_bytes:
+                logger.info("Homepage body capped | url=%s bytes=%d", url, max_bytes)
+                break
+    return resp, b"".join(chunks)[:max_bytes]
+
+
+def _validators(entry: dict[str, Any]) -> dict[str, str]:
+    """Conditional request headers for a cached response."""
+    headers: dict[str, str] = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+async def fetch_homepage_text(domain: str) -> str:
+    """Fetch ``https://{domain}`` and return its visible text (capped)."""
+    url = f"https://{domain}"
+    max_chars = settings.HOMEPAGE_MAX_CHARS
+    cache = _get_http_cache() if settings.HTTP_CACHE_ENABLED else None
+    key = PersistentCache.make_key(url, settings.HOMEPAGE_MAX_BYTES, max_chars)
+    cached = await cache.aget(key) if cache is not None else None
+
+    logger.info("Scraping homepage | url=%s conditional=%s", url, cached is not None)
+    client = await get_http_client()
+    resp, data = await _fetch_capped(
+        client,
+        url,
+        settings.HOMEPAGE_MAX_BYTES,
+        headers=_validators(cached) if cached else None,
+    )
+    if resp.status_code == 304 and cached is not None:
+        logger.info("Homepage not modified | url=%s", url)
+        return cached["text"]
+
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(
+        _get_parse_pool(), extract_visible_text, data, max_chars, resp.charset_encoding
+    )
+
+    etag = resp.headers.get("etag")
+    last_modified = resp.headers.get("last-modified")
+    if cache is not None and (etag or last_modified):
+        await cache.aset(
+            key, {"etag": etag, "last_modified": last_modified, "text": text}
+        )
+    return text
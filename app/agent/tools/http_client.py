@@ -0,0 +1,64 @@
+"""Shared outbound ``httpx.AsyncClient`` for plain HTTP fetches.
+
+One client (HTTP/2 enabled, tunable connection limits) is opened by the
+FastAPI lifespan and reused by every homepage fetch, so connections and DNS
+lookups are shared across requests. Outside the app (tests, scripts) the
+client is opened lazily on first use.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+
+import httpx
+
+from app.agent.concurrency import close_quietly, close_stale
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=settings.HTTP2_ENABLED,
+        follow_redirects=True,
+        timeout=settings.HOMEPAGE_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+async def open_http_client() -> httpx.AsyncClient:
+    """Open the shared client for the running loop (called by the lifespan)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        if _client is not None and not _client.is_closed:
+            close_stale(_client.aclose, _client_loop, "http")
+        logger.info("Opening shared HTTP client | http2=%s", settings.HTTP2_ENABLED)
+        _client = _build_client()
+        _client_loop = loop
+    return _client
+
+
+async def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, opening it if the lifespan has not."""
+    return await open_http_client()
+
+
+async def close_http_client() -> None:
+    global _client, _client_loop
+    if _client is not None:
+        if _client_loop is asyncio.get_running_loop():
+            await _client.aclose()
+        else:
+            await close_quietly(_client.aclose, "http")
+    _client = None
+    _client_loop = None
@@ -1,23 +1,201 @@
-"""Perplexity API tool – wrapper using the official Perplexity Python SDK."""
+"""Perplexity API tool – wrapper using the official Perplexity Python SDK.
+
+Clients are pooled process-wide: one sync and one async client are built
+lazily on first use, keep their HTTP connections alive across prompts and
+requests, and are closed by :func:`close_clients` on app shutdown.
+
+Every query first takes a token from the ``perplexity`` rate limiter and then
+goes through :data:`limiter`, a process-wide adaptive concurrency limiter
+that backs off on 429 / 5xx / timeouts and grows while Perplexity keeps up.
+
+Responses are cached (in-memory LRU in front of SQLite) keyed on the
+normalised prompt plus the preset, so a repeated prompt skips the network
+entirely while its entry is within ``PERPLEXITY_CACHE_TTL``.
+
+Concurrent callers asking for the same normalised prompt share a single
+in-flight call (see :data:`single_flight`); each caller still runs its own
+brand detection on the shared completion.
+
+A response that did not cost a request of its own — a cache hit, or a
+joined in-flight call — is tagged with ``served_from`` (``"cache"`` or
+``"coalesced"``) so its usage is not billed a second time.
+
+Network calls get a per-call deadline (``PERPLEXITY_TIMEOUT``), jittered
+exponential retry on retryable errors and, optionally, hedging: once a call
+outlives the observed p95 latency a duplicate is fired and whichever answers
+first wins.
+"""
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import random
+import re
+import threading
+import time
 from typing import Any
 
-from perplexity import Perplexity
+import httpx
+from perplexity import (
+    APIConnectionError,
+    APIStatusError,
+    AsyncPerplexity,
+    DefaultAsyncHttpxClient,
+    DefaultHttpxClient,
+    Perplexity,
+)
 
+from app.agent.cache import PersistentCache
+from app.agent.concurrency import (
+    AdaptiveLimiter,
+    LatencyTracker,
+    SingleFlight,
+    close_quietly,
+    close_stale,
+)
+from app.agent.ratelimit import get_rate_limiter
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-def _get_client() -> Perplexity:
-    """Build a Perplexity client.
+PRESET = "pro-search"
+
+_sync_client: Perplexity | None = None
+_sync_lock = threading.Lock()
+
+# httpx.AsyncClient connections are bound to the loop that opened them, so the
+# async client is remembered together with its loop and replaced (and closed)
+# when another loop asks for it.
+_async_client: AsyncPerplexity | None = None
+_async_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """True for errors that signal Perplexity is overloaded (429, 5xx, timeouts)."""
+    if isinstance(exc, APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    # APITimeoutError is a subclass of APIConnectionError
+    return isinstance(exc, (APIConnectionError, asyncio.TimeoutError))
+
+
+# Overload signals are also the errors worth retrying: 4xx other than 429
+# (bad request, auth, ...) will fail the same way again.
+is_retryable_error = is_overload_error
+
+
+limiter = AdaptiveLimiter(
+    "perplexity",
+    initial_limit=settings.PERPLEXITY_MAX_WORKERS,
+    min_limit=settings.PERPLEXITY_MIN_CONCURRENCY,
+    max_limit=settings.PERPLEXITY_MAX_CONCURRENCY,
+    backoff_ratio=settings.PERPLEXITY_BACKOFF_RATIO,
+    latency_tolerance=settings.PERPLEXITY_LATENCY_TOLERANCE,
+    is_overload=is_overload_error,
+)
+
+single_flight = SingleFlight()
+
+latency_tracker = LatencyTracker(min_samples=settings.PERPLEXITY_HEDGE_MIN_SAMPLES)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.PERPLEXITY_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.PERPLEXITY_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.PERPLEXITY_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_sync_client() -> Perplexity:
+    """Return the shared synchronous Perplexity client, building it once.
 
     The SDK automatically reads the PERPLEXITY_API_KEY environment variable,
     but we pass it explicitly for clarity.
     """
-    return Perplexity(api_key=settings.PERPLEXITY_API_KEY)
+    global _sync_client
+    if _sync_client is None:
+        with _sync_lock:
+            if _sync_client is None:
+                logger.info("Creating pooled Perplexity client (sync)")
+                _sync_client = Perplexity(
+                    api_key=settings.PERPLEXITY_API_KEY,
+                    timeout=settings.PERPLEXITY_TIMEOUT,
+                    max_retries=0,
+                    http_client=DefaultHttpxClient(limits=_limits()),
+                )
+    return _sync_client
+
+
+def get_async_client() -> AsyncPerplexity:
+    """Return the shared async Perplexity client for the running event loop."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        if _async_client is not None:
+            close_stale(_async_client.close, _async_client_loop, "perplexity")
+        logger.info("Creating pooled Perplexity client (async)")
+        _async_client = AsyncPerplexity(
+            api_key=settings.PERPLEXITY_API_KEY,
+            timeout=settings.PERPLEXITY_TIMEOUT,
+            # Retries are handled by _query_with_retry
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=_limits()),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_clients() -> None:
+    """Close the pooled clients and drop their connections."""
+    global _sync_client, _async_client, _async_client_loop
+    with _sync_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+    if _async_client is not None:
+        if _async_client_loop is asyncio.get_running_loop():
+            await _async_client.close()
+        else:
+            await close_quietly(_async_client.close, "perplexity")
+        _async_client = None
+        _async_client_loop = None
+
+
+# ── Response cache ─────────────────────────────────────────────────────────
+
+_response_cache: PersistentCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> PersistentCache:
+    """Return the shared Perplexity response cache, opening it on first use."""
+    global _response_cache
+    if _response_cache is None:
+        with _cache_lock:
+            if _response_cache is None:
+                _response_cache = PersistentCache(
+                    "perplexity",
+                    path=settings.CACHE_DB_PATH,
+                    ttl=settings.PERPLEXITY_CACHE_TTL,
+                    memory_size=settings.PERPLEXITY_CACHE_MEMORY_SIZE,
+                    max_entries=settings.PERPLEXITY_CACHE_MAX_ENTRIES,
+                )
+    return _response_cache
+
+
+def cache_stats() -> dict[str, Any] | None:
+    """Hit / miss counters of the response cache, or None if it is unused."""
+    return _response_cache.stats() if _response_cache is not None else None
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a prompt for cache keys: casefolded, single-spaced."""
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+def cache_key(prompt: str, preset: str = PRESET) -> str:
+    return PersistentCache.make_key(preset, normalize_prompt(prompt))
 
 
 def _extract_citations(response: Any) -> list[str]:
@@ -37,21 +215,117 @@ def _extract_citations(response: Any) -> list[str]:
     return citations
 
 
-def query_perplexity(prompt: str) -> dict[str, Any]:
+async def query_perplexity(prompt: str) -> dict[str, Any]:
     """Send a single prompt to Perplexity and return a normalised dict.
 
     Returns a dict with keys ``choices`` (for backwards-compat) and
     ``citations`` so downstream code can process the result uniformly.
+    Cached responses are returned without touching the network, and
+    identical prompts already in flight are joined rather than re-sent.
     """
+    key = cache_key(prompt)
+    if settings.PERPLEXITY_CACHE_ENABLED:
+        cached = await get_response_cache().aget(key)
+        if cached is not None:
+            logger.info("Perplexity cache hit | prompt=%s", prompt[:80])
+            return {**cached, "served_from": "cache"}  # cached dict is shared
+
+    raw, joined = await single_flight.join(key, lambda: _fetch(prompt, key))
+    return {**raw, "served_from": "coalesced"} if joined else raw
+
+
+async def _fetch(prompt: str, key: str) -> dict[str, Any]:
+    """Query the network and populate the cache (run once per in-flight key)."""
+    raw = await _query_with_retry(prompt)
+    if settings.PERPLEXITY_CACHE_ENABLED:
+        await get_response_cache().aset(key, raw)
+    return raw
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry number *attempt* (0-based)."""
+    ceiling = min(
+        settings.PERPLEXITY_RETRY_MAX_DELAY,
+        settings.PERPLEXITY_RETRY_BASE_DELAY * 2**attempt,
+    )
+    return random.uniform(0, ceiling)
+
+
+async def _query_with_retry(prompt: str) -> dict[str, Any]:
+    """Run :func:`_query_hedged`, retrying retryable failures with backoff."""
+    attempt = 0
+    while True:
+        try:
+            return await _query_hedged(prompt)
+        except Exception as exc:
+            if attempt >= settings.PERPLEXITY_MAX_RETRIES or not is_retryable_error(exc):
+                raise
+            delay = _backoff_delay(attempt)
+            attempt += 1
+            logger.warning(
+                "Perplexity retry %d/%d in %.2fs | prompt=%s error=%r",
+                attempt,
+                settings.PERPLEXITY_MAX_RETRIES,
+                delay,
+                prompt[:60],
+                exc,
+            )
+            await asyncio.sleep(delay)
+
+
+async def _query_hedged(prompt: str) -> dict[str, Any]:
+    """Run :func:`_query`, firing a duplicate if it outlives the p95 latency.
+
+    Hedging is skipped until enough latencies have been observed, and while
+    the concurrency limiter has callers queued (a duplicate would only add
+    load to an already saturated provider).
+    """
+    threshold = latency_tracker.quantile(settings.PERPLEXITY_HEDGE_QUANTILE)
+    if not settings.PERPLEXITY_HEDGE_ENABLED or threshold is None:
+        return await _query(prompt)
+
+    primary = asyncio.create_task(_query(prompt))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=threshold)
+        if not done and limiter.queue_depth == 0:
+            logger.info(
+                "Perplexity hedge fired after %.2fs | prompt=%s", threshold, prompt[:60]
+            )
+            tasks.add(asyncio.create_task(_query(prompt)))
+
+        while tasks:
+            done, tasks = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        # Every attempt failed: surface the primary's error
+        return primary.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _query(prompt: str) -> dict[str, Any]:
+    """Query Perplexity over the network (rate- and concurrency-limited)."""
     logger.info("Perplexity query | prompt=%s", prompt[:80])
-    client = _get_client()
+    client = get_async_client()
 
     # Use the Agent API responses.create with pro-search preset
     # This automatically includes web search and optimized reasoning
-    response = client.responses.create(
-        preset="pro-search",
-        messages=[{"role": "user", "content": prompt}],
-    )
+    await get_rate_limiter("perplexity").acquire()
+    async with limiter.slot():
+        started = time.monotonic()
+        response = await asyncio.wait_for(
+            client.responses.create(
+                preset=PRESET,
+                messages=[{"role": "user", "content": prompt}],
+            ),
+            timeout=settings.PERPLEXITY_TIMEOUT,
+        )
+        latency_tracker.record(time.monotonic() - started)
 
     # Use the convenience property output_text as recommended in documentation
     completion_text = ""
@@ -69,7 +343,7 @@ def query_perplexity(prompt: str) -> dict[str, Any]:
     # Build a normalised dict (mimics old structure for downstream code)
     raw: dict[str, Any] = {
         "id": response.id,
-        "model": getattr(response, "model", "pro-search"),
+        "model": getattr(response, "model", PRESET),
         "choices": [
             {"message": {"content": completion_text}}
         ],
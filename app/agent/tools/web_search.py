@@ -1,25 +1,71 @@
-"""Firecrawl Search API wrapper for brand research."""
+"""Firecrawl Search API wrapper for brand research.
+
+One ``FirecrawlApp`` is reused for the life of the process, and results are
+cached per query (and mode) for ``FIRECRAWL_CACHE_TTL`` seconds.
+
+A search runs in one of two modes:
+
+* **full** — each result carries the page markdown (``scrapeOptions``), which
+  makes Firecrawl scrape every hit and is by far the slower round trip;
+* **lite** — titles and descriptions only, which is usually enough for the
+  LLM to identify a brand. The caller decides when to fall back to full.
+"""
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import threading
 
 from firecrawl import FirecrawlApp
 
+from app.agent.cache import PersistentCache
+from app.agent.ratelimit import get_rate_limiter
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+_app: FirecrawlApp | None = None
+_app_lock = threading.Lock()
 
-def search_brand(query: str, max_results: int = 10) -> list[dict]:
-    """Run a Firecrawl web search and return a list of result dicts.
+_search_cache: PersistentCache | None = None
+_search_cache_lock = threading.Lock()
+
+
+def get_app() -> FirecrawlApp:
+    """Return the process-wide Firecrawl client."""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = FirecrawlApp(api_key=settings.FIRECRAWL_API_KEY)
+    return _app
+
+
+def _get_search_cache() -> PersistentCache:
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = PersistentCache(
+                    "firecrawl_search",
+                    path=settings.CACHE_DB_PATH,
+                    ttl=settings.FIRECRAWL_CACHE_TTL,
+                    memory_size=128,
+                )
+    return _search_cache
 
-    Each dict contains keys: ``title``, ``url``, ``content`` (snippet).
-    """
-    logger.info("Firecrawl search | query=%s max_results=%d", query, max_results)
-    app = FirecrawlApp(api_key=settings.FIRECRAWL_API_KEY)
 
-    response = app.search(query, params={"limit": max_results})
+def _search(query: str, max_results: int, full: bool) -> list[dict]:
+    """Blocking Firecrawl search (the SDK only ships a synchronous client)."""
+    logger.info(
+        "Firecrawl search | query=%s max_results=%d full=%s", query, max_results, full
+    )
+    params: dict = {"limit": max_results}
+    if full:
+        params["scrapeOptions"] = {"formats": ["markdown"]}
+
+    response = get_app().search(query, params=params)
     results = []
     # Firecrawl search returns a SearchResponse with a `data` list
     data = response.get("data", []) if isinstance(response, dict) else getattr(response, "data", [])
@@ -28,15 +74,41 @@ def search_brand(query: str, max_results: int = 10) -> list[dict]:
             results.append({
                 "title": item.get("title", ""),
                 "url": item.get("url", ""),
-                "content": item.get("markdown", item.get("description", "")),
+                "content": item.get("markdown") or item.get("description", ""),
             })
         else:
             # Object-style response
             results.append({
                 "title": getattr(item, "title", ""),
                 "url": getattr(item, "url", ""),
-                "content": getattr(item, "markdown", getattr(item, "description", "")),
+                "content": getattr(item, "markdown", None) or getattr(item, "description", ""),
             })
 
     logger.info("Firecrawl search returned %d results", len(results))
     return results
+
+
+async def search_brand(
+    query: str, max_results: int = 10, *, full: bool = True
+) -> list[dict]:
+    """Run a Firecrawl web search and return a list of result dicts.
+
+    Each dict contains keys: ``title``, ``url``, ``content`` (the page
+    markdown in full mode, the search snippet in lite mode).
+
+    The Firecrawl SDK is synchronous, so only this single HTTP round trip is
+    offloaded to a worker thread; the rest of the graph stays on the loop.
+    """
+    cache = _get_search_cache() if settings.FIRECRAWL_CACHE_ENABLED else None
+    key = PersistentCache.make_key(query, max_results, full)
+    if cache is not None:
+        cached = await cache.aget(key)
+        if cached is not None:
+            logger.info("Firecrawl cache hit | query=%s full=%s", query, full)
+            return cached
+
+    await get_rate_limiter("firecrawl").acquire()
+    results = await asyncio.to_thread(_search, query, max_results, full)
+    if cache is not None and results:
+        await cache.aset(key, results)
+    return results
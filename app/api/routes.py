@@ -3,12 +3,32 @@
 from __future__ import annotations
 
 import logging
+from datetime import datetime
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
+from app.agent import corpus, llm_cache, run_store, summaries
 from app.agent.graph import run_graph
-from app.models.requests import EvaluateRequest
-from app.models.responses import ErrorResponse, ExposureReport, HealthResponse
+from app.agent.llm import llm_stats
+from app.agent.tools import perplexity
+from app.models.requests import CompareRequest, CorpusScoreRequest, EvaluateRequest
+from app.models.responses import (
+    CacheStats,
+    ComparisonReport,
+    ConcurrencyStats,
+    CorpusCategory,
+    CorpusCitations,
+    CorpusScore,
+    ErrorResponse,
+    ExposureReport,
+    ExposureTrend,
+    HealthResponse,
+    LLMNodeStats,
+    PromptStabilityResponse,
+    SingleFlightStats,
+    StatsResponse,
+    SummaryResponse,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,17 +41,37 @@ async def health() -> HealthResponse:
     return HealthResponse()
 
 
-@router.post(
-    "/evaluate",
-    response_model=ExposureReport,
-    responses={500: {"model": ErrorResponse}},
-)
-async def evaluate(body: EvaluateRequest) -> ExposureReport:
-    """Evaluate brand exposure on Perplexity AI for the given domain."""
-    logger.info("POST /evaluate | domain=%s", body.domain)
+@router.get("/stats", response_model=StatsResponse)
+def stats() -> StatsResponse:
+    """Current outbound concurrency limits, queue depths, cache and LLM counters.
 
+    A plain function: counting cache entries queries SQLite, so it runs in the
+    threadpool rather than on the event loop.
+    """
+    cache = perplexity.cache_stats()
+    llm_responses = llm_cache.cache_stats()
+    return StatsResponse(
+        perplexity_concurrency=ConcurrencyStats(**perplexity.limiter.snapshot()),
+        perplexity_single_flight=SingleFlightStats(
+            **perplexity.single_flight.snapshot()
+        ),
+        perplexity_cache=CacheStats(**cache) if cache else None,
+        llm=[LLMNodeStats(**node) for node in llm_stats()],
+        llm_cache=CacheStats(**llm_responses) if llm_responses else None,
+    )
+
+
+async def _run_workflow(
+    body: EvaluateRequest, competitor_domains: list[str] | None = None
+) -> dict:
+    """Run the graph for *body*, mapping failures to HTTP errors."""
     try:
-        state = await run_graph(body.domain, body.prompts_count)
+        state = await run_graph(
+            body.domain,
+            body.prompts_count,
+            force_refresh=body.force_refresh,
+            competitor_domains=competitor_domains or (),
+        )
     except TimeoutError:
         raise HTTPException(status_code=504, detail="Workflow timed out")
     except Exception as exc:
@@ -41,10 +81,150 @@ async def evaluate(body: EvaluateRequest) -> ExposureReport:
     if state.get("error"):
         raise HTTPException(status_code=500, detail=state["error"])
 
-    report_data = state.get("report")
-    if not report_data:
+    if not state.get("report"):
         raise HTTPException(
             status_code=500, detail="No report generated — unknown error"
         )
+    return state
+
+
+@router.post(
+    "/evaluate",
+    response_model=ExposureReport,
+    responses={500: {"model": ErrorResponse}},
+)
+async def evaluate(body: EvaluateRequest) -> ExposureReport:
+    """Evaluate brand exposure on Perplexity AI for the given domain."""
+    logger.info("POST /evaluate | domain=%s", body.domain)
+    state = await _run_workflow(body)
+    return ExposureReport(**state["report"])
+
+
+@router.post(
+    "/compare",
+    response_model=ComparisonReport,
+    responses={500: {"model": ErrorResponse}},
+)
+async def compare(body: CompareRequest) -> ComparisonReport:
+    """Evaluate a brand and its competitors on one shared set of answers.
+
+    One prompt set is generated and each prompt is sent to Perplexity once;
+    every answer is then scored for each brand. Competitors that could not be
+    researched are listed under ``failed_competitors`` instead of failing the
+    request.
+    """
+    logger.info(
+        "POST /compare | domain=%s competitors=%s",
+        body.domain,
+        ",".join(body.competitor_domains),
+    )
+    state = await _run_workflow(body, body.competitor_domains)
+    report = state["report"]
+    return ComparisonReport(
+        prompts=[r.prompt for r in state["perplexity_results"]],
+        reports=[
+            ExposureReport(**r)
+            for r in [report, *(state.get("comparison_reports") or [])]
+        ],
+        failed_competitors=state.get("comparison_failed") or [],
+        usage=report["usage"],
+    )
+
+
+@router.get(
+    "/reports/{report_id}/summary",
+    response_model=SummaryResponse,
+    responses={404: {"model": ErrorResponse}},
+)
+async def report_summary(
+    report_id: str,
+    wait: float = Query(0, ge=0, le=60, description="Seconds to wait while pending"),
+) -> SummaryResponse:
+    """Narrative summary of a report evaluated with ``SUMMARY_MODE=deferred``."""
+    record = await summaries.wait(report_id, wait)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown report_id")
+    return SummaryResponse(report_id=report_id, **record)
+
+
+@router.get("/corpus/categories", response_model=list[CorpusCategory])
+def corpus_categories() -> list[CorpusCategory]:
+    """Market categories in the answer corpus, with their answer counts."""
+    return [CorpusCategory(**row) for row in corpus.get_corpus().categories()]
+
+
+@router.post(
+    "/corpus/score",
+    response_model=CorpusScore,
+    responses={404: {"model": ErrorResponse}},
+)
+def corpus_score(body: CorpusScoreRequest) -> CorpusScore:
+    """Score a brand against every stored answer of a category.
+
+    Uses only answers earlier runs already paid for; Perplexity is not called.
+    A plain function, so the SQLite query and the matcher scan run in the
+    threadpool rather than on the event loop.
+    """
+    result = corpus.get_corpus().score(
+        body.category, body.brand_name, body.aliases, body.domain
+    )
+    if not result["answers"]:
+        raise HTTPException(status_code=404, detail="No stored answers for category")
+    return CorpusScore(**result)
+
+
+@router.get("/corpus/citations", response_model=CorpusCitations)
+def corpus_citations(
+    category: str | None = Query(None, description="Market category; all if omitted"),
+    domain: str = Query("", description="Count the answers citing this domain"),
+    limit: int = Query(20, ge=1, le=200),
+) -> CorpusCitations:
+    """Most cited source domains across all stored runs.
+
+    A plain function: the SQLite aggregates run in the threadpool.
+    """
+    return CorpusCitations(
+        **corpus.get_corpus().cited_domains(category, domain, limit=limit)
+    )
+
+
+@router.get("/runs/{domain}/trend", response_model=ExposureTrend)
+def exposure_trend(
+    domain: str,
+    bucket: run_store.Bucket = Query("day", description="Group runs by period"),
+    since: datetime | None = Query(None),
+    until: datetime | None = Query(None),
+) -> ExposureTrend:
+    """Exposure rate of a domain over time, aggregated in the run store.
+
+    Competitor reports of ``/compare`` runs are not counted. A plain
+    function, so the SQLite query runs in the threadpool.
+    """
+    domain = domain.strip().lower()
+    points = run_store.get_store().trend(
+        domain,
+        bucket,
+        since.timestamp() if since else None,
+        until.timestamp() if until else None,
+    )
+    return ExposureTrend(domain=domain, bucket=bucket, points=points)
+
+
+@router.get("/runs/{domain}/prompts", response_model=PromptStabilityResponse)
+def prompt_stability(
+    domain: str,
+    min_runs: int = Query(2, ge=2, description="Only prompts asked this often"),
+    since: datetime | None = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+) -> PromptStabilityResponse:
+    """Per-prompt mention stability across a domain's runs, least stable first.
 
-    return ExposureReport(**report_data)
+    Prompts are matched on their normalised text; with ``PROMPT_REUSE``
+    repeat runs ask the same prompts again. A plain function, so the SQLite
+    query runs in the threadpool.
+    """
+    domain = domain.strip().lower()
+    prompts = run_store.get_store().prompt_stability(
+        domain, min_runs, since.timestamp() if since else None, limit
+    )
+    return PromptStabilityResponse(domain=domain, prompts=prompts)
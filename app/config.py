@@ -1,5 +1,7 @@
 """Application configuration loaded from environment variables."""
 
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -14,6 +16,16 @@ class Settings(BaseSettings):
     FIRECRAWL_API_KEY: str
     PERPLEXITY_API_KEY: str
     LLM_MODEL: str = "gpt-4o"
+    # Per-node models; empty falls back to LLM_MODEL
+    BRAND_LLM_MODEL: str = ""
+    PROMPT_LLM_MODEL: str = ""
+    SUMMARY_LLM_MODEL: str = "gpt-4o-mini"
+    OPENAI_MAX_CONNECTIONS: int = 50
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    # Exact-match response cache for temperature-0 LLM calls (opt-in)
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_TTL: int = 604800
+    LLM_CACHE_MAX_ENTRIES: int = 5000
     LOG_LEVEL: str = "INFO"
 
     # LangSmith tracing (optional)
@@ -22,12 +34,101 @@ class Settings(BaseSettings):
     LANGSMITH_TRACING: bool = False
     LANGSMITH_ENDPOINT: str = "https://smith.langchain.com"
 
+    # Local caches share one SQLite file
+    CACHE_DB_PATH: str = ".cache/cache.db"
+
+    # Answer corpus: every Perplexity answer, full-text indexed by category
+    CORPUS_ENABLED: bool = True
+    CORPUS_DB_PATH: str = ".cache/corpus.db"
+
+    # Run store: every report, for exposure trends and prompt stability
+    RUN_STORE_ENABLED: bool = True
+    RUN_STORE_DB_PATH: str = ".cache/runs.db"
+    # Repeat runs of a domain ask the prompts of its latest stored run again
+    PROMPT_REUSE: bool = True
+
+    # Brand research
+    RESEARCH_DEADLINE: float = 20.0  # shared budget for search + homepage scrape
+    HOMEPAGE_TIMEOUT: float = 15.0
+    HOMEPAGE_MAX_BYTES: int = 512_000  # stop downloading the homepage after this
+    HOMEPAGE_MAX_CHARS: int = 6000  # visible text handed to the LLM
+    HOMEPAGE_PARSE_WORKERS: int = 4
+    # Search + homepage passages are deduped, ranked and packed into this
+    # many tokens before brand extraction.
+    BRAND_CONTEXT_TOKEN_BUDGET: int = 4000
+    BRAND_CONTEXT_CHUNK_TOKENS: int = 200
+    BRAND_CONTEXT_DEDUP_THRESHOLD: float = 0.8
+    # Startup waits this long for the tokenizer to load (it may download)
+    TOKENIZER_WARMUP_TIMEOUT: float = 10.0
+    BRAND_CACHE_ENABLED: bool = True
+    BRAND_CACHE_TTL: int = 86400  # fresh for 1 day …
+    BRAND_CACHE_STALE_TTL: int = 604800  # … then served stale for up to 7 more
+
+    # Firecrawl search: lite mode asks for titles/descriptions only and
+    # re-searches with full markdown when the extraction is low-confidence.
+    FIRECRAWL_LITE_MODE: bool = False
+    FIRECRAWL_LITE_MAX_RESULTS: int = 5
+    FIRECRAWL_MIN_CONFIDENCE: float = 0.6
+    FIRECRAWL_CACHE_ENABLED: bool = True
+    FIRECRAWL_CACHE_TTL: int = 86400
+
+    # Shared outbound HTTP client (homepage scraping)
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_CACHE_ENABLED: bool = True  # ETag / Last-Modified revalidation
+    HTTP_CACHE_TTL: int = 2592000  # forget validators after 30 days
+
     # Perplexity & Prompts
     PERPLEXITY_TIMEOUT: int = 30
+    # Adaptive concurrency: starts at PERPLEXITY_MAX_WORKERS and moves
+    # between the min/max bounds based on latency and 429/5xx responses.
     PERPLEXITY_MAX_WORKERS: int = 1
+    PERPLEXITY_MIN_CONCURRENCY: int = 1
+    PERPLEXITY_MAX_CONCURRENCY: int = 32
+    PERPLEXITY_BACKOFF_RATIO: float = 0.5
+    PERPLEXITY_LATENCY_TOLERANCE: float = 2.0
+    PERPLEXITY_MAX_CONNECTIONS: int = 50
+    PERPLEXITY_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    PERPLEXITY_KEEPALIVE_EXPIRY: float = 60.0  # seconds an idle connection is kept
+    PERPLEXITY_MAX_RETRIES: int = 2
+    PERPLEXITY_RETRY_BASE_DELAY: float = 0.5
+    PERPLEXITY_RETRY_MAX_DELAY: float = 8.0
+    PERPLEXITY_HEDGE_ENABLED: bool = False
+    PERPLEXITY_HEDGE_QUANTILE: float = 0.95
+    PERPLEXITY_HEDGE_MIN_SAMPLES: int = 20
+    PERPLEXITY_CACHE_ENABLED: bool = True
+    PERPLEXITY_CACHE_TTL: int = 86400  # 24 hours
+    PERPLEXITY_CACHE_MEMORY_SIZE: int = 512
+    PERPLEXITY_CACHE_MAX_ENTRIES: int = 10000
+    # Full Perplexity payloads are kept out of graph state; opt in to retain
+    # them in the side store (referenced by PerplexityResult.raw_ref).
+    PERPLEXITY_KEEP_RAW: bool = False
+    PERPLEXITY_RAW_TTL: int = 86400
+    PERPLEXITY_RAW_MAX_ENTRIES: int = 10000
     PROMPTS_COUNT: int = 1
+    PROMPT_STREAMING: bool = False  # dispatch prompts while the LLM streams
+    FUSED_PROMPT_GENERATION: bool = False  # brand extraction also writes prompts
+    # Report summary: "inline" (LLM, blocking), "deferred" (LLM, background)
+    # or "template" (local, no LLM)
+    SUMMARY_MODE: Literal["inline", "deferred", "template"] = "inline"
+    SUMMARY_TTL: int = 86400  # how long deferred summaries can be fetched
+    SUMMARY_DRAIN_TIMEOUT: float = 10.0  # shutdown wait for running summaries
+    CITATION_TOP_DOMAINS: int = 10  # most cited source domains in the report
     WORKFLOW_TIMEOUT: int = 300  # 5 minutes
 
+    # Outbound rate limits (requests/second, 0 = unlimited). The "sqlite"
+    # backend shares bucket state between uvicorn workers on the same host.
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" | "sqlite"
+    RATE_LIMIT_DB_PATH: str = ".cache/ratelimit.db"
+    PERPLEXITY_RATE_LIMIT_RPS: float = 0
+    PERPLEXITY_RATE_LIMIT_BURST: int = 5
+    OPENAI_RATE_LIMIT_RPS: float = 0
+    OPENAI_RATE_LIMIT_BURST: int = 5
+    FIRECRAWL_RATE_LIMIT_RPS: float = 0
+    FIRECRAWL_RATE_LIMIT_BURST: int = 2
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
 
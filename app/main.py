@@ -2,11 +2,16 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.agent import context_builder, llm, summaries
+from app.agent.tools import homepage, http_client, perplexity
 from app.api.routes import router
 from app.config import configure_langsmith, settings
 
@@ -18,6 +23,32 @@ logging.basicConfig(
     level=getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO),
     format="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
 )
+logger = logging.getLogger(__name__)
+
+# ── Lifespan ────────────────────────────────────────────────────────────────
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Own the shared outbound HTTP client; release pooled clients on shutdown."""
+    await http_client.open_http_client()
+    # Load the tokenizer (a download, if it is not bundled) before the first
+    # brand extraction needs it
+    try:
+        await asyncio.wait_for(
+            asyncio.to_thread(context_builder.warm_encoder),
+            timeout=settings.TOKENIZER_WARMUP_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        logger.warning(
+            "Tokenizer still loading | timeout=%ss", settings.TOKENIZER_WARMUP_TIMEOUT
+        )
+    yield
+    # Deferred summaries still use the LLM clients closed below
+    await summaries.drain(settings.SUMMARY_DRAIN_TIMEOUT)
+    await http_client.close_http_client()
+    await llm.close_llm_clients()
+    await perplexity.close_clients()
+    homepage.shutdown_parse_pool()
+
 
 # ── App ─────────────────────────────────────────────────────────────────────
 app = FastAPI(
@@ -27,6 +58,7 @@ app = FastAPI(
         "is exposed on Perplexity AI."
     ),
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS — allow all origins for now (easy UI integration later)
@@ -1,7 +1,19 @@
 """API request schemas."""
 
 import re
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, field_validator, model_validator
+
+
+def _normalise_domain(v: str) -> str:
+    v = v.strip().lower()
+    # Strip protocol if the user provided a full URL
+    v = re.sub(r"^https?://", "", v)
+    # Strip trailing slash / path
+    v = v.split("/")[0]
+    pattern = r"^([a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$"
+    if not re.match(pattern, v):
+        raise ValueError(f"Invalid domain: {v}")
+    return v
 
 
 class EvaluateRequest(BaseModel):
@@ -9,6 +21,7 @@ class EvaluateRequest(BaseModel):
 
     domain: str
     prompts_count: int = 5
+    force_refresh: bool = False  # re-research the brand instead of using the cache
 
     @field_validator("prompts_count")
     @classmethod
@@ -20,12 +33,43 @@ class EvaluateRequest(BaseModel):
     @field_validator("domain")
     @classmethod
     def validate_domain(cls, v: str) -> str:
-        v = v.strip().lower()
-        # Strip protocol if the user provided a full URL
-        v = re.sub(r"^https?://", "", v)
-        # Strip trailing slash / path
-        v = v.split("/")[0]
-        pattern = r"^([a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$"
-        if not re.match(pattern, v):
-            raise ValueError(f"Invalid domain: {v}")
-        return v
+        return _normalise_domain(v)
+
+
+class CompareRequest(EvaluateRequest):
+    """Request body for the /compare endpoint."""
+
+    competitor_domains: list[str]
+
+    @field_validator("competitor_domains")
+    @classmethod
+    def validate_competitors(cls, v: list[str]) -> list[str]:
+        return list(dict.fromkeys(_normalise_domain(d) for d in v))
+
+    @model_validator(mode="after")
+    def validate_comparison(self) -> "CompareRequest":
+        self.competitor_domains = [d for d in self.competitor_domains if d != self.domain]
+        if not (1 <= len(self.competitor_domains) <= 9):
+            raise ValueError("Between 1 and 9 competitor domains are required")
+        return self
+
+
+class CorpusScoreRequest(BaseModel):
+    """Request body for the /corpus/score endpoint."""
+
+    category: str  # market category, as in the brand context
+    brand_name: str
+    aliases: list[str] = []
+    domain: str = ""
+
+    @field_validator("category", "brand_name")
+    @classmethod
+    def validate_not_blank(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("Must not be blank")
+        return v.strip()
+
+    @field_validator("domain")
+    @classmethod
+    def validate_domain(cls, v: str) -> str:
+        return _normalise_domain(v) if v.strip() else ""
@@ -1,8 +1,12 @@
 """API response schemas."""
 
 from datetime import datetime
+from typing import Literal
+
 from pydantic import BaseModel
 
+SummaryStatus = Literal["pending", "ready", "failed"]
+
 
 class PromptResult(BaseModel):
     """A single prompt result shown in the report."""
@@ -10,28 +14,228 @@ class PromptResult(BaseModel):
     prompt: str
     mention_context: str | None = None
     sources: list[str] = []
+    source_domains: list[str] = []  # registrable domains of the sources
+    own_domain_cited: bool = False
     completion_summary: str | None = None
+    error: str | None = None  # set when the Perplexity query failed
+
+
+class UsageSummary(BaseModel):
+    """Perplexity token and cost totals for one evaluation."""
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+    # Answered from the response cache or a shared in-flight call: no cost
+    unbilled_prompts: int = 0
+
+
+class CitedDomain(BaseModel):
+    """A source domain and how often Perplexity cited it."""
+
+    domain: str
+    citations: int  # cited URLs on this domain
+    prompts: int  # answers citing it at least once
+    is_own: bool = False  # the evaluated brand's domain
+
+
+class ShareOfVoice(BaseModel):
+    """Visibility of the brand or one competitor across the answers."""
+
+    entity: str
+    is_brand: bool = False
+    mentions: int  # total mentions over all answers
+    prompts_mentioned: int  # answers naming the entity at least once
+    share_of_voice: float  # % of all brand + competitor mentions
+    first_mentions: int  # answers in which it was named before the others
+    avg_first_mention_rank: float | None = None  # 1 = named first
 
 
 class ExposureReport(BaseModel):
     """Full brand-exposure report returned by the /evaluate endpoint."""
 
+    report_id: str | None = None
     domain: str
     brand_name: str
-    exposure_rate: float  # e.g. 40.0 for 40%
+    exposure_rate: float  # e.g. 40.0 for 40%, over prompts that ran successfully
     total_prompts: int
     brand_mentioned_count: int
     brand_not_mentioned_count: int
+    failed_prompts_count: int = 0
     appeared_examples: list[PromptResult]
     not_appeared_examples: list[PromptResult]
+    failed_examples: list[PromptResult] = []
+    share_of_voice: list[ShareOfVoice] = []  # the brand first, then competitors
+    # co_mentions[a][b]: answers naming both a and b (diagonal: a alone)
+    co_mentions: dict[str, dict[str, int]] = {}
+    citation_domains: list[CitedDomain] = []  # most cited first
+    own_domain_cited_count: int = 0  # answers citing the brand's own domain
+    usage: UsageSummary = UsageSummary()
     summary: str
+    # "pending" while a deferred summary is written; fetch it by report_id
+    summary_status: SummaryStatus = "ready"
     generated_at: datetime
 
 
+class FailedCompetitor(BaseModel):
+    """A competitor left out of a comparison because its research failed."""
+
+    domain: str
+    error: str
+
+
+class ComparisonReport(BaseModel):
+    """Reports for several brands scored on one shared set of answers."""
+
+    prompts: list[str]
+    reports: list[ExposureReport]  # the requested domain first
+    failed_competitors: list[FailedCompetitor] = []
+    # Perplexity usage of the shared run, spent once for all brands
+    usage: UsageSummary = UsageSummary()
+
+
+class CorpusExample(PromptResult):
+    """A stored answer that mentions the scored brand."""
+
+    evaluated_domain: str  # the run that paid for this answer
+
+
+class CorpusScore(BaseModel):
+    """Historical exposure of a brand across stored answers of a category."""
+
+    category: str
+    brand_name: str
+    answers: int  # stored answers in the category
+    candidates: int  # answers the full-text index returned
+    mentioned: int  # candidates the brand matcher confirmed
+    exposure_rate: float
+    examples: list[CorpusExample] = []
+
+
+class CorpusCitations(BaseModel):
+    """Most cited source domains across the stored answers."""
+
+    category: str | None = None  # None: every category
+    answers: int
+    domains: list[CitedDomain] = []
+    own_domain_cited_count: int = 0  # answers citing the requested domain
+
+
+class CorpusCategory(BaseModel):
+    category: str
+    answers: int
+
+
+class TrendPoint(BaseModel):
+    """Exposure of one period (or one run) in a trend."""
+
+    period: str  # run id, "2026-10-17", "2026-W41" or "2026-10"
+    runs: int
+    first_run_at: datetime
+    last_run_at: datetime
+    evaluated: int
+    mentioned: int
+    exposure_rate: float | None = None  # over every evaluated prompt of the period
+    avg_run_exposure_rate: float  # mean of the runs' own rates
+    input_tokens: int
+    output_tokens: int
+    cost_usd: float
+
+
+class ExposureTrend(BaseModel):
+    """Exposure-rate time series for a domain, from the run store."""
+
+    domain: str
+    bucket: Literal["run", "day", "week", "month"]
+    points: list[TrendPoint]
+
+
+class PromptStability(BaseModel):
+    """How consistently a recurring prompt mentions the brand across runs."""
+
+    prompt: str
+    runs: int
+    mentioned: int
+    mention_rate: float
+    flips: int  # outcome changes between consecutive runs
+    stability: float  # 1 - flips / (runs - 1)
+    first_seen: datetime
+    last_seen: datetime
+
+
+class PromptStabilityResponse(BaseModel):
+    domain: str
+    prompts: list[PromptStability]
+
+
+class SummaryResponse(BaseModel):
+    """Narrative summary of a report, returned by /reports/{id}/summary."""
+
+    report_id: str
+    status: SummaryStatus
+    summary: str
+    error: str | None = None
+
+
 class HealthResponse(BaseModel):
     status: str = "ok"
     version: str = "1.0.0"
 
 
+class ConcurrencyStats(BaseModel):
+    """Live state of an adaptive concurrency limiter."""
+
+    name: str
+    limit: int
+    in_flight: int
+    queue_depth: int
+    latency_avg_s: float | None = None
+    successes: int
+    overloads: int
+
+
+class CacheStats(BaseModel):
+    """Hit / miss counters of a local cache."""
+
+    namespace: str
+    hits: int
+    misses: int
+    memory_hits: int
+    hit_rate: float
+    entries: int
+
+
+class SingleFlightStats(BaseModel):
+    """Request coalescing counters."""
+
+    in_flight: int
+    leaders: int
+    coalesced: int
+
+
+class LLMNodeStats(BaseModel):
+    """Per-node LLM calls, token usage and latency."""
+
+    node: str
+    model: str
+    calls: int
+    cache_hits: int = 0
+    errors: int
+    input_tokens: int
+    output_tokens: int
+    latency_p50_s: float | None = None
+    latency_p95_s: float | None = None
+
+
+class StatsResponse(BaseModel):
+    """Runtime statistics for outbound API usage."""
+
+    perplexity_concurrency: ConcurrencyStats
+    perplexity_single_flight: SingleFlightStats
+    perplexity_cache: CacheStats | None = None
+    llm: list[LLMNodeStats] = []
+    llm_cache: CacheStats | None = None
+
+
 class ErrorResponse(BaseModel):
     detail: str
@@ -0,0 +1,96 @@
+"""Micro-benchmark: brand mention detection over many completions.
+
+Compares the original detection (lowercase substring test, then a regex
+sentence split of the whole completion for the context) with
+``app.agent.matcher.BrandMatcher`` (one precompiled regex, context sliced
+around the match offsets) on synthetic Perplexity-style answers: a "sparse"
+corpus where half the answers mention the brand once, and a "dense" one where
+the brand is in a few sentences of every answer. The matcher also finds
+variants (``acme-cloud's``) the substring test misses, so hit counts differ.
+
+Run with:
+
+    poetry run python benchmarks/brand_matcher.py [--completions N] [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.agent.matcher import BrandMatcher  # noqa: E402
+
+BRAND = "Acme Cloud"
+SENTENCES = [
+    "Several tools are popular with data teams in 2024.",
+    "Rival and Other Corp focus on enterprise customers.",
+    "Pricing varies by seat count and data volume.",
+    "You should compare integrations before committing to a vendor.",
+    "Open-source alternatives exist but need more maintenance.",
+]
+BRAND_SENTENCES = [
+    "Acme Cloud offers managed pipelines with a generous free tier.",
+    "Many reviewers mention acme-cloud's onboarding as a strength.",
+]
+
+
+def corpus(count: int, *, dense: bool, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        if dense:
+            texts.append(" ".join(rng.choices(SENTENCES + BRAND_SENTENCES, k=40)))
+            continue
+        sentences = rng.choices(SENTENCES, k=40)
+        if i % 2 == 0:
+            sentences[rng.randrange(40)] = rng.choice(BRAND_SENTENCES)
+        texts.append(" ".join(sentences))
+    return texts
+
+
+def baseline(texts: list[str]) -> int:
+    """The pre-matcher implementation, kept verbatim for comparison."""
+    hits = 0
+    for text in texts:
+        if BRAND.lower() in text.lower():
+            sentences = re.split(r"(?<=[.!?])\s+", text)
+            " ".join(s.strip() for s in sentences if BRAND.lower() in s.lower())
+            hits += 1
+    return hits
+
+
+def optimized(texts: list[str]) -> int:
+    matcher = BrandMatcher.for_brand(BRAND, "acme-cloud.io")
+    hits = 0
+    for text in texts:
+        mentions = matcher.find(text)
+        if mentions:
+            matcher.context(text, mentions)
+            hits += 1
+    return hits
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--completions", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"completions: {args.completions}")
+    for name in ("sparse", "dense"):
+        texts = corpus(args.completions, dense=name == "dense")
+        old = min(timeit.repeat(lambda: baseline(texts), number=1, repeat=args.repeat))
+        new = min(timeit.repeat(lambda: optimized(texts), number=1, repeat=args.repeat))
+        print(f"[{name}] substring + split (ms): {old * 1000:8.1f}")
+        print(f"[{name}] BrandMatcher      (ms): {new * 1000:8.1f}   ({old / new:.1f}x)")
+        print(f"[{name}] hits: {baseline(texts)} substring vs {optimized(texts)} matcher")
+
+if __name__ == "__main__":
+    main()
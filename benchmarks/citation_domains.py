@@ -0,0 +1,84 @@
+"""Micro-benchmark: reducing citation URLs to registrable domains.
+
+Compares parsing every URL with ``tldextract`` (one suffix-list walk per
+URL) with ``app.agent.citations.registrable_domain`` (memoised per URL and
+per host) on synthetic citations: many distinct URLs spread over a few
+hundred source sites, as Perplexity answers cite them. Both sides count
+citations per domain with a ``Counter``.
+
+Run with:
+
+    poetry run python benchmarks/citation_domains.py [--urls N] [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Settings are only read for their defaults; dummy keys keep them importable.
+for key in ("OPENAI_API_KEY", "FIRECRAWL_API_KEY", "PERPLEXITY_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+sys.path.insert(0, str(ROOT))
+
+import tldextract  # noqa: E402
+
+from app.agent.citations import registrable_domain  # noqa: E402
+
+SUFFIXES = ["com", "io", "co.uk", "com.au", "org", "github.io"]
+SUBDOMAINS = ["", "www.", "blog.", "docs.", "en.", "news."]
+
+
+def corpus(count: int, sites: int = 300, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    hosts = [
+        f"{rng.choice(SUBDOMAINS)}site{i}.{rng.choice(SUFFIXES)}" for i in range(sites)
+    ]
+    # Popular sources are cited far more often than the long tail
+    weights = [1 / (rank + 1) for rank in range(sites)]
+    return [
+        f"https://{host}/article/{rng.randrange(count // 4 or 1)}"
+        for host in rng.choices(hosts, weights=weights, k=count)
+    ]
+
+
+def baseline(urls: list[str]) -> Counter[str]:
+    extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+    counts: Counter[str] = Counter()
+    for url in urls:
+        parts = extract(url)
+        counts[f"{parts.domain}.{parts.suffix}"] += 1
+    return counts
+
+
+def optimized(urls: list[str]) -> Counter[str]:
+    return Counter(d for d in map(registrable_domain, urls) if d)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    urls = corpus(args.urls)
+    old = min(timeit.repeat(lambda: baseline(urls), number=1, repeat=args.repeat))
+    registrable_domain.cache_clear()
+    cold = timeit.timeit(lambda: optimized(urls), number=1)
+    warm = min(timeit.repeat(lambda: optimized(urls), number=1, repeat=args.repeat))
+    print(f"urls: {len(urls)}  distinct: {len(set(urls))}")
+    print(f"tldextract per URL     (ms): {old * 1000:10.1f}")
+    print(f"memoised, cold caches  (ms): {cold * 1000:10.1f}   ({old / cold:.1f}x)")
+    print(f"memoised, warm caches  (ms): {warm * 1000:10.1f}   ({old / warm:.1f}x)")
+    assert baseline(urls) == optimized(urls)
+
+
+if __name__ == "__main__":
+    main()
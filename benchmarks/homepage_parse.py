@@ -0,0 +1,73 @@
+"""Micro-benchmark: homepage text extraction, BeautifulSoup vs lxml.
+
+Compares the original ``_scrape_homepage`` parse (BeautifulSoup with the
+pure-Python ``html.parser``, full document, truncate afterwards) with
+``app.agent.tools.homepage.extract_visible_text`` (lxml on the byte-capped
+body, early exit once enough text is collected) on the saved HTML fixtures
+in ``tests/fixtures/homepage``.
+
+Run with:
+
+    poetry run python benchmarks/homepage_parse.py [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = ROOT / "tests" / "fixtures" / "homepage"
+
+# Settings are only read for their defaults; dummy keys keep them importable.
+for key in ("OPENAI_API_KEY", "FIRECRAWL_API_KEY", "PERPLEXITY_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+sys.path.insert(0, str(ROOT))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from app.agent.tools.homepage import extract_visible_text  # noqa: E402
+from app.config import settings  # noqa: E402
+
+
+def baseline(data: bytes, max_chars: int) -> str:
+    """The pre-lxml implementation, kept verbatim for comparison."""
+    soup = BeautifulSoup(data.decode("utf-8", errors="replace"), "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    text = soup.get_text(separator=" ", strip=True)
+    return text[:max_chars]
+
+
+def optimized(data: bytes, max_chars: int) -> str:
+    return extract_visible_text(data[: settings.HOMEPAGE_MAX_BYTES], max_chars)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    max_chars = settings.HOMEPAGE_MAX_CHARS
+    print(
+        f"{'fixture':<16}{'bytes':>10}{'bs4 (ms)':>12}{'lxml (ms)':>12}{'speedup':>10}"
+    )
+    for path in sorted(FIXTURES.glob("*.html")):
+        data = path.read_bytes()
+        old = min(
+            timeit.repeat(lambda: baseline(data, max_chars), number=1, repeat=args.repeat)
+        )
+        new = min(
+            timeit.repeat(lambda: optimized(data, max_chars), number=1, repeat=args.repeat)
+        )
+        print(
+            f"{path.name:<16}{len(data):>10}{old * 1000:>12.2f}{new * 1000:>12.2f}"
+            f"{old / new:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,10 @@
 
 from __future__ import annotations
 
+from pathlib import Path
+
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from app.agent.state import AgentState, PerplexityResult
 
@@ -34,14 +36,42 @@ def _base_state(**overrides) -> AgentState:
     return state
 
 
+def _result(prompt: str = "p", completion: str = "", **fields) -> PerplexityResult:
+    """Return a PerplexityResult; fields not given are empty or false."""
+    fields = {
+        "citations": (), "brand_mentioned": False, "brand_mention_context": "",
+        **fields,
+    }
+    return PerplexityResult(prompt, completion, **fields)
+
+
 # ── brand_researcher tests ───────────────────────────────────────────────────
 
 @pytest.fixture(autouse=True)
-def _mock_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+def _mock_settings(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
     monkeypatch.setenv("OPENAI_API_KEY", "test-key")
     monkeypatch.setenv("FIRECRAWL_API_KEY", "test-key")
     monkeypatch.setenv("PERPLEXITY_API_KEY", "test-key")
 
+    # Give every test its own, empty on-disk caches
+    from app.agent import corpus, llm_cache, raw_store, run_store, summaries
+    from app.agent.nodes import brand_researcher
+    from app.agent.tools import homepage, perplexity, web_search
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "CACHE_DB_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(perplexity, "_response_cache", None)
+    monkeypatch.setattr(raw_store, "_store", None)
+    monkeypatch.setattr(llm_cache, "_store", None)
+    monkeypatch.setattr(summaries, "_store", None)
+    monkeypatch.setattr(brand_researcher, "_brand_cache", None)
+    monkeypatch.setattr(homepage, "_http_cache", None)
+    monkeypatch.setattr(web_search, "_search_cache", None)
+    monkeypatch.setattr(settings, "CORPUS_DB_PATH", str(tmp_path / "corpus.db"))
+    monkeypatch.setattr(corpus, "_corpus", None)
+    monkeypatch.setattr(settings, "RUN_STORE_DB_PATH", str(tmp_path / "runs.db"))
+    monkeypatch.setattr(run_store, "_store", None)
+
 
 @pytest.mark.asyncio
 async def test_brand_researcher_success() -> None:
@@ -69,24 +99,300 @@ async def test_brand_researcher_success() -> None:
             return_value="Welcome to TestBrand",
         ),
         patch(
-            "app.agent.nodes.brand_researcher.ChatOpenAI"
-        ) as mock_llm_cls,
+            "app.agent.nodes.brand_researcher.get_llm"
+        ) as mock_get_llm,
     ):
         # Mock the structured LLM chain
-        mock_structured = MagicMock(return_value=fake_info)
+        mock_structured = AsyncMock(return_value=fake_info)
         mock_llm_instance = MagicMock()
         mock_llm_instance.with_structured_output.return_value = MagicMock(
-            invoke=mock_structured
+            ainvoke=mock_structured
         )
-        mock_llm_cls.return_value = mock_llm_instance
+        mock_get_llm.return_value = mock_llm_instance
 
         state = _base_state()
-        result = brand_researcher(state)
+        result = await brand_researcher(state)
 
     assert result["brand_name"] == "TestBrand"
     assert result["brand_context"]["market_category"] == "B2B SaaS"
 
 
+@pytest.mark.asyncio
+async def test_gather_research_uses_homepage_text() -> None:
+    """The awaited homepage text is returned alongside the search results."""
+    from app.agent.nodes.brand_researcher import _gather_research
+
+    with (
+        patch(
+            "app.agent.nodes.brand_researcher.search_brand",
+            return_value=[{"title": "T", "url": "https://example.com", "content": "C"}],
+        ),
+        patch(
+            "app.agent.nodes.brand_researcher._scrape_homepage",
+            return_value="Welcome to TestBrand",
+        ),
+    ):
+        search_results, homepage_text = await _gather_research("example.com")
+
+    assert search_results[0]["title"] == "T"
+    assert homepage_text == "Welcome to TestBrand"
+
+
+@pytest.mark.asyncio
+async def test_gather_research_drops_slow_source(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A source that misses the shared deadline is cancelled and left empty."""
+    import asyncio
+
+    from app.agent.nodes.brand_researcher import _gather_research
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "RESEARCH_DEADLINE", 0.05)
+
+    async def slow_scrape(domain: str) -> str:
+        await asyncio.sleep(5)
+        return "too late"
+
+    with (
+        patch(
+            "app.agent.nodes.brand_researcher.search_brand",
+            return_value=[{"title": "T", "url": "https://example.com", "content": "C"}],
+        ),
+        patch("app.agent.nodes.brand_researcher._scrape_homepage", slow_scrape),
+    ):
+        search_results, homepage_text = await _gather_research("example.com")
+
+    assert len(search_results) == 1
+    assert homepage_text == ""
+
+
+@pytest.mark.asyncio
+async def test_lite_search_falls_back_to_full_on_low_confidence(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A low-confidence lite extraction reruns with a full Firecrawl search."""
+    from app.agent.nodes.brand_researcher import BrandInfo, _research_brand
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "FIRECRAWL_LITE_MODE", True)
+    base = _base_state()["brand_context"]
+    unsure = BrandInfo(**base, confidence=0.2)
+    sure = BrandInfo(**base, confidence=0.9)
+
+    modes: list[bool] = []
+
+    async def fake_search(query: str, max_results: int = 10, *, full: bool = True):
+        modes.append(full)
+        return [{"title": "T", "url": "https://example.com", "content": "C"}]
+
+    with (
+        patch("app.agent.nodes.brand_researcher.search_brand", fake_search),
+        patch("app.agent.nodes.brand_researcher._scrape_homepage", return_value=""),
+        patch("app.agent.nodes.brand_researcher.get_llm") as mock_get_llm,
+    ):
+        extract = AsyncMock(side_effect=[unsure, sure])
+        mock_get_llm.return_value.with_structured_output.return_value = MagicMock(
+            ainvoke=extract
+        )
+        context = await _research_brand("example.com")
+
+    assert modes == [False, True]
+    assert extract.await_count == 2
+    assert "confidence" not in context
+
+
+@pytest.mark.asyncio
+async def test_search_brand_reuses_client_and_caches_results(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Repeat queries are served from the cache by one shared client."""
+    from app.agent.tools import web_search
+
+    monkeypatch.setattr(web_search, "_app", None)
+    response = {"data": [{"title": "T", "url": "https://example.com", "description": "D"}]}
+    with patch("app.agent.tools.web_search.FirecrawlApp") as mock_app_cls:
+        mock_app_cls.return_value.search.return_value = response
+        first = await web_search.search_brand("q", 5, full=False)
+        second = await web_search.search_brand("q", 5, full=False)
+        await web_search.search_brand("other", 5, full=False)
+
+    assert first == second == [{"title": "T", "url": "https://example.com", "content": "D"}]
+    assert mock_app_cls.call_count == 1
+    assert mock_app_cls.return_value.search.call_count == 2
+    _, kwargs = mock_app_cls.return_value.search.call_args
+    assert "scrapeOptions" not in kwargs["params"]
+
+
+# ── context builder tests ────────────────────────────────────────────────────
+
+def test_context_builder_dedupes_ranks_and_fits_budget() -> None:
+    """Repeated passages are dropped and the brand's passages win the budget."""
+    from app.agent.context_builder import build_brand_context
+
+    about = "Example is a product analytics platform that helps teams ship features."
+    filler = " ".join(f"Cookie notice number {i} about tracking." for i in range(200))
+    results = [
+        {"title": "Example", "url": "https://example.com/about", "content": about},
+        {"title": "Mirror", "url": "https://mirror.test", "content": about},
+        {"title": "Mirror 2", "url": "https://mirror2.test", "content": about + " "},
+        {"title": "Noise", "url": "https://noise.test", "content": filler},
+    ]
+
+    built = build_brand_context("example.com", results, "", budget=200)
+
+    assert built.tokens <= 200
+    assert built.duplicates == 2
+    assert built.search_text.count(about) == 1
+    assert "**Noise** (https://noise.test)" in built.search_text
+    assert built.passages_kept < built.passages_in
+
+
+def test_split_passages_respects_chunk_size() -> None:
+    from app.agent.context_builder import count_tokens, split_passages
+
+    text = "\n\n".join(f"Paragraph {i}. " + "word " * 30 for i in range(20))
+    passages = split_passages(text, max_tokens=100)
+
+    assert len(passages) > 1
+    assert all(count_tokens(p) <= 100 for p in passages)
+    assert "".join(passages).replace(" ", "") == text.replace(" ", "").replace("\n", "")
+
+
+@pytest.mark.asyncio
+async def test_brand_context_is_built_off_the_event_loop() -> None:
+    """Tokenizing and packing the research runs in a worker thread."""
+    import threading
+
+    from app.agent.context_builder import build_brand_context
+    from app.agent.nodes.brand_researcher import BrandInfo, _extract
+
+    threads: list[threading.Thread] = []
+
+    def build(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return build_brand_context(*args, **kwargs)
+
+    with (
+        patch("app.agent.nodes.brand_researcher.build_brand_context", build),
+        patch("app.agent.nodes.brand_researcher.get_llm") as mock_get_llm,
+    ):
+        mock_get_llm.return_value.with_structured_output.return_value = MagicMock(
+            ainvoke=AsyncMock(return_value=BrandInfo(**_base_state()["brand_context"]))
+        )
+        await _extract("example.com", [], "Example helps teams ship.")
+
+    assert threads and threads[0] is not threading.main_thread()
+
+
+@pytest.mark.asyncio
+async def test_fused_mode_returns_prompts_and_skips_generator(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """One extraction call yields context and prompts; the graph skips node 2."""
+    from app.agent.graph import _route_after_research
+    from app.agent.nodes.brand_researcher import BrandResearch, brand_researcher
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "FUSED_PROMPT_GENERATION", True)
+    research = BrandResearch(
+        **_base_state()["brand_context"],
+        prompts=["Best tool for X?", "Alternatives to Rival?", "Third?"],
+    )
+
+    with (
+        patch("app.agent.nodes.brand_researcher.search_brand", return_value=[]),
+        patch("app.agent.nodes.brand_researcher._scrape_homepage", return_value=""),
+        patch("app.agent.nodes.brand_researcher.get_llm") as mock_get_llm,
+    ):
+        structured = mock_get_llm.return_value.with_structured_output
+        structured.return_value = MagicMock(ainvoke=AsyncMock(return_value=research))
+        result = await brand_researcher(_base_state(prompts_count=2))
+        cached = await brand_researcher(_base_state(prompts_count=2))
+
+    structured.assert_called_once_with(BrandResearch)
+    assert result["generated_prompts"] == ["Best tool for X?", "Alternatives to Rival?"]
+    assert "prompts" not in result["brand_context"]
+    assert _route_after_research(_base_state(**result)) == "perplexity_runner"
+    # Prompts are not cached, so a cache hit goes through the generator
+    assert "generated_prompts" not in cached
+    assert _route_after_research(_base_state(**cached)) == "prompt_generator"
+
+
+@pytest.mark.asyncio
+async def test_failed_competitor_is_dropped_from_the_comparison() -> None:
+    """A competitor whose research fails is reported, not fatal to the run."""
+    from app.agent.nodes.brand_researcher import brand_researcher
+
+    async def fake_research(domain, **_):
+        if domain == "broken.com":
+            raise RuntimeError("scrape failed")
+        return {"brand_name": domain.split(".")[0].title()}
+
+    with patch("app.agent.nodes.brand_researcher._cached_research", fake_research):
+        result = await brand_researcher(
+            _base_state(competitor_domains=["rival.com", "broken.com"])
+        )
+        failed = await brand_researcher(
+            _base_state(domain="broken.com", competitor_domains=["rival.com"])
+        )
+
+    assert [b["domain"] for b in result["comparison"]] == ["example.com", "rival.com"]
+    assert result["comparison_failed"] == [
+        {"domain": "broken.com", "error": "scrape failed"}
+    ]
+    assert failed["error"] == "Brand research failed: scrape failed"
+
+
+# ── brand matcher tests ──────────────────────────────────────────────────────
+
+def test_brand_matcher_finds_aliases_domain_and_variants() -> None:
+    from app.agent.matcher import BrandMatcher
+
+    matcher = BrandMatcher.for_brand("HubSpot", "www.hubspot.com", ["HubSpot CRM"])
+    text = (
+        "Teams like Hub Spot. Check your inbox first! See hubspot.com for pricing.\n"
+        "HubSpot CRM is free. A Hubspotter wrote this."
+    )
+
+    mentions = matcher.find(text)
+
+    assert [m.text for m in mentions] == ["Hub Spot", "hubspot.com", "HubSpot CRM"]
+    assert text[mentions[1].start : mentions[1].end] == "hubspot.com"
+    assert matcher.context(text, mentions) == (
+        "Teams like Hub Spot. See hubspot.com for pricing. HubSpot CRM is free."
+    )
+    assert BrandMatcher.for_brand("HubSpot", "www.hubspot.com", ["HubSpot CRM"]) is matcher
+
+
+def test_brand_matcher_avoids_short_name_false_positives() -> None:
+    from app.agent.matcher import BrandMatcher
+
+    matcher = BrandMatcher.for_brand("Box", "box.com")
+
+    assert matcher.find("Check your inbox, then box it up.") == []
+    assert [m.text for m in matcher.find("Box and box.com are fine.")] == ["Box", "box.com"]
+
+
+def test_brand_matcher_attributes_competitor_mentions_in_one_scan() -> None:
+    from app.agent.matcher import BrandMatcher
+
+    matcher = BrandMatcher.for_brand(
+        "Acme", "acme.io", competitors=["Rival", "Other Corp", "acme"]
+    )
+    text = "Rival leads. OtherCorp and Acme follow; acme.io beats rival on price."
+
+    mentions = matcher.find(text)
+
+    assert matcher.entities == ("Acme", "Rival", "Other Corp")
+    assert [(m.text, m.entity) for m in mentions] == [
+        ("Rival", "Rival"),
+        ("OtherCorp", "Other Corp"),
+        ("Acme", "Acme"),
+        ("acme.io", "Acme"),
+        ("rival", "Rival"),
+    ]
+    assert matcher.search("Only Rival here.") is False
+
+
 # ── perplexity_runner tests ──────────────────────────────────────────────────
 
 @pytest.mark.asyncio
@@ -115,7 +421,7 @@ async def test_perplexity_runner_detects_brand() -> None:
         state = _base_state(
             generated_prompts=["What are the best tools for testing?"]
         )
-        result = perplexity_runner(state)
+        result = await perplexity_runner(state)
 
     results = result["perplexity_results"]
     assert len(results) == 1
@@ -146,8 +452,1239 @@ async def test_perplexity_runner_no_mention() -> None:
         state = _base_state(
             generated_prompts=["What are the best tools?"]
         )
-        result = perplexity_runner(state)
+        result = await perplexity_runner(state)
 
     results = result["perplexity_results"]
     assert len(results) == 1
     assert results[0].brand_mentioned is False
+
+
+# ── prompt streaming tests ───────────────────────────────────────────────────
+
+def test_prompt_stream_parser_emits_each_string_on_close() -> None:
+    """PromptStreamParser yields prompts incrementally across chunk borders."""
+    from app.agent.nodes.prompt_generator import PromptStreamParser
+
+    parser = PromptStreamParser()
+    chunks = ['```json\n["Best CRM', ' for \\"small\\" teams?", "How to', ' [fix] it?"', "]\n```"]
+    emitted = [parser.feed(chunk) for chunk in chunks]
+
+    assert emitted == [[], ['Best CRM for "small" teams?'], ["How to [fix] it?"], []]
+    assert parser.finished is True
+
+
+@pytest.mark.asyncio
+async def test_prompt_pipeline_dispatches_streamed_prompts() -> None:
+    """prompt_pipeline queries Perplexity for every streamed prompt."""
+    from app.agent.nodes.prompt_pipeline import prompt_pipeline
+
+    async def fake_stream(brand_context: dict, count: int):
+        for prompt in ["First prompt?", "Second prompt?"]:
+            yield prompt
+
+    fake_response = {
+        "choices": [{"message": {"content": "Example is great."}}],
+        "citations": [],
+    }
+
+    with (
+        patch("app.agent.nodes.prompt_pipeline.stream_prompts", fake_stream),
+        patch(
+            "app.agent.nodes.perplexity_runner.query_perplexity",
+            return_value=fake_response,
+        ) as mock_query,
+    ):
+        result = await prompt_pipeline(_base_state(prompts_count=2))
+
+    assert result["generated_prompts"] == ["First prompt?", "Second prompt?"]
+    assert [r.prompt for r in result["perplexity_results"]] == result["generated_prompts"]
+    assert all(r.brand_mentioned for r in result["perplexity_results"])
+    assert mock_query.await_count == 2
+
+
+# ── perplexity client pool tests ─────────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_perplexity_async_client_is_pooled() -> None:
+    """The async client is built once and reused until close_clients()."""
+    from app.agent.tools import perplexity
+
+    first = perplexity.get_async_client()
+    assert perplexity.get_async_client() is first
+
+    await perplexity.close_clients()
+    assert perplexity.get_async_client() is not first
+    await perplexity.close_clients()
+
+
+def test_perplexity_async_client_from_old_loop_is_closed() -> None:
+    """A client replaced because the event loop changed is closed, not leaked."""
+    import asyncio
+
+    from app.agent.tools import perplexity
+
+    async def client():
+        return perplexity.get_async_client()
+
+    async def replace():
+        fresh = perplexity.get_async_client()
+        await asyncio.sleep(0)  # let the scheduled close run
+        return fresh
+
+    first = asyncio.run(client())
+    second = asyncio.run(replace())
+    assert second is not first
+    assert first.is_closed()
+    asyncio.run(perplexity.close_clients())
+
+
+def test_perplexity_sync_client_is_pooled() -> None:
+    """The sync client is shared across calls and threads."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.agent.tools import perplexity
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        clients = list(executor.map(lambda _: perplexity.get_sync_client(), range(8)))
+
+    assert all(c is clients[0] for c in clients)
+
+
+# ── adaptive concurrency tests ───────────────────────────────────────────────
+
+class _Overload(Exception):
+    pass
+
+
+def _limiter(**overrides):
+    from app.agent.concurrency import AdaptiveLimiter
+
+    kwargs = dict(
+        initial_limit=2,
+        min_limit=1,
+        max_limit=8,
+        is_overload=lambda exc: isinstance(exc, _Overload),
+    )
+    kwargs.update(overrides)
+    return AdaptiveLimiter("test", **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter_queues_beyond_limit() -> None:
+    """Callers beyond the limit wait in the queue until a slot frees up."""
+    import asyncio
+
+    limiter = _limiter()
+    release = asyncio.Event()
+
+    async def call() -> None:
+        async with limiter.slot():
+            await release.wait()
+
+    tasks = [asyncio.create_task(call()) for _ in range(5)]
+    await asyncio.sleep(0)
+
+    assert limiter.in_flight == 2
+    assert limiter.queue_depth == 3
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert limiter.in_flight == 0
+    assert limiter.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter_grows_and_backs_off() -> None:
+    """Saturated successes raise the limit; an overload halves it."""
+    import asyncio
+
+    limiter = _limiter()
+
+    async def ok() -> None:
+        async with limiter.slot():
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(ok() for _ in range(4)))
+    grown = limiter.limit
+    assert grown > 2
+
+    with pytest.raises(_Overload):
+        async with limiter.slot():
+            raise _Overload()
+
+    assert limiter.limit == max(1, int(grown * 0.5))
+    assert limiter.snapshot()["overloads"] == 1
+
+
+# ── rate limiter tests ───────────────────────────────────────────────────────
+
+def test_memory_bucket_queues_instead_of_failing() -> None:
+    """Once the burst is spent, callers are told how long to wait."""
+    from app.agent.ratelimit import MemoryBucketBackend
+
+    backend = MemoryBucketBackend()
+    waits = [backend.reserve("p", rate=10.0, burst=2) for _ in range(4)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_sqlite_bucket_is_shared_between_workers(tmp_path) -> None:
+    """Two backends on the same file draw from one bucket."""
+    from app.agent.ratelimit import SQLiteBucketBackend
+
+    path = str(tmp_path / "ratelimit.db")
+    worker_a = SQLiteBucketBackend(path)
+    worker_b = SQLiteBucketBackend(path)
+
+    assert worker_a.reserve("openai", rate=1.0, burst=1) == 0.0
+    assert worker_b.reserve("openai", rate=1.0, burst=1) == pytest.approx(1.0, abs=0.05)
+    assert worker_b.reserve("firecrawl", rate=1.0, burst=1) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_smooths_calls() -> None:
+    """RateLimiter.acquire sleeps until the reserved token is due."""
+    import time
+
+    from app.agent.ratelimit import MemoryBucketBackend, RateLimiter
+
+    limiter = RateLimiter("p", rate=20.0, burst=1, backend=MemoryBucketBackend())
+    start = time.monotonic()
+    for _ in range(3):
+        await limiter.acquire()
+
+    assert time.monotonic() - start >= 0.09
+
+
+# ── persistent cache tests ───────────────────────────────────────────────────
+
+def test_persistent_cache_roundtrip_and_ttl(tmp_path) -> None:
+    """Values survive a new cache instance and expire after their TTL."""
+    from app.agent.cache import PersistentCache
+
+    path = str(tmp_path / "cache.db")
+    cache = PersistentCache("t", path=path, ttl=60)
+    cache.set("a", {"x": 1})
+    cache.set("gone", 1, ttl=-1)
+
+    reopened = PersistentCache("t", path=path, ttl=60)
+    assert reopened.get("a") == {"x": 1}
+    assert reopened.get("gone") is None
+    assert reopened.stats()["hits"] == 1
+    assert reopened.stats()["misses"] == 1
+
+
+def test_persistent_cache_evicts_least_recently_used(tmp_path) -> None:
+    """With max_entries set, the least recently accessed rows are dropped."""
+    from app.agent.cache import PersistentCache
+
+    cache = PersistentCache(
+        "t", path=str(tmp_path / "c.db"), ttl=60, memory_size=0, max_entries=2
+    )
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_persistent_cache_purges_expired_rows_on_write(tmp_path) -> None:
+    """Expired rows are removed on write even if their key is never read."""
+    from app.agent.cache import PersistentCache
+
+    path = str(tmp_path / "c.db")
+    other = PersistentCache("other", path=path, ttl=60)
+    other.set("x", 1)
+    other.set("y", 1, ttl=-1)
+    cache = PersistentCache("t", path=path, ttl=60)
+    cache.set("a", 1)
+    cache.set("old", 2, ttl=-1)  # within the purge interval: kept for now
+
+    def rows(namespace):
+        (count,) = cache._conn.execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return count
+
+    assert rows("t") == 2
+    cache._next_purge = 0.0  # the purge interval has passed
+    cache.set("b", 3)
+
+    assert rows("t") == 2  # "a" and "b"
+    assert rows("other") == 2  # other namespaces purge on their own writes
+    assert cache.get("old") is None
+
+
+@pytest.mark.asyncio
+async def test_persistent_cache_async_access_keeps_sqlite_off_the_loop(
+    tmp_path,
+) -> None:
+    """Async reads hit memory inline; disk reads and writes go to a thread."""
+    import asyncio
+
+    from app.agent.cache import PersistentCache
+
+    path = str(tmp_path / "c.db")
+    cache = PersistentCache("t", path=path, ttl=60)
+    with patch("app.agent.cache.asyncio.to_thread", wraps=asyncio.to_thread) as hop:
+        await cache.aset("a", {"x": 1})
+        assert await cache.aget("a") == {"x": 1}  # memory tier
+        assert hop.call_count == 1
+
+        reopened = PersistentCache("t", path=path, ttl=60)
+        assert await reopened.aget("a") == {"x": 1}  # disk tier
+        assert await reopened.aget("missing") is None
+        assert hop.call_count == 3
+    assert cache.stats()["memory_hits"] == 1
+    assert reopened.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_query_perplexity_serves_repeats_from_cache() -> None:
+    """A normalised repeat of a prompt skips the network call."""
+    from app.agent.tools import perplexity
+
+    raw = {"choices": [{"message": {"content": "Answer"}}], "citations": []}
+
+    with patch(
+        "app.agent.tools.perplexity._query", AsyncMock(return_value=raw)
+    ) as mock_query:
+        first = await perplexity.query_perplexity("Best CRM for startups?")
+        second = await perplexity.query_perplexity("  best crm   FOR startups? ")
+
+    assert first == raw
+    assert second == {**raw, "served_from": "cache"}
+    assert mock_query.await_count == 1
+    assert perplexity.cache_stats()["hits"] == 1
+
+
+# ── retry / hedging / failure tests ──────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_query_retries_retryable_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Timeouts are retried with backoff; other errors are raised at once."""
+    from app.agent.tools import perplexity
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "PERPLEXITY_RETRY_BASE_DELAY", 0.001)
+    raw = {"choices": [], "citations": []}
+
+    flaky = AsyncMock(side_effect=[TimeoutError(), TimeoutError(), raw])
+    with patch("app.agent.tools.perplexity._query", flaky):
+        assert await perplexity._query_with_retry("p") == raw
+    assert flaky.await_count == 3
+
+    broken = AsyncMock(side_effect=ValueError("bad request"))
+    with patch("app.agent.tools.perplexity._query", broken):
+        with pytest.raises(ValueError):
+            await perplexity._query_with_retry("p")
+    assert broken.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_query_hedges_slow_calls(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A call slower than the p95 latency is raced against a duplicate."""
+    import asyncio
+
+    from app.agent.concurrency import LatencyTracker
+    from app.agent.tools import perplexity
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "PERPLEXITY_HEDGE_ENABLED", True)
+    tracker = LatencyTracker(min_samples=1)
+    tracker.record(0.01)
+    monkeypatch.setattr(perplexity, "latency_tracker", tracker)
+
+    calls = 0
+
+    async def fake_query(prompt: str) -> dict:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.sleep(5)  # straggler
+            return {"who": "primary"}
+        return {"who": "hedge"}
+
+    with patch("app.agent.tools.perplexity._query", fake_query):
+        result = await asyncio.wait_for(perplexity._query_hedged("p"), timeout=1)
+
+    assert result == {"who": "hedge"}
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_prompts_are_not_counted_as_misses() -> None:
+    """Failed queries are flagged and excluded from the exposure rate."""
+    from app.agent.nodes.perplexity_runner import perplexity_runner
+    from app.agent.nodes.report_generator import report_generator
+
+    ok = {"choices": [{"message": {"content": "Example is great."}}], "citations": []}
+    with patch(
+        "app.agent.nodes.perplexity_runner.query_perplexity",
+        side_effect=[ok, RuntimeError("boom")],
+    ):
+        result = await perplexity_runner(
+            _base_state(generated_prompts=["First?", "Second?"])
+        )
+
+    results = result["perplexity_results"]
+    assert [r.failed for r in results] == [False, True]
+    assert results[1].error == "boom"
+
+    with patch("app.agent.nodes.report_generator.get_llm") as mock_get_llm:
+        mock_get_llm.return_value.ainvoke = AsyncMock(
+            return_value=MagicMock(content="S")
+        )
+        state = _base_state(perplexity_results=results)
+        report = (await report_generator(state))["report"]
+
+    assert report["exposure_rate"] == 100.0
+    assert report["brand_not_mentioned_count"] == 0
+    assert report["failed_prompts_count"] == 1
+    assert report["failed_examples"][0]["error"] == "boom"
+
+
+@pytest.mark.asyncio
+async def test_perplexity_runner_errors_when_every_query_fails() -> None:
+    """An outage is reported as an error rather than 0% exposure."""
+    from app.agent.nodes.perplexity_runner import perplexity_runner
+
+    with patch(
+        "app.agent.nodes.perplexity_runner.query_perplexity",
+        side_effect=RuntimeError("down"),
+    ):
+        result = await perplexity_runner(_base_state(generated_prompts=["Only?"]))
+
+    assert "All 1 Perplexity queries failed" in result["error"]
+
+
+# ── compact result tests ─────────────────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_perplexity_result_is_compact(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Results carry usage counters and a side-store reference, not the payload."""
+    import dataclasses
+
+    from app.agent import raw_store
+    from app.agent.matcher import BrandMatcher
+    from app.agent.nodes.perplexity_runner import _run_single_prompt
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "PERPLEXITY_KEEP_RAW", True)
+    raw = {
+        "choices": [{"message": {"content": "Example wins."}}],
+        "citations": ["https://example.com"],
+        "usage": {
+            "input_tokens": 12,
+            "output_tokens": 34,
+            "cost": {"total_cost": 0.01},
+        },
+    }
+
+    with patch(
+        "app.agent.nodes.perplexity_runner.query_perplexity", return_value=raw
+    ):
+        matcher = BrandMatcher.for_brand("Example")
+        result = await _run_single_prompt("Who wins?", matcher)
+
+    assert not hasattr(result, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        result.completion = "changed"  # type: ignore[misc]
+    assert (result.input_tokens, result.output_tokens, result.cost_usd) == (12, 34, 0.01)
+    assert result.citations == ("https://example.com",)
+    assert raw_store.get_raw(result.raw_ref) == raw
+
+
+# ── single-flight tests ──────────────────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_identical_in_flight_queries_are_coalesced(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Concurrent callers share one call but detect their own brand."""
+    import asyncio
+
+    from app.agent.matcher import BrandMatcher
+    from app.agent.nodes.perplexity_runner import _run_single_prompt
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "PERPLEXITY_CACHE_ENABLED", False)
+    calls = 0
+
+    async def slow_query(prompt: str) -> dict:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {
+            "choices": [{"message": {"content": "Rival leads the market."}}],
+            "usage": {"input_tokens": 5, "cost": {"total_cost": 0.01}},
+        }
+
+    with patch("app.agent.tools.perplexity._query_with_retry", slow_query):
+        ours, theirs = await asyncio.gather(
+            _run_single_prompt("Best CRM?", BrandMatcher.for_brand("Example")),
+            _run_single_prompt("  best CRM? ", BrandMatcher.for_brand("Rival")),
+        )
+
+    assert calls == 1
+    assert ours.brand_mentioned is False
+    assert theirs.brand_mentioned is True
+    # Only the caller that started the call is billed for it
+    assert (ours.cost_usd, ours.input_tokens, ours.served_from) == (0.01, 5, None)
+    assert (theirs.cost_usd, theirs.input_tokens) == (0.0, 0)
+    assert theirs.served_from == "coalesced"
+
+
+# ── brand context cache tests ────────────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_brand_context_is_cached_and_force_refreshable() -> None:
+    """A repeat audit reuses the context; force_refresh re-researches."""
+    from app.agent.nodes.brand_researcher import brand_researcher
+
+    context = _base_state()["brand_context"]
+    with patch(
+        "app.agent.nodes.brand_researcher._research_brand", return_value=context
+    ) as mock_research:
+        first = await brand_researcher(_base_state())
+        second = await brand_researcher(_base_state())
+        assert mock_research.await_count == 1
+
+        await brand_researcher(_base_state(force_refresh=True))
+        assert mock_research.await_count == 2
+
+    assert first["brand_context"] == second["brand_context"] == context
+
+
+@pytest.mark.asyncio
+async def test_stale_brand_context_is_served_while_refreshing(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A stale entry is returned at once and refreshed in the background."""
+    import asyncio
+
+    from app.agent.nodes import brand_researcher as node
+    from app.config import settings
+
+    old = dict(_base_state()["brand_context"], description="Old")
+    new = dict(old, description="New")
+    node._get_brand_cache().set(node._brand_cache_key("example.com"), old)
+    monkeypatch.setattr(settings, "BRAND_CACHE_TTL", -1)  # everything is stale
+
+    with patch(
+        "app.agent.nodes.brand_researcher._research_brand", return_value=new
+    ) as mock_research:
+        result = await node.brand_researcher(_base_state())
+        assert result["brand_context"]["description"] == "Old"
+        await asyncio.gather(*node._refreshing.values())
+
+    assert mock_research.await_count == 1
+    assert node._get_brand_cache().get(node._brand_cache_key("example.com")) == new
+
+
+# ── homepage extraction tests ────────────────────────────────────────────────
+
+FIXTURES = Path(__file__).parent / "fixtures" / "homepage"
+
+
+def test_extract_visible_text_skips_hidden_content() -> None:
+    """Script, style and noscript content never reaches the LLM."""
+    from app.agent.tools.homepage import extract_visible_text
+
+    text = extract_visible_text((FIXTURES / "landing.html").read_bytes(), 6000)
+
+    assert text.startswith("Acme – The issue tracker your team will love")
+    assert "Plan and build products with Acme" in text
+    assert "dataLayer" not in text
+    assert "margin:" not in text
+    assert "Enable JavaScript" not in text
+
+
+def test_extract_visible_text_stops_at_max_chars() -> None:
+    """Extraction returns at most max_chars, even from a truncated body."""
+    from app.agent.tools.homepage import extract_visible_text
+
+    data = (FIXTURES / "heavy.html").read_bytes()[:50_000]
+    text = extract_visible_text(data, 500)
+
+    assert 0 < len(text) <= 500
+    assert "pageProps" not in text
+
+
+def test_extract_visible_text_decodes_pages_without_meta_charset() -> None:
+    """The header charset, or else valid UTF-8, decides how the bytes are read."""
+    from app.agent.tools.homepage import extract_visible_text
+
+    data = (FIXTURES / "utf8_no_meta.html").read_bytes()
+    latin = '<meta charset="iso-8859-1"><p>Café</p>'.encode("latin-1")
+
+    expected = "Café Naïf – Brûlerie Café Naïf – torréfacteur à Paris"
+    assert extract_visible_text(data, 200, "utf-8").startswith(expected)
+    assert extract_visible_text(data, 200).startswith(expected)
+    assert extract_visible_text(data.decode().encode("cp1252"), 200, "cp1252") == (
+        extract_visible_text(data, 200)
+    )
+    # Not UTF-8 and no header charset: the page's own declaration is used
+    assert extract_visible_text(latin, 200) == "Café"
+
+
+@pytest.mark.asyncio
+async def test_fetch_capped_stops_reading_at_byte_cap() -> None:
+    """The body is streamed and reading stops once the cap is reached."""
+    import httpx
+
+    from app.agent.tools.homepage import _fetch_capped
+
+    served = 0
+
+    async def body():
+        nonlocal served
+        for _ in range(100):
+            served += 1
+            yield b"x" * 1024
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+    async with httpx.AsyncClient(transport=transport) as client:
+        _, data = await _fetch_capped(client, "https://example.com", 4096)
+
+    assert len(data) == 4096
+    assert served < 100
+
+
+# ── shared HTTP client tests ─────────────────────────────────────────────────
+
+
+@pytest.mark.asyncio
+async def test_http_client_is_shared() -> None:
+    """Every fetch on a loop reuses the one pooled client."""
+    from app.agent.tools import http_client
+
+    first = await http_client.get_http_client()
+    try:
+        assert await http_client.get_http_client() is first
+    finally:
+        await http_client.close_http_client()
+    assert first.is_closed
+
+
+def test_http_client_from_old_loop_is_closed() -> None:
+    """Opening the client on a new loop closes the previous loop's client."""
+    import asyncio
+
+    from app.agent.tools import http_client
+
+    async def replace():
+        fresh = await http_client.get_http_client()
+        await asyncio.sleep(0)  # let the scheduled close run
+        return fresh
+
+    first = asyncio.run(http_client.get_http_client())
+    second = asyncio.run(replace())
+    assert second is not first
+    assert first.is_closed
+    asyncio.run(http_client.close_http_client())
+    assert second.is_closed
+
+
+@pytest.mark.asyncio
+async def test_homepage_revalidates_with_conditional_get(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A second fetch sends the cached ETag and reuses the text on a 304."""
+    import httpx
+
+    from app.agent.tools import homepage
+
+    seen: list[str | None] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(
+            200,
+            headers={"ETag": '"v1"'},
+            content=b"<html><body><p>Welcome to TestBrand</p></body></html>",
+        )
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def _client() -> httpx.AsyncClient:
+        return client
+
+    monkeypatch.setattr(homepage, "get_http_client", _client)
+    async with client:
+        first = await homepage.fetch_homepage_text("example.com")
+        second = await homepage.fetch_homepage_text("example.com")
+
+    assert first == second == "Welcome to TestBrand"
+    assert seen == [None, '"v1"']
+
+
+@pytest.mark.asyncio
+async def test_homepage_text_honours_the_header_charset(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A page declaring its charset only in Content-Type is decoded with it."""
+    import httpx
+
+    from app.agent.tools import homepage
+
+    data = (FIXTURES / "utf8_no_meta.html").read_text(encoding="utf-8")
+    client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(
+            200,
+            headers={"Content-Type": "text/html; charset=windows-1252"},
+            content=data.encode("cp1252"),
+        )
+    ))
+
+    async def _client() -> httpx.AsyncClient:
+        return client
+
+    monkeypatch.setattr(homepage, "get_http_client", _client)
+    async with client:
+        text = await homepage.fetch_homepage_text("example.com")
+
+    assert text.startswith("Café Naïf – Brûlerie")
+
+
+# ── LLM factory tests ────────────────────────────────────────────────────────
+
+
+@pytest.mark.asyncio
+async def test_llm_factory_caches_per_node_and_routes_models(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Nodes get their own model but share one cached instance and HTTP pool."""
+    from app.agent import llm
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "LLM_MODEL", "gpt-4o")
+    monkeypatch.setattr(settings, "BRAND_LLM_MODEL", "")
+    monkeypatch.setattr(settings, "SUMMARY_LLM_MODEL", "gpt-4o-mini")
+    try:
+        extraction = llm.get_llm("brand_researcher")
+        summary = llm.get_llm("report_generator")
+
+        assert llm.get_llm("brand_researcher") is extraction
+        assert extraction.model_name == "gpt-4o"
+        assert summary.model_name == "gpt-4o-mini"
+        assert extraction.http_async_client is summary.http_async_client
+    finally:
+        await llm.close_llm_clients()
+
+
+def test_llm_client_from_old_loop_is_closed() -> None:
+    """Rebuilding the LLM instances for a new loop closes the old HTTP client."""
+    import asyncio
+
+    from app.agent import llm
+
+    async def client():
+        return llm.get_llm("brand_researcher").http_async_client
+
+    async def replace():
+        fresh = await client()
+        await asyncio.sleep(0)  # let the scheduled close run
+        return fresh
+
+    first = asyncio.run(client())
+    second = asyncio.run(replace())
+    assert second is not first
+    assert first.is_closed
+    asyncio.run(llm.close_llm_clients())
+    assert second.is_closed
+
+
+def test_llm_stats_callback_records_tokens_and_latency() -> None:
+    from uuid import uuid4
+
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, LLMResult
+
+    from app.agent.llm import NodeStats, _StatsCallback
+
+    stats = NodeStats("report_generator")
+    callback = _StatsCallback(stats)
+    run_id = uuid4()
+    message = AIMessage(
+        content="S",
+        usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150},
+    )
+    callback.on_chat_model_start({}, [], run_id=run_id)
+    callback.on_llm_end(
+        LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id
+    )
+
+    snapshot = stats.snapshot()
+    assert snapshot["calls"] == 1
+    assert (snapshot["input_tokens"], snapshot["output_tokens"]) == (120, 30)
+    assert snapshot["latency_p50_s"] is not None
+
+
+# ── LLM response cache tests ─────────────────────────────────────────────────
+
+
+@pytest.mark.asyncio
+async def test_llm_cache_returns_identical_output_for_identical_calls() -> None:
+    """A repeated deterministic call is answered from the cache, usage zeroed."""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    from app.agent.llm_cache import llm_cache
+
+    model = FakeListChatModel(responses=["first answer", "second answer"], cache=llm_cache)
+    messages = [{"role": "user", "content": "Summarise the report."}]
+
+    first = await model.ainvoke(messages)
+    second = await model.ainvoke(messages)
+    other = await model.ainvoke([{"role": "user", "content": "Something else"}])
+
+    assert first.content == second.content == "first answer"
+    assert second.response_metadata["cache_hit"] is True
+    assert second.usage_metadata["output_tokens"] == 0
+    assert other.content == "second answer"
+
+
+@pytest.mark.asyncio
+async def test_llm_cache_only_attaches_to_deterministic_nodes(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from app.agent import llm
+    from app.agent.llm_cache import llm_cache
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    try:
+        assert llm.get_llm("brand_researcher").cache is llm_cache
+        assert llm.get_llm("report_generator").cache is llm_cache
+        assert llm.get_llm("prompt_generator").cache is None
+    finally:
+        await llm.close_llm_clients()
+
+
+# ── deferred summary tests ───────────────────────────────────────────────────
+
+def _scored_results() -> list:
+    return [
+        _result(
+            "Best tool?", "Example is best.",
+            brand_mentioned=True, brand_mention_context="Example is best.",
+        ),
+        _result("Cheapest tool?", "Rival is cheap."),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_deferred_summary_returns_metrics_first(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """The report comes back pending; the summary is fetched by report_id."""
+    import asyncio
+
+    from app.agent import summaries
+    from app.agent.nodes.report_generator import report_generator
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "SUMMARY_MODE", "deferred")
+    release = asyncio.Event()
+
+    async def slow_summary(facts: dict) -> str:
+        await release.wait()
+        return "Written later."
+
+    with patch("app.agent.nodes.report_generator.generate_summary", slow_summary):
+        report = (await report_generator(
+            _base_state(perplexity_results=_scored_results())
+        ))["report"]
+
+        assert report["exposure_rate"] == 50.0
+        assert report["summary_status"] == "pending"
+        assert summaries.get(report["report_id"])["status"] == "pending"
+
+        release.set()
+        record = await summaries.wait(report["report_id"], timeout=1)
+
+    assert record == {"status": "ready", "summary": "Written later.", "error": None}
+
+
+@pytest.mark.asyncio
+async def test_drain_cancels_slow_summaries_with_template_fallback() -> None:
+    """Shutdown cancels a summary that outlives the drain timeout and stores
+    the template summary as failed instead of leaving it pending."""
+    import asyncio
+
+    from app.agent import summaries
+
+    async def never() -> str:
+        await asyncio.Event().wait()
+        return ""
+
+    async def quick() -> str:
+        return "Done."
+
+    await summaries.schedule("slow", never, fallback="Template.")
+    await summaries.schedule("fast", quick, fallback="Template.")
+    await summaries.drain(timeout=0.05)
+
+    assert summaries.get("fast")["status"] == "ready"
+    assert summaries.get("slow") == {
+        "status": "failed",
+        "summary": "Template.",
+        "error": "cancelled",
+    }
+    assert not summaries._tasks
+
+
+def test_summary_written_by_another_worker_is_seen(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A worker that read a pending summary still sees it become ready."""
+    from app.agent import summaries
+
+    writer = summaries._get_store()
+    monkeypatch.setattr(summaries, "_store", None)
+    reader = summaries._get_store()  # a second worker on the same cache file
+    assert reader is not writer
+
+    writer.set("r1", summaries._record(summaries.PENDING))
+    assert summaries.get("r1")["status"] == "pending"
+    writer.set("r1", summaries._record(summaries.READY, "Written elsewhere."))
+
+    assert summaries.get("r1") == {
+        "status": "ready", "summary": "Written elsewhere.", "error": None
+    }
+
+
+@pytest.mark.asyncio
+async def test_template_summary_skips_the_llm(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app.agent.nodes.report_generator import report_generator
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "SUMMARY_MODE", "template")
+    with patch("app.agent.nodes.report_generator.get_llm") as mock_get_llm:
+        report = (await report_generator(
+            _base_state(perplexity_results=_scored_results())
+        ))["report"]
+
+    mock_get_llm.assert_not_called()
+    assert report["summary_status"] == "ready"
+    assert report["summary"].startswith("Example appeared in 1 of 2")
+    assert "Cheapest tool?" in report["summary"]
+
+
+# ── share of voice tests ─────────────────────────────────────────────────────
+
+def test_share_of_voice_counts_ranks_and_co_mentions() -> None:
+    from app.agent.nodes.report_generator import share_of_voice
+
+    rows, co = share_of_voice(
+        [
+            _result(entity_mentions=(("Rival", 2), ("Example", 1))),
+            _result(entity_mentions=(("Example", 1),)),
+            _result(),
+            _result(entity_mentions=(("Rival", 5),), failed=True),
+        ],
+        ("Example", "Rival", "Other"),
+        "Example",
+    )
+
+    by_entity = {row["entity"]: row for row in rows}
+    assert by_entity["Example"] == {
+        "entity": "Example", "is_brand": True, "mentions": 2,
+        "prompts_mentioned": 2, "share_of_voice": 50.0, "first_mentions": 1,
+        "avg_first_mention_rank": 1.5,
+    }
+    assert by_entity["Rival"]["first_mentions"] == 1
+    assert by_entity["Other"]["avg_first_mention_rank"] is None
+    assert co["Example"] == {"Example": 2, "Rival": 1, "Other": 0}
+    assert co["Rival"]["Example"] == 1
+
+
+@pytest.mark.asyncio
+async def test_report_includes_share_of_voice(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app.agent.nodes.perplexity_runner import _run_single_prompt, brand_matcher
+    from app.agent.nodes.report_generator import report_generator
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "SUMMARY_MODE", "template")
+    state = _base_state()
+    answers = {
+        "Best tool?": "Rival is popular. Example is faster than Rival.",
+        "Cheapest tool?": "Rival is cheapest.",
+    }
+
+    async def fake_query(prompt):
+        return {"choices": [{"message": {"content": answers[prompt]}}]}
+
+    with patch("app.agent.nodes.perplexity_runner.query_perplexity", fake_query):
+        results = [
+            await _run_single_prompt(p, brand_matcher(state)) for p in answers
+        ]
+    report = (await report_generator(_base_state(perplexity_results=results)))["report"]
+
+    assert results[0].entity_mentions == (("Rival", 2), ("Example", 1))
+    assert results[0].brand_mention_context == "Example is faster than Rival."
+    assert [r["entity"] for r in report["share_of_voice"]] == ["Example", "Rival"]
+    assert report["share_of_voice"][1]["prompts_mentioned"] == 2
+    assert report["co_mentions"]["Example"]["Rival"] == 1
+    assert "most visible competitor was Rival" in report["summary"]
+
+
+@pytest.mark.asyncio
+async def test_comparison_scores_every_brand_on_the_same_answers(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from app.agent import run_store
+    from app.agent.nodes.perplexity_runner import _run_single_prompt, brand_matcher
+    from app.agent.nodes.report_generator import report_generator
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "SUMMARY_MODE", "template")
+    comparison = [
+        {"domain": "example.com", "brand_name": "Example",
+         "brand_context": _base_state()["brand_context"]},
+        {"domain": "rival.com", "brand_name": "Rival",
+         "brand_context": {"brand_name": "Rival", "aliases": ["RivalHQ"]}},
+    ]
+    state = _base_state(comparison=comparison)
+    answers = {
+        "Best tool?": "RivalHQ is popular. Example is faster.",
+        "Cheapest tool?": "Try rival.com first.",
+    }
+    calls: list[str] = []
+
+    async def fake_query(prompt):
+        calls.append(prompt)
+        return {"choices": [{"message": {"content": answers[prompt]}}]}
+
+    with patch("app.agent.nodes.perplexity_runner.query_perplexity", fake_query):
+        results = [
+            await _run_single_prompt(p, brand_matcher(state)) for p in answers
+        ]
+    update = await report_generator(_base_state(
+        comparison=comparison, perplexity_results=results
+    ))
+
+    assert len(calls) == 2
+    assert update["report"]["brand_mentioned_count"] == 1
+    assert [r["entity"] for r in update["report"]["share_of_voice"]] == [
+        "Example", "Rival"
+    ]
+    (rival,) = update["comparison_reports"]
+    assert rival["brand_name"] == "Rival"
+    assert rival["brand_mentioned_count"] == 2
+    assert rival["appeared_examples"][1]["mention_context"] == "Try rival.com first."
+    assert rival["share_of_voice"][0] == {
+        **rival["share_of_voice"][0], "entity": "Rival", "is_brand": True,
+        "mentions": 2,
+    }
+    # The shared Perplexity spend is reported once, on the brand's report
+    assert rival["usage"] == {}
+    # Stored as a comparison run, the rival report stays out of rival.com's trend
+    assert run_store.get_store().trend("rival.com", "run") == []
+    assert len(run_store.get_store().trend("example.com", "run")) == 1
+
+
+# ── answer corpus tests ──────────────────────────────────────────────────────
+
+def test_answer_corpus_scores_brands_without_perplexity(tmp_path) -> None:
+    from app.agent.corpus import AnswerCorpus
+
+    store = AnswerCorpus(str(tmp_path / "corpus.db"))
+    results = [
+        _result("Best CRM?", "HubSpot CRM leads. Pipedrive is cheaper."),
+        _result("CRM for startups?", "Try hub-spot or Close."),
+        _result("Inbox tools?", "Check your inbox and Box."),
+        _result("Timeout?", failed=True),
+    ]
+    assert store.add("B2B SaaS", "hubspot.com", results) == 3
+    assert store.add("b2b  saas", "pipedrive.com", results[:1]) == 0  # deduped
+    store.add("E-commerce", "shop.com", [_result("Shops?", "HubSpot is not a shop.")])
+
+    hubspot = store.score("B2B SaaS", "HubSpot", domain="hubspot.com")
+    box = store.score("b2b saas", "Box")
+
+    assert store.categories() == [
+        {"category": "b2b saas", "answers": 3},
+        {"category": "e-commerce", "answers": 1},
+    ]
+    assert (hubspot["answers"], hubspot["mentioned"]) == (3, 2)
+    assert hubspot["exposure_rate"] == 66.7
+    assert hubspot["examples"][0]["evaluated_domain"] == "hubspot.com"
+    # The index does not return "inbox" for "box"; the matcher confirms "Box"
+    assert (box["candidates"], box["mentioned"]) == (1, 1)
+    assert store.score("B2B SaaS", "Salesforce")["mentioned"] == 0
+
+
+def test_answer_corpus_record_never_raises(
+    monkeypatch: pytest.MonkeyPatch, tmp_path
+) -> None:
+    from app.agent import corpus
+    from app.config import settings
+
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    monkeypatch.setattr(settings, "CORPUS_DB_PATH", str(blocker / "corpus.db"))
+
+    # os.makedirs fails with an OSError before SQLite is even opened
+    assert corpus.record("B2B SaaS", "hubspot.com", [_result("Best CRM?", "HubSpot.")]) == 0
+
+
+# ── citation analytics tests ─────────────────────────────────────────────────
+
+def test_registrable_domain_uses_the_public_suffix_list() -> None:
+    from app.agent.citations import registrable_domain, source_domains
+
+    assert registrable_domain("https://www.bbc.co.uk/news?x=1") == "bbc.co.uk"
+    assert registrable_domain("https://docs.aws.amazon.com:443/s3") == "amazon.com"
+    assert registrable_domain("example.com") == "example.com"
+    assert registrable_domain("http://10.0.0.1/page") == "10.0.0.1"
+    assert registrable_domain("not a url") == ""
+    assert source_domains(
+        ["https://a.example.com/1", "https://b.example.com/2", "https://g2.com/x"]
+    ) == ["example.com", "g2.com"]
+
+
+@pytest.mark.asyncio
+async def test_report_aggregates_citation_domains(
+    monkeypatch: pytest.MonkeyPatch, tmp_path
+) -> None:
+    from app.agent import corpus
+    from app.agent.nodes.report_generator import report_generator
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "SUMMARY_MODE", "template")
+
+    results = [
+        _result(
+            "Best tool?", "An answer.", brand_mentioned=True,
+            citations=("https://www.example.com/a", "https://g2.com/1",
+                       "https://g2.com/2"),
+        ),
+        _result("Cheapest tool?", "An answer.", citations=("https://blog.g2.com/x",)),
+        _result(
+            "Broken?", "An answer.", citations=("https://g2.com/3",), failed=True
+        ),
+    ]
+    report = (await report_generator(_base_state(perplexity_results=results)))["report"]
+
+    assert report["citation_domains"] == [
+        {"domain": "g2.com", "citations": 3, "prompts": 2, "is_own": False},
+        {"domain": "example.com", "citations": 1, "prompts": 1, "is_own": True},
+    ]
+    assert report["own_domain_cited_count"] == 1
+    assert report["appeared_examples"][0]["source_domains"] == ["example.com", "g2.com"]
+    assert report["appeared_examples"][0]["own_domain_cited"] is True
+    assert report["not_appeared_examples"][0]["own_domain_cited"] is False
+
+    # The same domains are stored with the answers and aggregated in SQL
+    history = corpus.get_corpus().cited_domains("B2B SaaS", "example.com")
+    assert history["answers"] == 2
+    assert history["domains"][0] == report["citation_domains"][0]
+    assert history["own_domain_cited_count"] == 1
+
+
+# ── run store tests ──────────────────────────────────────────────────────────
+
+def test_run_store_trend_and_prompt_stability_in_sql(tmp_path) -> None:
+    from app.agent.run_store import RunStore
+
+    store = RunStore(str(tmp_path / "runs.db"))
+    day = 86400.0
+
+    runs = [
+        ("r1", 0 * day, {"Best CRM?": True, "Cheap CRM?": False}, ()),
+        ("r2", 0 * day + 60, {"best  crm?": False, "Cheap CRM?": False, "New?": True},
+         ()),
+        ("r3", 1 * day, {"Best CRM?": True, "Cheap CRM?": False, "New?": True},
+         ("New?",)),
+        ("r3", 1 * day, {"Best CRM?": True, "Cheap CRM?": False}, ()),  # idempotent
+    ]
+    for run_id, when, outcomes, failed in runs:
+        results = [
+            _result(prompt, brand_mentioned=hit, failed=prompt in failed)
+            for prompt, hit in outcomes.items()
+        ]
+        evaluated = [r for r in results if not r.failed]
+        mentioned = sum(r.brand_mentioned for r in evaluated)
+        store.add(
+            {
+                "report_id": run_id, "domain": "example.com", "brand_name": "Example",
+                "total_prompts": len(results), "brand_mentioned_count": mentioned,
+                "failed_prompts_count": len(results) - len(evaluated),
+                "exposure_rate": round(mentioned / len(evaluated) * 100, 1),
+                "usage": {"input_tokens": 10, "output_tokens": 5, "cost_usd": 0.5},
+            },
+            results,
+            created_at=when,
+        )
+    # A competitor report of a /compare run is left out of trends and stability
+    store.add(
+        {
+            "report_id": "r4", "domain": "example.com", "brand_name": "Example",
+            "total_prompts": 2, "brand_mentioned_count": 2, "exposure_rate": 100.0,
+        },
+        [_result("Best CRM?", brand_mentioned=True), _result("Cheap CRM?")],
+        created_at=0 * day + 120,
+        comparison=True,
+    )
+
+    daily = store.trend("example.com", "day")
+    per_run = store.trend("example.com", "run", since=30)
+    prompts = store.prompt_stability("example.com")
+
+    assert [(p["period"], p["runs"], p["evaluated"], p["mentioned"]) for p in daily] == [
+        ("1970-01-01", 2, 5, 2),
+        ("1970-01-02", 1, 2, 1),
+    ]
+    assert daily[0]["exposure_rate"] == 40.0
+    assert daily[0]["avg_run_exposure_rate"] == 41.7
+    assert daily[0]["cost_usd"] == 1.0
+    assert [p["period"] for p in per_run] == ["r2", "r3"]
+    assert [(p["prompt"], p["runs"], p["flips"], p["stability"]) for p in prompts] == [
+        ("Best CRM?", 3, 2, 0.0),
+        ("Cheap CRM?", 3, 0, 1.0),
+    ]
+    assert prompts[0]["mention_rate"] == 66.7
+
+
+@pytest.mark.asyncio
+async def test_repeat_runs_reuse_the_stored_prompt_set(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A domain's latest prompts are asked again unless force_refresh is set."""
+    from app.agent import graph, run_store
+
+    runs = [
+        ("r1", 1.0, 3, False),
+        ("r2", 2.0, 2, False),
+        ("r3", 3.0, 3, True),  # a competitor report: never reused
+    ]
+    for run_id, when, total, comparison in runs:
+        run_store.get_store().add(
+            {
+                "report_id": run_id, "domain": "example.com", "brand_name": "Example",
+                "total_prompts": total, "brand_mentioned_count": 0,
+                "exposure_rate": 0.0,
+            },
+            [_result(f"{run_id} prompt {i}?") for i in range(total)],
+            created_at=when,
+            comparison=comparison,
+        )
+
+    invoke = AsyncMock(side_effect=lambda state: state)
+    monkeypatch.setattr(graph.compiled_graph, "ainvoke", invoke)
+    reused = await graph.run_graph("example.com", prompts_count=2)
+    older = await graph.run_graph("example.com", prompts_count=3)
+    fresh = await graph.run_graph("example.com", prompts_count=2, force_refresh=True)
+
+    assert reused["generated_prompts"] == ["r2 prompt 0?", "r2 prompt 1?"]
+    assert older["generated_prompts"] == [f"r1 prompt {i}?" for i in range(3)]
+    assert fresh["generated_prompts"] == []
+    assert run_store.stored_prompts("other.com", 2) == []
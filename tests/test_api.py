@@ -11,11 +11,21 @@ from fastapi.testclient import TestClient
 # We need to mock settings before importing the app so it doesn't fail
 # when .env is missing in the test environment.
 @pytest.fixture(autouse=True)
-def _mock_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+def _mock_settings(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
     monkeypatch.setenv("OPENAI_API_KEY", "test-key")
     monkeypatch.setenv("FIRECRAWL_API_KEY", "test-key")
     monkeypatch.setenv("PERPLEXITY_API_KEY", "test-key")
 
+    from app.agent import corpus, run_store, summaries
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "CACHE_DB_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(settings, "CORPUS_DB_PATH", str(tmp_path / "corpus.db"))
+    monkeypatch.setattr(summaries, "_store", None)
+    monkeypatch.setattr(corpus, "_corpus", None)
+    monkeypatch.setattr(settings, "RUN_STORE_DB_PATH", str(tmp_path / "runs.db"))
+    monkeypatch.setattr(run_store, "_store", None)
+
 
 @pytest.fixture()
 def client() -> TestClient:
@@ -94,3 +104,145 @@ def test_evaluate_graph_error(client: TestClient) -> None:
 
     assert resp.status_code == 500
     assert "Something broke" in resp.json()["detail"]
+
+
+def test_stats(client: TestClient) -> None:
+    """GET /stats exposes the Perplexity concurrency limit and queue depth."""
+    resp = client.get("/api/v1/stats")
+    assert resp.status_code == 200
+    data = resp.json()["perplexity_concurrency"]
+    assert data["limit"] >= 1
+    assert data["queue_depth"] == 0
+    nodes = {entry["node"] for entry in resp.json()["llm"]}
+    assert nodes == {"brand_researcher", "prompt_generator", "report_generator"}
+
+
+def test_evaluate_forwards_force_refresh(client: TestClient) -> None:
+    """force_refresh in the body is passed through to the graph."""
+    mock_run = AsyncMock(return_value={"report": {}, "error": "stop"})
+
+    with patch("app.api.routes.run_graph", mock_run):
+        client.post(
+            "/api/v1/evaluate", json={"domain": "example.com", "force_refresh": True}
+        )
+
+    assert mock_run.await_args.kwargs["force_refresh"] is True
+
+
+def test_report_summary(client: TestClient) -> None:
+    """A deferred summary is served by report_id; unknown ids are 404."""
+    from app.agent import summaries
+
+    summaries._get_store().set(
+        "abc123", {"status": "ready", "summary": "Done.", "error": None}
+    )
+
+    resp = client.get("/api/v1/reports/abc123/summary")
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "report_id": "abc123", "status": "ready", "summary": "Done.", "error": None
+    }
+    assert client.get("/api/v1/reports/missing/summary").status_code == 404
+
+
+def test_compare_validates_and_returns_one_report_per_brand(client: TestClient) -> None:
+    """POST /compare runs one comparative workflow and lists every brand."""
+    def report(domain: str, name: str) -> dict:
+        return {
+            "domain": domain, "brand_name": name, "exposure_rate": 50.0,
+            "total_prompts": 2, "brand_mentioned_count": 1,
+            "brand_not_mentioned_count": 1, "appeared_examples": [],
+            "not_appeared_examples": [], "summary": "",
+            "usage": {"input_tokens": 10, "output_tokens": 20, "cost_usd": 0.01},
+            "generated_at": "2026-02-25T10:00:00+00:00",
+        }
+
+    from app.agent.state import PerplexityResult
+
+    results = [
+        PerplexityResult(prompt=p, completion="", citations=(),
+                         brand_mentioned=False, brand_mention_context="")
+        for p in ("Best CRM?", "Cheapest CRM?")
+    ]
+    mock_run = AsyncMock(return_value={
+        "report": report("example.com", "Example"),
+        "comparison_reports": [report("rival.com", "Rival")],
+        "comparison_failed": [{"domain": "broken.com", "error": "scrape failed"}],
+        "perplexity_results": results,
+        "error": None,
+    })
+
+    with patch("app.api.routes.run_graph", mock_run):
+        resp = client.post("/api/v1/compare", json={
+            "domain": "example.com",
+            "competitor_domains": ["https://Rival.com/", "rival.com", "example.com"],
+        })
+        missing = client.post(
+            "/api/v1/compare", json={"domain": "example.com", "competitor_domains": []}
+        )
+
+    assert resp.status_code == 200
+    assert mock_run.await_args.kwargs["competitor_domains"] == ["rival.com"]
+    data = resp.json()
+    assert [r["domain"] for r in data["reports"]] == ["example.com", "rival.com"]
+    assert data["prompts"] == ["Best CRM?", "Cheapest CRM?"]
+    assert data["usage"]["input_tokens"] == 10
+    assert data["failed_competitors"] == [
+        {"domain": "broken.com", "error": "scrape failed"}
+    ]
+    assert missing.status_code == 422
+
+
+def test_corpus_score(client: TestClient) -> None:
+    """POST /corpus/score scores stored answers; unknown categories are 404."""
+    from app.agent import corpus
+    from app.agent.state import PerplexityResult
+
+    corpus.record("B2B SaaS", "example.com", [
+        PerplexityResult(prompt="Best CRM?", completion="Example is great.",
+                         citations=(), brand_mentioned=True,
+                         brand_mention_context="")
+    ])
+
+    resp = client.post(
+        "/api/v1/corpus/score", json={"category": "B2B SaaS", "brand_name": "Example"}
+    )
+    unknown = client.post(
+        "/api/v1/corpus/score", json={"category": "Retail", "brand_name": "Example"}
+    )
+
+    assert resp.status_code == 200
+    assert resp.json()["mentioned"] == 1
+    assert resp.json()["examples"][0]["mention_context"] == "Example is great."
+    assert unknown.status_code == 404
+    assert client.get("/api/v1/corpus/categories").json() == [
+        {"category": "b2b saas", "answers": 1}
+    ]
+
+
+def test_run_history_endpoints(client: TestClient) -> None:
+    """Stored runs are served as a trend and per-prompt stability."""
+    from app.agent import run_store
+    from app.agent.state import PerplexityResult
+
+    for run_id, hit in (("a", True), ("b", False)):
+        run_store.record(
+            {
+                "report_id": run_id, "domain": "example.com", "brand_name": "Example",
+                "total_prompts": 1, "brand_mentioned_count": int(hit),
+                "exposure_rate": 100.0 if hit else 0.0,
+            },
+            [PerplexityResult(prompt="Best CRM?", completion="", citations=(),
+                              brand_mentioned=hit, brand_mention_context="")],
+        )
+
+    trend = client.get("/api/v1/runs/Example.com/trend", params={"bucket": "run"})
+    prompts = client.get("/api/v1/runs/example.com/prompts")
+
+    assert trend.status_code == 200
+    assert [p["period"] for p in trend.json()["points"]] == ["a", "b"]
+    assert trend.json()["points"][1]["exposure_rate"] == 0.0
+    assert prompts.json()["prompts"][0]["flips"] == 1
+    assert client.get(
+        "/api/v1/runs/example.com/trend", params={"bucket": "hour"}
+    ).status_code == 422